@@ -0,0 +1,20 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Benchmarks of the transcriber and its submodules on deterministic synthetic signals (see benchmarks.signals).
+    Run 'python -m benchmarks' from the repository root; see 'python -m benchmarks --help' for storing a baseline and
+    comparing against it. """
+
+__all__ = ['signals']
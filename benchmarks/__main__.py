@@ -0,0 +1,381 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Runs the benchmarks: 'python -m benchmarks [--quick] [--save] [--compare]' from the repository root.
+    Results are written to benchmarks/results.json; --save also stores them as the baseline (benchmarks/baseline.json)
+    and --compare flags regressions against the baseline, exiting with status 1 if there are any.
+    Timings are machine dependent, so the baseline should be stored on the machine it's compared on. """
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# Allow running from anywhere, as the modules are imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import clustering as clst
+import mtheory as mt
+import pda.hps
+import tonguing as tong
+from benchmarks import signals
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARKS_DIR)
+RESULTS_FILENAME = os.path.join(BENCHMARKS_DIR, "results.json")
+BASELINE_FILENAME = os.path.join(BENCHMARKS_DIR, "baseline.json")
+
+RATE = 44100
+BLOCKS_PER_SEC = 60.0
+SAMPLES_PER_BLOCK = 1470
+
+# Relative slowdown of timings, and absolute drop of accuracies, considered regressions.
+TIME_TOLERANCE = 0.25
+ACCURACY_TOLERANCE = 0.02
+
+# Metrics are compared by their name: lower is better for times, higher for everything else.
+TIME_SUFFIXES = ("_us", "_ms")
+
+
+def time_calls(function, args, repeat=3):
+    """ Calls 'function' with each tuple of 'args', 'repeat' times, and returns the seconds per call of the fastest
+        repetition. """
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for a in args:
+            function(*a)
+        best = min(best, (time.perf_counter() - start)/len(args))
+
+    return best
+
+
+def pda_blocks(harmonics=3):
+    """ Blocks of harmonic tones of every note the HPS implementations can detect (C4 to B7), some with vibrato, and
+        their pitches. """
+    rng = np.random.RandomState(0)
+    table = mt.tuning()
+    frequencies = table.frequency[table.index("C4"):table.index("B7") + 1]
+    blocks = []
+    for f in frequencies:
+        for vibrato_depth in (0, 30):
+            x = signals.harmonic_tone(f, 2*SAMPLES_PER_BLOCK/RATE, RATE, vibrato_depth=vibrato_depth,
+                                      phase=rng.uniform(0, 2*np.pi))
+            x = x[rng.randint(SAMPLES_PER_BLOCK):][:SAMPLES_PER_BLOCK] + rng.normal(0, 0.002, SAMPLES_PER_BLOCK)
+            blocks.append((x, f))
+
+    return blocks
+
+
+def bench_pda(function, blocks, repeat, **kwargs):
+    """ Time per block and note accuracy of a PDA. """
+    table = mt.tuning()
+    seconds = time_calls(lambda x: function(x, RATE, **kwargs), [(x,) for x, _ in blocks], repeat)
+    correct = [table.nearest(function(x, RATE, **kwargs)) == table.nearest(f) for x, f in blocks]
+    return {"block_us": 1e6*seconds, "pitch_accuracy": float(np.mean(correct))}
+
+
+def bench_tonguing(repeat):
+    """ Time per read and real time factor of the tonguing detector on a tongued passage. """
+    x, _ = signals.passage(signals.melody(24, seed=1), RATE, seed=1)
+    read = int(RATE/BLOCKS_PER_SEC)
+    reads = [(x[i:i + read],) for i in range(0, x.size - read + 1, read)]
+
+    def feed_all():
+        detector = tong.TonguingDetector(fs=RATE)
+        for r, in reads:
+            detector.feed(r)
+
+    seconds = time_calls(feed_all, [()], repeat)
+    return {"read_us": 1e6*seconds/len(reads), "realtime_factor": x.size/RATE/seconds}
+
+
+def bench_clustering(repeat):
+    """ Time to cluster the durations of 64 notes. """
+    rng = np.random.RandomState(2)
+    durations = np.log2(rng.choice((6, 9, 12, 18, 24, 36), 64)*rng.uniform(0.9, 1.1, 64))
+    return {"call_ms": 1e3*time_calls(clst.equidistant_clusterize, [(durations,)], repeat)}
+
+
+def score(notes, reference, onset_tolerance=0.05):
+    """ Accuracy of transcribed notes (as in Transcriber.notes) against a reference ((name, start, end) in seconds):
+            pitch_accuracy: fraction of reference notes whose midpoint is covered by a transcribed note of that pitch;
+            onset_accuracy: fraction of reference notes whose start is within 'onset_tolerance' seconds of the start
+                            of a transcribed note of that pitch;
+            onset_error_ms: mean onset error of those within the tolerance;
+            note_precision: fraction of transcribed notes overlapping a reference note of the same pitch. """
+    detected = [(n["name"], n["start"]/BLOCKS_PER_SEC, n["end"]/BLOCKS_PER_SEC) for n in notes]
+
+    covered = 0
+    onset_errors = []
+    for name, start, end in reference:
+        middle = (start + end)/2
+        covered += any(d_name == name and d_start <= middle < d_end for d_name, d_start, d_end in detected)
+
+        errors = [abs(d_start - start) for d_name, d_start, _ in detected if d_name == name]
+        if errors and min(errors) <= onset_tolerance:
+            onset_errors.append(min(errors))
+
+    overlapping = sum(any(r_name == name and start < r_end and r_start < end for r_name, r_start, r_end in reference)
+                      for name, start, end in detected)
+
+    return {"pitch_accuracy": covered/len(reference),
+            "onset_accuracy": len(onset_errors)/len(reference),
+            "onset_error_ms": 1e3*float(np.mean(onset_errors)) if onset_errors else None,
+            "note_precision": overlapping/len(detected) if detected else 0.0}
+
+
+def passage_source(x):
+    """ Unthrottled synthetic source replaying a passage. """
+    from mic.sources import SyntheticSource
+
+    read = int(RATE/BLOCKS_PER_SEC)
+    padded = np.concatenate((x, np.zeros(read, np.float32)))
+    return SyntheticSource(read, RATE, signal=lambda t: padded[np.round(t*RATE).astype(int)], duration=x.size/RATE,
+                           realtime=False)
+
+
+def bench_transcription(x, reference, repeat, **kwargs):
+    """ Offline transcription of a passage (an unthrottled synthetic source): throughput of the fastest of 'repeat'
+        runs, and accuracy (the same on every run). """
+    import transcriber
+
+    seconds = np.inf
+    for _ in range(repeat):
+        trs = transcriber.Transcriber(BLOCKS_PER_SEC, SAMPLES_PER_BLOCK, source=passage_source(x),
+                                      **dict(transcriber.QUIET, **kwargs))
+        start = time.perf_counter()
+        try:
+            while True:
+                trs.update()
+        except EOFError:
+            pass
+        trs.finish()
+        seconds = min(seconds, time.perf_counter() - start)
+
+    results = {"ticks_per_sec": trs.total_ticks/seconds, "realtime_factor": x.size/RATE/seconds}
+    results.update(score(trs.notes, reference))
+    return results
+
+
+def bench_multistream(x, reference, streams, repeat):
+    """ Offline transcription of a passage on several streams at once by a multistream.MultiStreamTranscriber:
+        throughput (in ticks of any stream per second) of the fastest of 'repeat' runs, the amount of streams it
+        could transcribe in real time, and accuracy (of the first stream, as they all get the same passage). """
+    import multistream
+
+    seconds = np.inf
+    for _ in range(repeat):
+        engine = multistream.MultiStreamTranscriber([passage_source(x) for _ in range(streams)], BLOCKS_PER_SEC,
+                                                    SAMPLES_PER_BLOCK)
+        finished = []
+        start = time.perf_counter()
+        try:
+            while True:
+                finished += engine.update()
+        except EOFError:
+            pass
+        seconds = min(seconds, time.perf_counter() - start)
+
+    ticks = sum(trs.total_ticks for trs in finished)
+    results = {"ticks_per_sec": ticks/seconds, "realtime_streams": ticks/seconds/BLOCKS_PER_SEC}
+    results.update(score(finished[0].notes, reference))
+    return results
+
+
+def bench_workers(x, reference, streams):
+    """ Transcription of a passage on several streams at once by a workers.WorkerPool (one worker per core), written
+        into the stream rings as fast as the workers drain them: throughput (in ticks of any stream per second), the
+        amount of streams the pool could transcribe in real time, and accuracy (of the first stream). """
+    import workers
+
+    read = int(RATE/BLOCKS_PER_SEC)
+    x = np.concatenate((x, np.zeros(read, np.float32)))
+    with workers.WorkerPool(blocks_per_sec=BLOCKS_PER_SEC, samples_per_block=SAMPLES_PER_BLOCK) as pool:
+        rings = [pool.open_stream()[1] for _ in range(streams)]
+
+        start = time.perf_counter()
+        for i in range(0, x.size, read):
+            for ring in rings:
+                while ring.capacity - ring.available < read:
+                    time.sleep(0.001)
+                ring.write(x[i:i + read])
+        for ring in rings:
+            ring.close()
+
+        notes = []
+        ticks = 0
+        for event in pool.events():
+            if event[0] == "note" and event[1] == 0:
+                notes.append(event[2])
+            elif event[0] == "end":
+                ticks += event[2]["total"]
+        seconds = time.perf_counter() - start
+
+    results = {"ticks_per_sec": ticks/seconds, "realtime_streams": ticks/seconds/BLOCKS_PER_SEC}
+    results.update(score(notes, reference))
+    return results
+
+
+# Run in a new interpreter by bench_startup(): imports the transcriber, then transcribes a tick of a synthetic source.
+STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import transcriber
+imported = time.perf_counter()
+from mic.sources import SyntheticSource
+trs = transcriber.Transcriber(%r, %r, source=SyntheticSource(%r, %r, realtime=False), **transcriber.QUIET)
+trs.update()
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def bench_startup(repeat):
+    """ Time to import the transcriber, time to transcribe the first tick (both from the first import, in a new
+        interpreter) and time the whole interpreter process takes (i.e. including the interpreter startup). """
+    script = STARTUP_SCRIPT % (BLOCKS_PER_SEC, SAMPLES_PER_BLOCK, int(RATE/BLOCKS_PER_SEC), RATE)
+
+    best = (np.inf, np.inf, np.inf)
+    for _ in range(repeat):
+        start = time.perf_counter()
+        output = subprocess.check_output([sys.executable, "-c", script], cwd=ROOT_DIR, universal_newlines=True)
+        process = time.perf_counter() - start
+        imported, first_tick = [float(v) for v in output.splitlines()[-1].split()]
+        best = min(best, (imported, first_tick, process))
+
+    return {"import_ms": 1e3*best[0], "first_tick_ms": 1e3*best[1], "process_ms": 1e3*best[2]}
+
+
+def run(quick=False):
+    """ Runs every benchmark and returns the results. """
+    repeat = 1 if quick else 3
+    count = 8 if quick else 32
+
+    blocks = pda_blocks()
+    if quick:
+        blocks = blocks[::4]
+
+    results = {}
+    results["startup"] = bench_startup(repeat + 1)
+    results["hps"] = bench_pda(pda.hps.hps, blocks, repeat, harmonics=3, precision=2)
+    results["tunedhps"] = bench_pda(pda.hps.tunedhps, blocks, repeat, harmonics=3, precision=1)
+    results["tonguing_feed"] = bench_tonguing(repeat)
+    results["equidistant_clusterize"] = bench_clustering(repeat)
+
+    passages = {"tongued":  signals.passage(signals.melody(count, seed=3), RATE, seed=3),
+                "slurred":  signals.passage(signals.melody(count, seed=4), RATE, "slurred", seed=4),
+                "vibrato":  signals.passage(signals.melody(count, seed=5), RATE, vibrato_depth=25, seed=5),
+                "breathy":  signals.passage(signals.melody(count, seed=6), RATE, breath=0.01, seed=6)}
+    for name, (x, reference) in sorted(passages.items()):
+        results["transcription_" + name] = bench_transcription(x, reference, repeat)
+
+    x, reference = passages["tongued"]
+    results["transcription_tongued_multiresolution"] = bench_transcription(x, reference, repeat, multiresolution=True)
+    results["transcription_tongued_flute_range"] = bench_transcription(
+        x, reference, repeat, note_range=(mt.lowest_flute_note, mt.highest_flute_note))
+    results["multistream_tongued_16"] = bench_multistream(x, reference, 16, repeat)
+    results["workers_tongued_16"] = bench_workers(x, reference, 16)
+
+    return {"time":     time.time(),
+            "quick":    quick,
+            "machine":  {"platform": platform.platform(), "processor": platform.processor(),
+                         "python": platform.python_version(), "numpy": np.__version__},
+            "results":  results}
+
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE, accuracy_tolerance=ACCURACY_TOLERANCE):
+    """ Returns the (benchmark, metric, baseline value, value) of every metric that regressed from the baseline. """
+    regressions = []
+    for benchmark, metrics in sorted(baseline["results"].items()):
+        for metric, old in sorted(metrics.items()):
+            new = results["results"].get(benchmark, {}).get(metric)
+            if old is None or new is None:
+                continue
+
+            if metric.endswith(TIME_SUFFIXES):
+                regressed = new > old*(1 + time_tolerance)
+            elif metric.endswith("accuracy") or metric.endswith("precision"):
+                regressed = new < old - accuracy_tolerance
+            else:
+                regressed = new < old/(1 + time_tolerance)
+
+            if regressed:
+                regressions.append((benchmark, metric, old, new))
+
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print("%-40s %-16s %12s %12s" % ("benchmark", "metric", "value", "baseline"))
+    for benchmark, metrics in sorted(results["results"].items()):
+        for metric, value in sorted(metrics.items()):
+            old = baseline["results"].get(benchmark, {}).get(metric) if baseline else None
+            print("%-40s %-16s %12s %12s" % (benchmark, metric, _format(value), _format(old)))
+    return
+
+
+def _format(value):
+    return "-" if value is None else "%.4g" % value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--quick", action="store_true", help="fewer signals and repetitions")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--compare", action="store_true", help="flag regressions against the baseline")
+    parser.add_argument("--baseline", default=BASELINE_FILENAME, help="baseline file")
+    parser.add_argument("--output", default=RESULTS_FILENAME, help="results file")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print("### Baseline stored in %s" % args.baseline)
+
+    if baseline is not None:
+        if baseline.get("quick") != results["quick"]:
+            print("### Warning: comparing %s results against a %s baseline" %
+                  ("quick" if results["quick"] else "full", "quick" if baseline.get("quick") else "full"))
+
+        regressions = compare(results, baseline)
+        for benchmark, metric, old, new in regressions:
+            print("### REGRESSION %s %s: %s -> %s" % (benchmark, metric, _format(old), _format(new)))
+        if regressions:
+            return 1
+
+        print("### No regressions")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Load test of the transcription service (see server.py): 'python -m benchmarks.loadtest [options]' from the
+    repository root. Several synthetic clients stream passages (see benchmarks.signals) at once, in real time unless
+    --fast is given, through WebSockets or chunked HTTP requests. Reports how many were served or rejected, the
+    latency of the tick events (from sending the last sample of a tick to receiving its pitch), the note accuracy
+    and the service metrics.
+    Unless --port is given, the service runs in this process on a free port, so the test runs on its own. """
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Allow running from anywhere, as the modules are imported from the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import perf
+import server
+from benchmarks import signals
+from benchmarks.__main__ import BLOCKS_PER_SEC, RATE, score
+
+
+class ClientResult(object):
+    """ Outcome of a client: its HTTP status, events received and when each tick event arrived. """
+
+    def __init__(self):
+        self.status = None
+        self.events = []
+        self.tick_times = {}
+        return
+
+    def receive(self, line):
+        event = json.loads(line)
+        self.events.append(event)
+        if event["type"] == "tick":
+            self.tick_times[event["tick"]] = time.perf_counter()
+        return
+
+    @property
+    def notes(self):
+        return [event for event in self.events if event["type"] == "note"]
+
+
+async def send_samples(x, chunk, realtime, write):
+    """ Sends float32 samples through the coroutine 'write', 'chunk' samples at a time (paced at the sample rate if
+        'realtime' is set). Returns the amount of samples sent and when, after each write. """
+    sent = []
+    times = []
+    start = time.perf_counter()
+    for i in range(0, x.size, chunk):
+        if realtime:
+            await asyncio.sleep(max(0, start + i/RATE - time.perf_counter()))
+        await write(x[i:i + chunk].tobytes())
+        sent.append(min(i + chunk, x.size))
+        times.append(time.perf_counter())
+
+    return np.array(sent), np.array(times)
+
+
+async def read_status(reader):
+    """ Reads the head of an HTTP response, returning its status. """
+    status_line, _ = await server.read_http_head(reader)
+    return int(status_line.split()[1])
+
+
+async def websocket_client(host, port, x, chunk, realtime):
+    """ Streams a passage through a WebSocket. """
+    result = ClientResult()
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode("ascii")
+    writer.write(("GET /transcribe?format=f32 HTTP/1.1\r\nHost: %s:%d\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                  "Sec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n" % (host, port, key)).encode("ascii"))
+    result.status = await read_status(reader)
+    if result.status != 101:
+        writer.close()
+        return result, None
+
+    async def write(data):
+        writer.write(server.websocket_frame(server.BINARY, data, mask=True))
+        await writer.drain()
+
+    async def receive():
+        while True:
+            opcode, payload = await server.read_websocket_message(reader, writer, 1 << 20, mask=True)
+            if opcode == server.CLOSE:
+                return
+            result.receive(payload)
+
+    receiving = asyncio.ensure_future(receive())
+    sent = await send_samples(x, chunk, realtime, write)
+    writer.write(server.websocket_frame(server.CLOSE, mask=True))
+    await writer.drain()
+    await receiving
+    writer.close()
+    return result, sent
+
+
+async def http_client(host, port, x, chunk, realtime):
+    """ Streams a passage through a chunked HTTP request, reading the events while sending. """
+    result = ClientResult()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(("POST /transcribe?format=f32 HTTP/1.1\r\nHost: %s:%d\r\nTransfer-Encoding: chunked\r\n"
+                  "Content-Type: application/octet-stream\r\n\r\n" % (host, port)).encode("ascii"))
+
+    async def write(data):
+        writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+        await writer.drain()
+
+    async def receive():
+        result.status = await read_status(reader)
+        if result.status != 200:
+            return
+        async for line in server.read_http_body(reader, {"transfer-encoding": "chunked"}, 1 << 20):
+            result.receive(line)
+
+    receiving = asyncio.ensure_future(receive())
+    try:
+        sent = await send_samples(x, chunk, realtime, write)
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+    except ConnectionError:
+        # Rejected streams are closed without reading the body.
+        sent = None
+    await receiving
+    writer.close()
+    return result, sent if result.status == 200 else None
+
+
+async def fetch_metrics(host, port):
+    """ Returns the body of GET /metrics. """
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(("GET /metrics HTTP/1.1\r\nHost: %s:%d\r\n\r\n" % (host, port)).encode("ascii"))
+    await read_status(reader)
+    body = await reader.read()
+    writer.close()
+    return body.decode("utf-8")
+
+
+async def load_test(args):
+    service = None
+    host, port = args.host, args.port
+    if port is None:
+        service = await server.TranscriptionServer(host, 0, args.max_streams).start()
+        port = service.port
+
+    samples_per_read = int(RATE/BLOCKS_PER_SEC)
+    client = websocket_client if args.protocol == "ws" else http_client
+    passages = [signals.passage(signals.melody(args.notes, seed=seed), RATE, seed=seed)
+                for seed in range(args.streams)]
+
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*[client(host, port, x, args.chunk, not args.fast) for x, _ in passages])
+    seconds = time.perf_counter() - start
+
+    latency = perf.LatencyHistogram()
+    accuracy = []
+    ticks = 0
+    for (result, sent), (_, reference) in zip(outcomes, passages):
+        if sent is None:
+            continue
+
+        # A tick's last sample is sent in the first write reaching it.
+        samples, times = sent
+        for tick, received in result.tick_times.items():
+            i = min(np.searchsorted(samples, tick*samples_per_read), samples.size - 1)
+            latency.record(max(received - times[i], 0))
+        ticks += len(result.tick_times)
+        accuracy.append(score(result.notes, reference))
+
+    served = sum(sent is not None for _, sent in outcomes)
+    print("### %d streams (%s, %s): %d served, %d rejected, in %.2fs" %
+          (args.streams, args.protocol, "as fast as possible" if args.fast else "real time", served,
+           args.streams - served, seconds))
+    if ticks:
+        print("ticks: %d (%.0f per second)" % (ticks, ticks/seconds))
+        print("tick latency (ms): p50 %.2f, p95 %.2f, p99 %.2f, max %.2f" %
+              tuple(1e3*v for v in (latency.percentile(50), latency.percentile(95), latency.percentile(99),
+                                    latency.max)))
+        for metric in ("pitch_accuracy", "onset_accuracy", "note_precision"):
+            print("%s: %.3f" % (metric, np.mean([a[metric] for a in accuracy])))
+
+    print("\n### Metrics")
+    print(await fetch_metrics(host, port))
+
+    if service is not None:
+        await service.close()
+
+    return served
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load tests the transcription service with synthetic clients.")
+    parser.add_argument("--host", default="127.0.0.1", help="service address")
+    parser.add_argument("--port", type=int, help="service port (by default, a service is started in this process)")
+    parser.add_argument("--streams", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--protocol", choices=("ws", "http"), default="ws", help="WebSocket or chunked HTTP")
+    parser.add_argument("--notes", type=int, default=16, help="notes in each client's passage")
+    parser.add_argument("--chunk", type=int, default=1024, help="samples sent at a time")
+    parser.add_argument("--fast", action="store_true", help="send as fast as the service accepts, not in real time")
+    parser.add_argument("--max-streams", type=int, default=32, help="stream limit of the service started")
+    args = parser.parse_args(argv)
+
+    asyncio.run(load_test(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Deterministic synthetic monophonic signals with known notes, for benchmarks and accuracy measurements.
+    Every generator takes a 'seed', so the same arguments always produce the same samples. """
+
+import numpy as _np
+import scipy.signal as _sig
+
+import mtheory as _mt
+
+
+# Relative amplitudes of the partials of generated tones (roughly those of a flute).
+default_partials = (1.0, 0.5, 0.35, 0.2, 0.1)
+
+
+def harmonic_tone(f, duration, rate=44100, partials=default_partials, amplitude=0.3, vibrato_depth=0.0,
+                  vibrato_rate=5.0, phase=0.0):
+    """ Returns a tone of pitch 'f' lasting 'duration' seconds, made of harmonic partials with the given relative
+        amplitudes (partials above the Nyquist frequency are left out). 'vibrato_depth' is the pitch modulation depth
+        in cents, at 'vibrato_rate' Hz. """
+    t = _np.arange(int(duration*rate))/rate
+    return _tone(f*2**(vibrato_depth*_np.sin(2*_np.pi*vibrato_rate*t)/1200), rate, partials, amplitude, phase)
+
+
+def breath_noise(size, rate=44100, level=0.01, low=500, high=6000, seed=0):
+    """ Returns 'size' samples of band limited noise (between 'low' and 'high' Hz) with RMS 'level', like the breath
+        noise of a wind instrument. """
+    rng = _np.random.RandomState(seed)
+    b, a = _sig.butter(2, [low/(rate/2), high/(rate/2)], "band")
+    noise = _sig.lfilter(b, a, rng.normal(0, 1, size))
+    return level*noise/_np.sqrt(_np.mean(noise**2))
+
+
+def melody(count, low="C4", high="D7", durations=(0.15, 0.2, 0.3, 0.45), seed=0):
+    """ Returns 'count' (note name, duration) pairs of a random walk (by 1 to 5 semitones per step, so consecutive notes
+        always differ) between 'low' and 'high', with durations picked from 'durations'. """
+    rng = _np.random.RandomState(seed)
+    table = _mt.tuning()
+    names = list(table.names[table.index(low):table.index(high) + 1])
+
+    i = rng.randint(len(names))
+    notes = []
+    for _ in range(count):
+        notes.append((names[i], durations[rng.randint(len(durations))]))
+        step = rng.randint(1, 6)*rng.choice((-1, 1))
+        i = i + step if 0 <= i + step < len(names) else i - step
+
+    return notes
+
+
+def passage(notes, rate=44100, articulation="tongued", gap=0.04, attack=0.01, vibrato_depth=0.0, breath=0.002,
+            lead=0.5, seed=0):
+    """ Returns the samples of a passage playing 'notes' ((note name, duration in seconds) pairs), and the reference
+        transcription as (note name, start, end) triples in seconds.
+        Tongued notes are separated by 'gap' seconds of silence and start and end with 'attack' seconds ramps. Slurred
+        notes follow each other without a gap, changing pitch with a continuous phase. The passage is preceded by
+        'lead' seconds of silence, and breath noise with RMS 'breath' is added throughout. """
+    if articulation not in ("tongued", "slurred"):
+        raise ValueError("Unknown articulation: %s" % articulation)
+
+    table = _mt.tuning()
+    lead_samples = int(lead*rate)
+    gap_samples = int(gap*rate) if articulation == "tongued" else 0
+    lengths = [int(duration*rate) for _, duration in notes]
+    total = lead_samples + sum(lengths) + gap_samples*len(notes)
+
+    # Instantaneous frequency and amplitude envelope of every sample.
+    frequency = _np.zeros(total)
+    envelope = _np.zeros(total)
+    reference = []
+    position = lead_samples
+    ramp = int(attack*rate)
+    for (name, _), length in zip(notes, lengths):
+        frequency[position:position + length] = table.frequency[table.index(name)]
+        if articulation == "tongued":
+            envelope[position:position + length] = _np.minimum(1, _np.minimum(_np.arange(length),
+                                                                               _np.arange(length)[::-1])/ramp)
+        else:
+            envelope[position:position + length] = 1
+
+        reference.append((name, position/rate, (position + length)/rate))
+        position += length + gap_samples
+
+    if articulation == "slurred":
+        # The notes are played in a single breath, so fade in and out only at its ends.
+        first, last = lead_samples, position
+        envelope[first:last] = _np.minimum(1, _np.minimum(_np.arange(last - first),
+                                                          _np.arange(last - first)[::-1])/ramp)
+
+    t = _np.arange(total)/rate
+    frequency *= 2**(vibrato_depth*_np.sin(2*_np.pi*5.0*t)/1200)
+    x = envelope*_tone(frequency, rate)
+    if breath:
+        x += breath_noise(total, rate, breath, seed=seed)
+
+    return x.astype(_np.float32), reference
+
+
+def _tone(frequency, rate, partials=default_partials, amplitude=0.3, phase=0.0):
+    """ Harmonic tone following the instantaneous 'frequency' of each sample (an array), with continuous phase. """
+    phase = phase + 2*_np.pi*_np.cumsum(frequency)/rate
+    x = _np.zeros(phase.size)
+    for h, a in enumerate(partials, 1):
+        # Leave out partials above the Nyquist frequency (where the tone is silent, frequency is 0 anyway).
+        x += _np.where(h*frequency < rate/2, a*_np.sin(h*phase), 0)
+
+    return amplitude*x/sum(partials)
@@ -15,47 +15,49 @@
 
 """ Module containing utilities to read samples from a microphone. """
 
+import time as _time
+
 import numpy as _np
-import pyaudio
 
+import mic.sources as _sources
+import soundfiles.recording as _rec
 
-class MicListener(object):
 
-    def __init__(self, samples_per_read, channels=1, rate=44100, debug_wave=False, debug_perf=False, print=False):
-        if debug_perf:
-            global time
-            import time
+class MicListener(object):
+    """ Reads samples from an audio source (see mic.sources), by default the input device picked by 'device'.
+        If a perf.tracing.Tracer is given, every read is recorded as a span. """
 
+    def __init__(self, samples_per_read, channels=1, rate=44100, debug_wave=False, print=False, source=None,
+                 device=None, tracer=None):
         self.samples_per_read = samples_per_read
         self.channels = channels
         self.rate = rate
         self.debug_wave = debug_wave
-        self.debug_perf = debug_perf
         self.print = print
+        self.tracer = tracer
 
         self.total_ticks = 0
-        
-        if self.debug_perf:
-            self.read_time = -1
 
         if self.debug_wave:
-            self.wave = _np.array([], dtype=_np.float32)
+            # Samples are streamed to the recording as they are read, so recording costs the same on every read
+            # regardless of the session length.
+            self.wave_filename = "wave.ptrec"
+            self._recorder = _rec.RecordingWriter(self.wave_filename, self.rate, self.channels,
+                                                  tick_size=self.samples_per_read, background=True)
 
-        self._pa = pyaudio.PyAudio()
-        self._stream = self._pa.open(format = pyaudio.paFloat32,
-                                     channels = self.channels,
-                                     rate = self.rate,
-                                     input = True,
-                                     input_device_index = self._find_input_device(),
-                                     frames_per_buffer = self.samples_per_read)
+        if source is None:
+            source = _sources.PyAudioSource(self.samples_per_read, self.channels, self.rate, device, print=print)
+        self.source = source
 
         return
 
     def close(self):
         """ Closes the audio resources. """
-        self._stream.close()
+        self.source.close()
         if self.debug_wave:
-            self._write_wave()
+            if self.print:
+                print("### Writing %s" % self.wave_filename)
+            self._recorder.close()
         return
 
     def detect_noise(self, noise_detection_reads=None):
@@ -63,6 +65,7 @@ class MicListener(object):
         if not noise_detection_reads:
             noise_detection_reads = 3.0*self.rate/self.samples_per_read
 
+        noise_detection_reads = int(noise_detection_reads)
         rms_noise_values = _np.zeros(noise_detection_reads)
         for i in range(rms_noise_values.size):
             samples = self.listen()
@@ -75,53 +78,32 @@ class MicListener(object):
         return 1.5*pct98rms
 
     def listen(self):
-        """ Returns an nparray with samples from the mic, or an array of zeros if the mic can't be read. """
+        """ Returns an nparray with samples from the mic, or an array of zeros if the mic can't be read.
+            Raises EOFError if the source ended. """
+        samples = _np.empty(self.samples_per_read*self.channels, _np.float32)
+        self.listen_into(samples)
+        return samples
+
+    def listen_into(self, out):
+        """ Same as listen(), but writes the samples into 'out' (a float32 array) instead of allocating a new array. """
         self.total_ticks += 1
-        if self.debug_perf:
-            read_start_time = time.time()
+        if self.tracer is not None:
+            start = _time.perf_counter()
 
         try:
-            buffer = self._stream.read(self.samples_per_read)
+            self.source.readinto(out)
         except IOError as e:
             if self.print:
                 print("\tError recording: %s" % e)
-            return _np.zeros(self.samples_per_read)
+            out[:] = 0
+            if self.tracer is not None:
+                self.tracer.complete("listen", start, _time.perf_counter(), "mic", {"error": str(e)})
+            return
 
-        samples = _np.frombuffer(buffer, _np.float32)
+        if self.tracer is not None:
+            self.tracer.complete("listen", start, _time.perf_counter(), "mic")
 
         if self.debug_wave:
-            self.wave = _np.append(self.wave, samples)
-
-        if self.debug_perf:
-            self.read_time = time.time() - read_start_time
-
-        # Convert the input buffer into an np array.
-        return samples
-
-    def _find_input_device(self):
-        """ Finds the default input device's index. """
-        for i in range(self._pa.get_device_count()):
-            devinfo = self._pa.get_device_info_by_index(i)
-            if self.print:
-                print("Device %d: %s" % (i, devinfo["name"]))
-
-            for keyword in ["mic", "input"]:
-                if keyword in devinfo["name"].lower():
-                    if self.print:
-                        print("Found input: device %d - %s" % (i,devinfo["name"]))
-
-                    return i
-
-        if self.print:
-            print("Using default input device.")
-
-        return None
-
-    def _write_wave(self):
-        """ Writes the recorded wave array to a numpy compressed file (.npz). """
-        filename = "wave"
-        if self.print:
-            print("### Writing %s.npz" % filename)
+            self._recorder.write(out)
 
-        _np.savez_compressed(filename, self.wave)
         return
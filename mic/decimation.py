@@ -0,0 +1,63 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Integer factor decimation of sample streams, so the analysis can run at the lowest rate the music needs. """
+
+import numpy as _np
+
+
+def decimation_factor(rate, minimum_rate):
+    """ Returns the largest integer factor 'rate' can be divided by without going below 'minimum_rate'. """
+    return max(1, int(rate//minimum_rate))
+
+
+class Decimator(object):
+    """ Low-pass filters and downsamples a stream by an integer 'factor', one chunk at a time.
+        The anti-aliasing filter is a Kaiser windowed FIR with 'taps_per_phase' taps for each of the 'factor' phases,
+        cutting off at 'cutoff' times the output Nyquist frequency. With the defaults, content up to 0.9 times the output
+        Nyquist frequency passes unaltered (within 0.01dB), while content above 1.1 times it, whose aliases would land
+        below 0.9 times it, is attenuated by 60dB. Only the samples that are kept are computed (i.e. it's a polyphase
+        decimator), and the last input samples are carried between chunks, so the output of a stream fed in chunks is
+        the same as that of the stream fed at once. The output is delayed by 'delay' input samples. """
+
+    def __init__(self, factor, taps_per_phase=48, cutoff=1.0, dtype=_np.float32):
+        self.factor = factor
+        from scipy.signal import firwin
+        self.taps = firwin(factor*taps_per_phase, cutoff/factor, window=("kaiser", 8.0)).astype(dtype)
+        self.delay = (self.taps.size - 1)/2
+
+        # Input samples preceding the next output sample's window position.
+        self._history = _np.zeros(self.taps.size - 1, dtype)
+
+        # Reversed taps, so each output sample is the dot product of a window of the input and these.
+        self._reversed = self.taps[::-1].copy()
+        return
+
+    def output_size(self, input_size):
+        """ Amount of output samples the next 'input_size' input samples will produce. """
+        return (self._history.size + input_size - self.taps.size)//self.factor + 1
+
+    def __call__(self, x, out=None):
+        """ Decimates the next chunk of the stream, writing the result into 'out' if given. Returns the output. """
+        x = _np.concatenate((self._history, x))
+        count = (x.size - self.taps.size)//self.factor + 1
+
+        # Windows of the input ending on each kept sample, as a strided view (no copies).
+        windows = _np.lib.stride_tricks.as_strided(x, (count, self.taps.size),
+                                                   (self.factor*x.strides[0], x.strides[0]), writeable=False)
+        out = _np.dot(windows, self._reversed, out=out)
+
+        self._history = x[count*self.factor:]
+        return out
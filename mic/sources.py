@@ -0,0 +1,343 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Audio sources: objects that deliver float32 samples in reads of a fixed size.
+    Real time sources (the PyAudio backend, and the file and synthetic backends unless unthrottled) are fed by a
+    producer (an audio callback or a pacing thread) into a ring buffer, so capturing never blocks on the analysis and
+    the analysis only blocks while waiting for new samples. Samples that the reader doesn't consume in time are dropped
+    and counted as overruns. """
+
+import threading as _threading
+import time as _time
+
+import numpy as _np
+
+import soundfiles as _sf
+
+
+class RingBuffer(object):
+    """ Single producer, single consumer ring buffer of float32 samples. """
+
+    def __init__(self, capacity):
+        self._data = _np.zeros(capacity, _np.float32)
+
+        # Total amount of samples written and read. The difference is the amount of samples available.
+        self._written = 0
+        self._read = 0
+
+        # Samples dropped because the reader fell behind.
+        self.overruns = 0
+
+        # Set when the producer won't write anymore.
+        self.closed = False
+
+        self._cond = _threading.Condition()
+        return
+
+    @property
+    def available(self):
+        """ Amount of samples that can be read. """
+        return self._written - self._read
+
+    def write(self, samples):
+        """ Writes samples into the buffer, dropping the oldest samples if there's no room for them. """
+        samples = samples[-self._data.size:]
+        with self._cond:
+            dropped = self.available + samples.size - self._data.size
+            if dropped > 0:
+                self._read += dropped
+                self.overruns += dropped
+
+            start = self._written % self._data.size
+            first = min(samples.size, self._data.size - start)
+            self._data[start:start + first] = samples[:first]
+            self._data[:samples.size - first] = samples[first:]
+            self._written += samples.size
+            self._cond.notify()
+        return
+
+    def read_into(self, out, timeout=None):
+        """ Fills 'out' with the oldest samples available, waiting up to 'timeout' seconds for them.
+            Returns False if they didn't become available. """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.available >= out.size or self.closed, timeout):
+                return False
+            if self.available < out.size:
+                return False
+
+            start = self._read % self._data.size
+            first = min(out.size, self._data.size - start)
+            out[:first] = self._data[start:start + first]
+            out[first:] = self._data[:out.size - first]
+            self._read += out.size
+        return True
+
+    def close(self):
+        """ Signals that the producer won't write anymore, waking up a waiting reader. """
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+        return
+
+
+class AudioSource(object):
+    """ Base class for audio sources.
+        read() and readinto() raise IOError when samples aren't available in time, and EOFError when the source ends. """
+
+    def __init__(self, samples_per_read, channels=1, rate=44100):
+        self.samples_per_read = samples_per_read
+        self.channels = channels
+        self.rate = rate
+        return
+
+    @property
+    def overruns(self):
+        """ Amount of samples dropped because they weren't read in time. """
+        return 0
+
+    def read(self):
+        """ Returns the next read of samples (interleaved if there are multiple channels). """
+        out = _np.empty(self.samples_per_read*self.channels, _np.float32)
+        self.readinto(out)
+        return out
+
+    def readinto(self, out):
+        """ Fills 'out' with the next read of samples. """
+        raise NotImplementedError()
+
+    def close(self):
+        """ Releases the resources used by the source. """
+        return
+
+
+class _RingSource(AudioSource):
+    """ Source fed by a producer into a ring buffer holding up to 'buffer_reads' reads. """
+
+    def __init__(self, samples_per_read, channels=1, rate=44100, buffer_reads=16, timeout=1.0):
+        AudioSource.__init__(self, samples_per_read, channels, rate)
+        self.timeout = timeout
+        self.ring = RingBuffer(buffer_reads*samples_per_read*channels)
+        return
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+    def readinto(self, out):
+        if not self.ring.read_into(out, self.timeout):
+            if self.ring.closed:
+                raise EOFError("Audio source ended")
+            raise IOError("Timed out waiting for audio samples")
+        return
+
+
+class PyAudioSource(_RingSource):
+    """ Captures samples from an input device through a non-blocking PyAudio stream.
+        'device' is a device index, part of a device name, or None for the default input device. """
+
+    def __init__(self, samples_per_read, channels=1, rate=44100, device=None, buffer_reads=16, print=False):
+        import pyaudio
+
+        _RingSource.__init__(self, samples_per_read, channels, rate, buffer_reads)
+        self.print = print
+
+        # Times PortAudio reported that it dropped input (i.e. this process didn't keep up with the device).
+        self.input_overflows = 0
+        self._paInputOverflow = pyaudio.paInputOverflow
+        self._paContinue = pyaudio.paContinue
+
+        self._pa = pyaudio.PyAudio()
+        self._stream = self._pa.open(format = pyaudio.paFloat32,
+                                     channels = self.channels,
+                                     rate = self.rate,
+                                     input = True,
+                                     input_device_index = self._find_input_device(device),
+                                     frames_per_buffer = self.samples_per_read,
+                                     stream_callback = self._callback)
+        return
+
+    def close(self):
+        self._stream.stop_stream()
+        self._stream.close()
+        self._pa.terminate()
+        self.ring.close()
+        return
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        """ Called by PortAudio on its own thread whenever there are new samples. """
+        if status & self._paInputOverflow:
+            self.input_overflows += 1
+
+        self.ring.write(_np.frombuffer(in_data, _np.float32))
+        return (None, self._paContinue)
+
+    def _find_input_device(self, device):
+        """ Finds the index of the input device. """
+        if device is None or isinstance(device, int):
+            return device
+
+        for i in range(self._pa.get_device_count()):
+            devinfo = self._pa.get_device_info_by_index(i)
+            if self.print:
+                print("Device %d: %s" % (i, devinfo["name"]))
+
+            if device.lower() in devinfo["name"].lower() and devinfo["maxInputChannels"] > 0:
+                if self.print:
+                    print("Found input: device %d - %s" % (i, devinfo["name"]))
+
+                return i
+
+        if self.print:
+            print("Using default input device.")
+
+        return None
+
+
+class PushSource(_RingSource):
+    """ Source fed by the caller through push(), e.g. with samples received from the network in chunks of any size.
+        Reads never wait: they raise IOError if a whole read wasn't pushed yet (see 'reads_available'), and EOFError
+        once the source is closed and the remaining samples don't fill a read. """
+
+    def __init__(self, samples_per_read, channels=1, rate=44100, buffer_reads=16):
+        _RingSource.__init__(self, samples_per_read, channels, rate, buffer_reads, timeout=0)
+        return
+
+    @property
+    def reads_available(self):
+        """ Amount of whole reads pushed and not read yet. """
+        return self.ring.available//(self.samples_per_read*self.channels)
+
+    def push(self, samples):
+        """ Appends samples (interleaved if there are multiple channels) to the source. Bytes are taken as raw float32
+            samples, like the ones PyAudio delivers. Samples not read before the buffer fills up are dropped. """
+        if isinstance(samples, (bytes, bytearray, memoryview)):
+            samples = _np.frombuffer(samples, _np.float32)
+        self.ring.write(_np.asarray(samples, _np.float32).ravel())
+        return
+
+    def close(self):
+        self.ring.close()
+        return
+
+
+class _GeneratedSource(_RingSource):
+    """ Source whose samples are generated on demand, one read at a time, by _generate().
+        If 'realtime' is set, a thread generates the reads paced at the sample rate (like an audio device would).
+        Otherwise every read is generated immediately, as fast as the reader consumes them. """
+
+    def __init__(self, samples_per_read, channels=1, rate=44100, realtime=True, buffer_reads=16):
+        _RingSource.__init__(self, samples_per_read, channels, rate, buffer_reads)
+        self.realtime = realtime
+
+        self._stopped = False
+        if realtime:
+            self._thread = _threading.Thread(target=self._produce, name=type(self).__name__)
+            self._thread.daemon = True
+            self._thread.start()
+
+        return
+
+    def readinto(self, out):
+        if self.realtime:
+            return _RingSource.readinto(self, out)
+
+        samples = self._generate()
+        if samples is None:
+            raise EOFError("Audio source ended")
+
+        out[:] = samples
+        return
+
+    def close(self):
+        self._stopped = True
+        self.ring.close()
+        return
+
+    def _produce(self):
+        """ Pacing thread: generates a read whenever the previous one would have finished playing. """
+        period = self.samples_per_read/self.rate
+        deadline = _time.time()
+        while not self._stopped:
+            samples = self._generate()
+            if samples is None:
+                break
+
+            deadline += period
+            delay = deadline - _time.time()
+            if delay > 0:
+                _time.sleep(delay)
+
+            self.ring.write(samples)
+
+        self.ring.close()
+        return
+
+    def _generate(self):
+        """ Returns the next read of samples, or None if the source ended. """
+        raise NotImplementedError()
+
+
+class FileSource(_GeneratedSource):
+    """ Replays an audio file readable by soundfiles.readblocks (only its first channel). """
+
+    def __init__(self, audiopath, samples_per_read, realtime=True, loop=False, samplerate=44100, buffer_reads=16):
+        self.audiopath = audiopath
+        self.loop = loop
+        self._samplerate = samplerate
+        rate, self._blocks = _sf.readblocks(audiopath, samples_per_read, samplerate=samplerate, pad=True)
+
+        _GeneratedSource.__init__(self, samples_per_read, 1, rate, realtime, buffer_reads)
+        return
+
+    def _generate(self):
+        samples = next(self._blocks, None)
+        if samples is None and self.loop:
+            _, self._blocks = _sf.readblocks(self.audiopath, self.samples_per_read, samplerate=self._samplerate,
+                                             pad=True)
+            samples = next(self._blocks, None)
+
+        return samples
+
+
+class SyntheticSource(_GeneratedSource):
+    """ Generates samples from 'signal', a function receiving an array of times (in seconds since the beginning of the
+        source) and returning the samples at those times. Gaussian noise with a 'noise' RMS level is added, seeded
+        by 'seed' so runs are reproducible. The source ends after 'duration' seconds, or never if it's None. """
+
+    def __init__(self, samples_per_read, rate=44100, signal=None, noise=0.0, duration=None, seed=0, realtime=True,
+                 buffer_reads=16):
+        self.signal = signal if signal is not None else _np.zeros_like
+        self.noise = noise
+        self.duration = duration
+
+        # Index of the next sample to be generated.
+        self._position = 0
+        self._random = _np.random.RandomState(seed)
+
+        _GeneratedSource.__init__(self, samples_per_read, 1, rate, realtime, buffer_reads)
+        return
+
+    def _generate(self):
+        if self.duration is not None and self._position >= self.duration*self.rate:
+            return None
+
+        t = (self._position + _np.arange(self.samples_per_read))/self.rate
+        self._position += self.samples_per_read
+
+        samples = _np.asarray(self.signal(t), _np.float32)
+        if self.noise:
+            samples = samples + self._random.normal(0, self.noise, samples.size).astype(_np.float32)
+
+        return samples
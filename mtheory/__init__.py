@@ -13,7 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
-""" Musical theory constants. Assumes A440 tuning. """
+""" Musical theory constants. The note lists and mappings below assume A440 equal temperament; tables for other
+    tunings are built (and cached) by tuning(). """
+
+import numpy as _np
+
 
 """ Array of note frequencies. """
 notes = [ 16.35, 17.32, 18.35, 19.45, 20.60, 21.83, 23.12, 24.50, 25.96, 27.50, 29.14, 30.87, 32.70, 34.65, 36.71, 38.89, 41.20, 43.65, 46.25, 49.00, 51.91, 55.00, 58.27, 61.74, 65.41, 69.30, 73.42, 77.78, 82.41, 87.31, 92.50, 98.00, 103.83, 110.00, 116.54, 123.47, 130.81, 138.59, 146.83, 155.56, 164.81, 174.61, 185.00, 196.00, 207.65, 220.00, 233.08, 246.94, 261.63, 277.18, 293.66, 311.13, 329.63, 349.23, 369.99, 392.00, 415.30, 440.00, 466.16, 493.88, 523.25, 554.37, 587.33, 622.25, 659.25, 698.46, 739.99, 783.99, 830.61, 880.00, 932.33, 987.77, 1046.50, 1108.73, 1174.66, 1244.51, 1318.51, 1396.91, 1479.98, 1567.98, 1661.22, 1760.00, 1864.66, 1975.53, 2093.00, 2217.46, 2349.32, 2489.02, 2637.02, 2793.83, 2959.96, 3135.96, 3322.44, 3520.00, 3729.31, 3951.07, 4186.01, 4434.92, 4698.63, 4978.03, 5274.04, 5587.65, 5919.91, 6271.93, 6644.88, 7040.00, 7458.62, 7902.13 ]
@@ -24,7 +28,7 @@ note_name = {16.35: 'C0', 17.32: 'C#0', 18.35: 'D0', 19.45: 'D#0', 20.60: 'E0',
 
 
 """ Mapping from note name to note frequency. """
-note_frequency = {'C0': 16.35, 'C#0': 17.32, 'D0': 18.35, 'D#0': 19.45, 'E0': 20.60, 'F0': 21.83, 'F#0': 23.12, 24.50: 'G0', 25.96: 'G#0', 'A0': 27.50, 'A#0': 29.14, 'B0': 30.87, 'C1': 32.70, 'C#1': 34.65, 'D1': 36.71, 'D#1': 38.89, 'E1': 41.20, 'F1': 43.65, 'F#1': 46.25, 49.00: 'G1', 51.91: 'G#1', 'A1': 55.00, 'A#1': 58.27, 'B1': 61.74, 'C2': 65.41, 'C#2': 69.30, 'D2': 73.42, 'D#2': 77.78, 'E2': 82.41, 'F2': 87.31, 'F#2': 92.50, 98.00: 'G2', 103.83: 'G#2', 'A2': 110.00, 'A#2': 116.54, 'B2': 123.47, 'C3': 130.81, 'C#3': 138.59, 'D3': 146.83, 'D#3': 155.56, 'E3': 164.81, 'F3': 174.61, 'F#3': 185.00, 196.00: 'G3', 207.65: 'G#3', 'A3': 220.00, 'A#3': 233.08, 'B3': 246.94, 'C4': 261.63, 'C#4': 277.18, 'D4': 293.66, 'D#4': 311.13, 'E4': 329.63, 'F4': 349.23, 'F#4': 369.99, 392.00: 'G4', 415.30: 'G#4', 'A4': 440.00, 'A#4': 466.16, 'B4': 493.88, 'C5': 523.25, 'C#5': 554.37, 'D5': 587.33, 'D#5': 622.25, 'E5': 659.25, 'F5': 698.46, 'F#5': 739.99, 783.99: 'G5', 830.61: 'G#5', 'A5': 880.00, 'A#5': 932.33, 'B5': 987.77, 'C6': 1046.50, 'C#6': 1108.73, 'D6': 1174.66, 'D#6': 1244.51, 'E6': 1318.51, 'F6': 1396.91, 'F#6': 1479.98, 1567.98: 'G6', 1661.22: 'G#6', 'A6': 1760.00, 'A#6': 1864.66, 'B6': 1975.53, 'C7': 2093.00, 'C#7': 2217.46, 'D7': 2349.32, 'D#7': 2489.02, 'E7': 2637.02, 'F7': 2793.83, 'F#7': 2959.96, 3135.96: 'G7', 3322.44: 'G#7', 'A7': 3520.00, 'A#7': 3729.31, 'B7': 3951.07, 'C8': 4186.01, 'C#8': 4434.92, 'D8': 4698.63, 'D#8': 4978.03, 'E8': 5274.04, 'F8': 5587.65, 'F#8': 5919.91, 6271.93: 'G8', 6644.88: 'G#8', 'A8': 7040.00, 7458.62: 'A#8'}
+note_frequency = {'C0': 16.35, 'C#0': 17.32, 'D0': 18.35, 'D#0': 19.45, 'E0': 20.60, 'F0': 21.83, 'F#0': 23.12, 'G0': 24.50, 'G#0': 25.96, 'A0': 27.50, 'A#0': 29.14, 'B0': 30.87, 'C1': 32.70, 'C#1': 34.65, 'D1': 36.71, 'D#1': 38.89, 'E1': 41.20, 'F1': 43.65, 'F#1': 46.25, 'G1': 49.00, 'G#1': 51.91, 'A1': 55.00, 'A#1': 58.27, 'B1': 61.74, 'C2': 65.41, 'C#2': 69.30, 'D2': 73.42, 'D#2': 77.78, 'E2': 82.41, 'F2': 87.31, 'F#2': 92.50, 'G2': 98.00, 'G#2': 103.83, 'A2': 110.00, 'A#2': 116.54, 'B2': 123.47, 'C3': 130.81, 'C#3': 138.59, 'D3': 146.83, 'D#3': 155.56, 'E3': 164.81, 'F3': 174.61, 'F#3': 185.00, 'G3': 196.00, 'G#3': 207.65, 'A3': 220.00, 'A#3': 233.08, 'B3': 246.94, 'C4': 261.63, 'C#4': 277.18, 'D4': 293.66, 'D#4': 311.13, 'E4': 329.63, 'F4': 349.23, 'F#4': 369.99, 'G4': 392.00, 'G#4': 415.30, 'A4': 440.00, 'A#4': 466.16, 'B4': 493.88, 'C5': 523.25, 'C#5': 554.37, 'D5': 587.33, 'D#5': 622.25, 'E5': 659.25, 'F5': 698.46, 'F#5': 739.99, 'G5': 783.99, 'G#5': 830.61, 'A5': 880.00, 'A#5': 932.33, 'B5': 987.77, 'C6': 1046.50, 'C#6': 1108.73, 'D6': 1174.66, 'D#6': 1244.51, 'E6': 1318.51, 'F6': 1396.91, 'F#6': 1479.98, 'G6': 1567.98, 'G#6': 1661.22, 'A6': 1760.00, 'A#6': 1864.66, 'B6': 1975.53, 'C7': 2093.00, 'C#7': 2217.46, 'D7': 2349.32, 'D#7': 2489.02, 'E7': 2637.02, 'F7': 2793.83, 'F#7': 2959.96, 'G7': 3135.96, 'G#7': 3322.44, 'A7': 3520.00, 'A#7': 3729.31, 'B7': 3951.07, 'C8': 4186.01, 'C#8': 4434.92, 'D8': 4698.63, 'D#8': 4978.03, 'E8': 5274.04, 'F8': 5587.65, 'F#8': 5919.91, 'G8': 6271.93, 'G#8': 6644.88, 'A8': 7040.00, 'A#8': 7458.62}
 
 
 """ Relative frequency increase in a semitone. """
@@ -41,3 +45,74 @@ highest_flute_note = note_frequency["D7"]
 
 """ Array of notes playable on a western concert flute. """
 flute_notes = [f for f in notes if f >= lowest_flute_note and f <= highest_flute_note]
+
+
+""" Pitch class names, indexed by 'midi % 12'. """
+pitch_classes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
+
+
+""" Deviations from equal temperament in cents for each pitch class (starting at C), by temperament name.
+    Non-equal temperaments are C-based, with the wolf interval between G# and D#. """
+temperaments = {"equal":        [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0],
+                "pythagorean":  [0, 13.69, 3.91, -5.87, 7.82, -1.96, 11.73, 1.96, 15.64, 5.87, -3.91, 9.78],
+                "meantone":     [0, -23.95, -6.84, 10.26, -13.69, 3.42, -20.53, -3.42, -27.37, -10.26, 6.84, -17.11],
+                "just":         [0, 11.73, 3.91, 15.64, -13.69, -1.96, -9.78, 1.96, 13.69, -15.64, 17.60, -11.73]}
+
+
+class NoteTable(object):
+    """ Contiguous arrays describing every note between C0 and B8 in a given tuning.
+        All arrays share the same indexing, so a note index obtained from one of them (e.g. via nearest()) can be used
+        to look up any other property without hashing floats. """
+
+    def __init__(self, a4=440.0, temperament="equal"):
+        if temperament not in temperaments:
+            raise ValueError("Unknown temperament: %s" % temperament)
+
+        self.a4 = a4
+        self.temperament = temperament
+
+        # MIDI note numbers, from C0 (12) to B8 (119).
+        self.midi = _np.arange(12, 120)
+
+        # Index of the note name in 'pitch_classes', and octave number.
+        self.name_index = self.midi % 12
+        self.octave = self.midi//12 - 1
+
+        # The temperament deviations are relative to C, so shift them in order to keep A4 at the reference.
+        deviations = _np.asarray(temperaments[temperament], dtype=_np.float64)
+        cents = 100*(self.midi - 69) + deviations[self.name_index] - deviations[9]
+
+        self.log2_frequency = _np.log2(a4) + cents/1200
+        self.frequency = _np.exp2(self.log2_frequency)
+        self.names = _np.array([pitch_classes[p] + str(o) for p, o in zip(self.name_index, self.octave)])
+
+        # Midpoints between neighbouring notes (in log2 space), so the nearest note is found with a binary search.
+        self._boundaries = (self.log2_frequency[1:] + self.log2_frequency[:-1])/2
+        self._indices = {name: i for i, name in enumerate(self.names)}
+        return
+
+    def __len__(self):
+        return self.midi.size
+
+    def nearest(self, f):
+        """ Returns the index of the note closest (in cents) to the frequency 'f' (in Hz). 'f' may be a scalar or an
+            array. """
+        return _np.searchsorted(self._boundaries, _np.log2(f))
+
+    def index(self, name):
+        """ Returns the index of a note given its name, e.g. 'C#4'. """
+        return self._indices[name]
+
+    def between(self, low, high):
+        """ Returns the indices of the notes with frequencies in the closed interval [low, high]. """
+        return _np.flatnonzero((self.frequency >= low) & (self.frequency <= high))
+
+
+_tables = {}
+def tuning(a4=440.0, temperament="equal"):
+    """ Returns the NoteTable for a given A4 reference and temperament. Tables are built once and cached. """
+    key = (float(a4), temperament)
+    if key not in _tables:
+        _tables[key] = NoteTable(a4, temperament)
+
+    return _tables[key]
@@ -0,0 +1,91 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Key estimation by the Krumhansl-Schmuckler algorithm: the key is the one whose profile correlates best with how
+    long each pitch class was played. """
+
+import numpy as _np
+
+import mtheory as _mt
+
+
+""" Krumhansl-Kessler key profiles (probe tone ratings of each pitch class, starting at the tonic). """
+major_profile = [6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88]
+minor_profile = [6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17]
+
+
+""" Modes of the keys, in the order of the rows of KeyEstimator.correlations(). """
+modes = ["major", "minor"]
+
+
+def fifths(tonic, mode):
+    """ Returns the position of a key (its tonic pitch class and mode) in the circle of fifths, i.e. its amount of
+        sharps, or minus its amount of flats (between -5 and 6). """
+    if mode == "minor":
+        # Relative major.
+        tonic += 3
+
+    position = 7*tonic % 12
+    return position - 12 if position > 6 else position
+
+
+class KeyEstimator(object):
+    """ Incremental key estimator: notes are added as they're detected, weighted by their duration, into a pitch
+        class histogram, which is correlated with the profile of every key by a single (24x12) matrix product
+        whenever an estimate is needed. """
+
+    def __init__(self, major=major_profile, minor=minor_profile):
+        # Profile of each key (rows: the 12 major keys, then the 12 minor keys, by tonic), rotated so columns are
+        # pitch classes, and standardized so their dot product with a standardized histogram is their correlation.
+        profiles = _np.array([_np.roll(profile, tonic) for profile in (major, minor) for tonic in range(12)],
+                             dtype=_np.float64)
+        profiles -= profiles.mean(axis=1, keepdims=True)
+        self._profiles = profiles/_np.linalg.norm(profiles, axis=1, keepdims=True)
+
+        self.histogram = _np.zeros(12)
+        return
+
+    def add(self, name, weight=1.0):
+        """ Adds a note given its name (e.g. 'C#5'), weighted by its duration. """
+        table = _mt.tuning()
+        self.histogram[table.name_index[table.index(name)]] += weight
+        return
+
+    def reset(self):
+        self.histogram[:] = 0
+        return
+
+    def correlations(self):
+        """ Returns the correlation of the histogram with every key profile, as a (modes x tonics) array, or None if
+            every pitch class was played for as long (e.g. no note was added yet). """
+        centered = self.histogram - self.histogram.mean()
+        norm = _np.linalg.norm(centered)
+        if norm == 0:
+            return None
+
+        return (self._profiles @ (centered/norm)).reshape(len(modes), 12)
+
+    def estimate(self):
+        """ Returns the most likely key as a dict with its "tonic" (pitch class name), "mode", "fifths" (see fifths())
+            and "correlation", or None if there's nothing to estimate it from. """
+        correlations = self.correlations()
+        if correlations is None:
+            return None
+
+        mode, tonic = _np.unravel_index(_np.argmax(correlations), correlations.shape)
+        return {"tonic":        _mt.pitch_classes[tonic],
+                "mode":         modes[mode],
+                "fifths":       fifths(int(tonic), modes[mode]),
+                "correlation":  float(correlations[mode, tonic])}
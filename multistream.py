@@ -0,0 +1,121 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Transcription of several concurrent streams (e.g. one per student station) by a single engine, which detects the
+    pitches of every stream in one batch per tick. Each stream keeps its own transcriber, i.e. its own noise,
+    tonguing and segmentation state. """
+
+import numpy as _np
+
+import pda.hps as _hps
+import perf as _perf
+import transcriber as _transcriber
+
+
+class MultiStreamTranscriber(object):
+    """ Transcribes one stream per audio source (see mic.sources), all with the same settings (keyword arguments are
+        given to transcriber.Transcriber, whose debugging outputs and output files are off unless given, see
+        transcriber.QUIET).
+        On every tick, each stream reads its samples and updates its noise level and tonguing (see
+        transcriber.Transcriber.begin_tick), then the blocks of the streams that pass the gating levels before the
+        pitch detection are stacked into a matrix and their pitches are detected by a single batched FFT and harmonic
+        sum (see pda.hps.hps). Streams with multi-resolution pitch detection analyze different windows on each tick,
+        so they detect their pitches one by one instead.
+        'streams' holds the transcriber of each active stream. Streams whose source ended are finished (see
+        transcriber.Transcriber.finish), removed and returned by update(). 'perf' times the stages of every engine tick, which
+        must take less than a tick on average to keep up with the sources. """
+
+    def __init__(self, sources=(), blocks_per_sec=60.0, samples_per_block=1470, **kwargs):
+        self.blocks_per_sec = blocks_per_sec
+        self.samples_per_block = samples_per_block
+        self.kwargs = dict(_transcriber.QUIET, **kwargs)
+
+        self.streams = []
+        for source in sources:
+            self.add(source)
+
+        self.perf = _perf.StageTimer(("streams", "pda", "segmentation"), budget=1/blocks_per_sec)
+        return
+
+    def add(self, source):
+        """ Starts transcribing a new stream from an audio source. Returns its transcriber. """
+        trs = _transcriber.Transcriber(self.blocks_per_sec, self.samples_per_block, source=source, **self.kwargs)
+        self.streams.append(trs)
+        return trs
+
+    def remove(self, trs):
+        """ Stops transcribing a stream, finishing its transcriber. """
+        self.streams.remove(trs)
+        trs.finish()
+        return
+
+    def close(self):
+        """ Stops transcribing every stream. Returns their transcribers. """
+        finished = list(self.streams)
+        for trs in finished:
+            self.remove(trs)
+        return finished
+
+    def update(self, streams=None):
+        """ Performs a transcription iteration update of the given streams (e.g. the ones whose source has samples
+            available), by default every stream. Returns the transcribers of the streams that ended (which are no
+            longer in 'streams'). Raises EOFError once every stream ended. """
+        if not self.streams:
+            raise EOFError("Every stream ended")
+
+        self.perf.start()
+        frames = []
+        finished = []
+        for trs in list(self.streams if streams is None else streams):
+            try:
+                frames.append((trs, trs.begin_tick()))
+            except EOFError:
+                self.remove(trs)
+                finished.append(trs)
+        self.perf.lap("streams")
+
+        pitches = self.detect_pitches(frames)
+        self.perf.lap("pda")
+
+        for (trs, frame), perceived_f in zip(frames, pitches):
+            # The time spent on the other streams isn't part of any of this stream's stages.
+            trs.perf.resume()
+            trs.end_tick(frame, perceived_f)
+        self.perf.lap("segmentation")
+
+        self.perf.stop()
+        return finished
+
+    def detect_pitches(self, frames):
+        """ Returns the pitch of each (transcriber, frame) pair, or None for the frames gated by their transcriber. """
+        pitches = [None]*len(frames)
+
+        # Frames of streams at the same rate (i.e. of the same size) are batched together.
+        batches = {}
+        for i, (trs, frame) in enumerate(frames):
+            if trs.window_sizes is not None:
+                pitches[i] = trs.gate.pitch(frame, trs.noise_threshold)
+            elif trs.gate.screen(frame, trs.noise_threshold):
+                batches.setdefault(trs.rate, []).append(i)
+
+        for batch in batches.values():
+            trs = frames[batch[0]][0]
+            blocks = _np.stack([frames[i][1].block for i in batch])
+            f, prominence = _hps.hps(blocks, trs.rate, trs.lowest_f, trs.harmonics, precision=trs.gate.precision,
+                                     confidence=True)
+            for i, fi, prominence_i in zip(batch, f, prominence):
+                pitches[i] = frames[i][0].gate.confirm(fi, prominence_i)
+
+        return pitches
@@ -0,0 +1,183 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Module containing utilities for noise level estimation and gating. """
+
+import collections as _collections
+
+import numpy as _np
+
+
+class NoiseFloorTracker(object):
+    """ Online estimate of a safe noise RMS threshold, updated once per read.
+        The noise floor is the minimum RMS over the last 'window' seconds (minimum statistics), which follows the room
+        noise both up and down while music is played, as long as there are short pauses. Reads known to be pitched
+        are left out, so the floor doesn't rise to the level of notes sustained (or slurred) for longer than
+        'window' seconds; the window then spans the latest unpitched reads instead. Reads within 'gate' times the
+        floor are considered noise, and the ones among the last 'history' seconds estimate the noise 'quantile' RMS.
+        The threshold is 'factor' times that, which matches the blocking calibration (1.5 times the 98th percentile)
+        once enough noise was heard. Before that, the floor is assumed to be 'floor', a conservative (quiet) level, so
+        music played from the first read isn't taken for noise; the assumption is dropped after 'window' seconds of
+        unpitched reads, like any other minimum. """
+
+    def __init__(self, reads_per_sec, window=2.0, subwindows=8, history=3.0, quantile=0.98, factor=1.5, gate=4.0,
+                 floor=1e-3):
+        self.quantile = quantile
+        self.factor = factor
+        self.gate = gate
+
+        # Minimum statistics: the minimum of each of the last 'subwindows' subwindows, and of the current one.
+        self.subwindow_reads = max(1, int(round(window*reads_per_sec/subwindows)))
+        self.minima = _collections.deque(maxlen=subwindows)
+        self.current_minimum = _np.inf
+        self.current_reads = 0
+
+        # Ring of the RMS values of the latest reads, whether each one was considered noise, and the amount of reads.
+        self.history = _np.zeros(max(1, int(history*reads_per_sec)))
+        self.is_noise = _np.zeros(self.history.size, bool)
+        self.reads = 0
+
+        self.floor = None
+        self.threshold = None
+        self.seed(factor*floor)
+        return
+
+    def seed(self, threshold):
+        """ Restarts the estimate at a known threshold (e.g. from a calibration). """
+        self.minima.clear()
+        self.current_minimum = _np.inf
+        self.current_reads = 0
+        self.is_noise[:] = False
+        self.reads = 0
+
+        self.minima.append(threshold/self.factor)
+        self.update(threshold/self.factor)
+        return
+
+    def update(self, rms, voiced=False):
+        """ Updates the estimate with the RMS of a new read, unless it's 'voiced' (pitched, so not noise).
+            Returns the current threshold. """
+        if voiced:
+            return self.threshold
+
+        self.current_minimum = min(self.current_minimum, rms)
+        self.current_reads += 1
+        if self.current_reads == self.subwindow_reads:
+            self.minima.append(self.current_minimum)
+            self.current_minimum = _np.inf
+            self.current_reads = 0
+
+        self.floor = min(min(self.minima) if self.minima else _np.inf, self.current_minimum)
+
+        i = self.reads % self.history.size
+        self.history[i] = rms
+        self.is_noise[i] = rms <= self.gate*self.floor
+        self.reads += 1
+
+        # Without noise in the history, keep the last threshold.
+        noise = self.history[self.is_noise]
+        if noise.size:
+            k = int(self.quantile*(noise.size - 1))
+            estimate = _np.partition(noise, k)[k]
+
+            # Noise values in the history are stale if the floor dropped since.
+            self.threshold = self.factor*min(estimate, self.gate*self.floor)
+
+        return self.threshold
+
+
+class GatingCascade(object):
+    """ Decides whether a tick holds a pitched sound, through increasingly expensive levels, so most silent and noisy
+        ticks are dropped before the pitch detection:
+            "rms":        the RMS of the new samples is below the noise threshold;
+            "noisiness":  the new samples look like broadband noise (e.g. breath), i.e. their zero crossing rate is
+                          above 'max_zcr' or their spectral flatness is above 'max_flatness';
+            "confidence": the HPS peak doesn't stand out from the product spectrum by at least 'min_prominence'.
+        If 'sizes' is given, pitches are detected by the multi-resolution HPS on windows of those sizes (see
+        pda.frame.AnalysisFrame.multiresolution_hps), and 'window_counters' holds how many ticks each size resolved.
+        As pitches usually last several ticks, windows too short for the previous pitch are skipped.
+        'counters' holds the amount of ticks dropped by each level, of ticks that passed and of ticks in total.
+        pitch() runs every level. To detect the pitches of several ticks at once (see multistream), screen() runs the
+        levels before the pitch detection, and confirm() the ones after it. """
+
+    levels = ("rms", "noisiness", "confidence")
+
+    def __init__(self, max_zcr=0.35, max_flatness=0.35, min_prominence=5.0, lf=255, harmonics=3, precision=2,
+                 sizes=None):
+        self.max_zcr = max_zcr
+        self.max_flatness = max_flatness
+        self.min_prominence = min_prominence
+        self.lf = lf
+        self.harmonics = harmonics
+        self.precision = precision
+        self.sizes = sizes
+
+        self.counters = dict.fromkeys(self.levels + ("passed", "total"), 0)
+        self.window_counters = dict.fromkeys(sizes or (), 0)
+
+        # Index of the first window size tried on the next tick.
+        self._first_size = 0
+
+        # Level that dropped the latest tick, or None if it passed.
+        self.dropped_by = None
+        return
+
+    def pitch(self, frame, noise_threshold):
+        """ Returns the pitch of a pda.frame.AnalysisFrame, or None if any level drops it. """
+        if not self.screen(frame, noise_threshold):
+            return None
+
+        if self.sizes is None:
+            f, prominence = frame.hps(self.lf, self.harmonics, self.precision, confidence=True)
+        else:
+            f, prominence, size = frame.multiresolution_hps(self.lf, self.harmonics, self.precision,
+                                                            self.sizes[self._first_size:],
+                                                            min_prominence=self.min_prominence)
+            self.window_counters[size] += 1
+
+            self._first_size = 0
+            while (self._first_size < len(self.sizes) - 1 and
+                   not frame.resolves(f, self.sizes[self._first_size], self.precision)):
+                self._first_size += 1
+
+        return self.confirm(f, prominence)
+
+    def screen(self, frame, noise_threshold):
+        """ Returns whether a pda.frame.AnalysisFrame passes the levels before the pitch detection. """
+        self.counters["total"] += 1
+
+        if frame.rms < noise_threshold:
+            self._drop("rms")
+            return False
+
+        if frame.zcr > self.max_zcr or frame.flatness > self.max_flatness:
+            self._drop("noisiness")
+            return False
+
+        return True
+
+    def confirm(self, f, prominence):
+        """ Returns the pitch detected for a screened frame, or None if the levels after the detection drop it. """
+        if prominence < self.min_prominence:
+            return self._drop("confidence")
+
+        self.counters["passed"] += 1
+        self.dropped_by = None
+        return f
+
+    def _drop(self, level):
+        self.counters[level] += 1
+        self.dropped_by = level
+        return None
@@ -15,14 +15,38 @@
 
 """ Module containing Pitch Detection Algorithms (PDAs). """
 
-__all__ = ['hps', 'hwt']
+__all__ = ['frame', 'hps', 'hwt']
 
 
 import numpy as _np
 
 
+_windows = {}
+def kaiser(N, beta=7.14285):
+    """ Returns a Kaiser window of size N. Windows are cached, as the same few sizes are requested on every block. """
+    key = (N, beta)
+    if key not in _windows:
+        _windows[key] = _np.kaiser(N, beta)
+
+    return _windows[key]
+
+
 _log2_500 = _np.log2(500)
 _log2_3000 = _np.log2(3000)
+_ear_weightings = {}
+def ear_weighting(N, fs=44100):
+    """ Returns the attenuation (in decibels) the human ear applies to each bin of an RFFT of N samples:
+        12dB/octave below 500Hz and above 3000Hz. """
+    key = (N, fs)
+    if key not in _ear_weightings:
+        with _np.errstate(divide="ignore"):
+            log2_f = _np.log2(_np.arange(N//2 + 1)*fs/N)
+
+        _ear_weightings[key] = -12*(_np.maximum(_log2_500 - log2_f, 0) + _np.maximum(log2_f - _log2_3000, 0))
+
+    return _ear_weightings[key]
+
+
 def ear_response_rfft(x, fs=44100):
     """ The human ear attenuates certain frequencies. 
         This function produces an RFFT that mimics the human ear behavior.
@@ -34,14 +58,7 @@ def ear_response_rfft(x, fs=44100):
     X = 20*_np.log10(_np.abs(_np.fft.rfft(x)))
 
     # Reduce 12dB/octave below 500Hz and above 3000Hz
-    for i in range(0, X.size):
-        log2_f = _np.log2(i*fs/N)
-        if log2_f < _log2_500:
-            X[i] -= 12*(_log2_500 - log2_f)
-        elif log2_f > _log2_3000:
-            X[i] -= 12*(log2_f - _log2_3000)
-
-    return X
+    return X + ear_weighting(N, fs)
 
 
 def bin_frequency(index, binSize, fs=44100):
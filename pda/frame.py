@@ -0,0 +1,129 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Per tick analysis frame, shared by the stages of the transcription (gating, tonguing, PDAs). """
+
+import numpy as _np
+
+import mtheory as _mt
+import pda as _pda
+import pda.hps as _hps
+import tonguing as _tong
+
+
+class AnalysisFrame(object):
+    """ Features of the samples received in a tick ('samples') and of the block analyzed by PDAs ('block', which ends
+        with 'samples'). Each feature is computed on first access and then cached, so stages can share them freely. """
+
+    def __init__(self, samples, block, fs=44100):
+        self.samples = samples
+        self.block = block
+        self.fs = fs
+
+        self._rms = None
+        self._zcr = None
+        self._flatness = None
+        self._envelope = None
+        self._log_spectra = {}
+        return
+
+    @property
+    def rms(self):
+        """ Root mean square of the new samples. """
+        if self._rms is None:
+            self._rms = _np.sqrt(_np.dot(self.samples, self.samples)/self.samples.size)
+
+        return self._rms
+
+    @property
+    def zcr(self):
+        """ Zero crossing rate of the new samples, i.e. the fraction of consecutive samples with different signs. """
+        if self._zcr is None:
+            if self.samples.size < 2:
+                self._zcr = 0.0
+            else:
+                signs = _np.signbit(self.samples)
+                self._zcr = _np.count_nonzero(signs[1:] != signs[:-1])/(self.samples.size - 1)
+
+        return self._zcr
+
+    @property
+    def flatness(self):
+        """ Spectral flatness of the new samples, i.e. the ratio between the geometric and the arithmetic means of
+            their power spectrum. Close to 1 for white noise and to 0 for tones. The spectrum isn't padded, so this is
+            much cheaper than the block spectrum used by PDAs. """
+        if self._flatness is None:
+            power = _np.abs(_np.fft.rfft(self.samples*_pda.kaiser(self.samples.size)))**2 + 1e-20
+            self._flatness = _np.exp(_np.mean(_np.log(power)))/_np.mean(power)
+
+        return self._flatness
+
+    @property
+    def envelope(self):
+        """ Envelope of the new samples, as the absolute value of their analytic representation. """
+        if self._envelope is None:
+            self._envelope = _tong._envelope(self.samples)
+
+        return self._envelope
+
+    def window(self, size=None):
+        """ The latest 'size' samples of the block (the whole block if 'size' is None). """
+        return self.block if size is None else self.block[self.block.size - size:]
+
+    def log_spectrum(self, precision=2, size=None):
+        """ Log of the absolute RFFT of the windowed block (or of its latest 'size' samples), padded for 'precision'
+            (see pda.hps.log_spectrum). Returns the spectrum and the FFT size. """
+        key = (precision, size)
+        if key not in self._log_spectra:
+            self._log_spectra[key] = _hps.log_spectrum(self.window(size), self.fs, precision)
+
+        return self._log_spectra[key]
+
+    def ear_spectrum(self, precision=2):
+        """ Spectrum of the block in decibels, attenuated like the human ear would (see pda.ear_response_rfft). """
+        X, N = self.log_spectrum(precision)
+        return (20/_np.log(10))*X + _pda.ear_weighting(N, self.fs)
+
+    def hps(self, lf=255, harmonics=3, precision=2, confidence=False, size=None):
+        """ Pitch of the block (or of its latest 'size' samples) by pda.hps.hps, and the prominence of its peak if
+            'confidence' is set. """
+        return _hps.hps(self.window(size), self.fs, lf, harmonics, precision, spectrum=self.log_spectrum(precision, size),
+                        confidence=confidence)
+
+    def resolves(self, f, size, precision=2, cycles=10, tolerance=0.25):
+        """ Whether a window of the latest 'size' samples resolves the pitch 'f' to the nearest semitone, i.e. whether
+            it holds at least 'cycles' periods of it (the estimate error is about a quarter of 'fs/size', so 10 periods
+            keep it within half a semitone) and its FFT bins, scaled for 'precision' on the whole block, are finer than
+            'tolerance' times the distance to the next semitone. """
+        bin_size = precision*self.block.size/size
+        return f*size >= cycles*self.fs and bin_size <= tolerance*f*(_mt.semitone - 1)
+
+    def multiresolution_hps(self, lf=255, harmonics=3, precision=2, sizes=None, cycles=10, tolerance=0.25,
+                            min_prominence=5.0):
+        """ Pitch of the block by pda.hps.hps on the shortest window (latest samples) that resolves it.
+            Windows of 'sizes' samples (by default, a quarter, half and all of the block) are tried from the shortest,
+            with the FFT size scaled along (i.e. 'precision' holds for the whole block). An estimate is accepted if the
+            window resolves it (see resolves()) and its peak prominence is at least 'min_prominence'. Otherwise the
+            next window is tried, so only low or unclear pitches pay for the longest window.
+            Returns the pitch, the prominence of its peak and the size of the window that resolved it. """
+        if sizes is None:
+            sizes = (self.block.size//4, self.block.size//2, self.block.size)
+
+        for size in sizes:
+            f, prominence = self.hps(lf, harmonics, precision*self.block.size/size, True, size)
+            if prominence >= min_prominence and self.resolves(f, size, precision, cycles, tolerance):
+                break
+
+        return f, prominence, size
@@ -13,65 +13,105 @@
 # You should have received a copy of the GNU General Public License
 # along with this program; if not, see <http://www.gnu.org/licenses/>.
 
-""" Functions for pitch detection via Harmonic Product Spectrum (HPS). """
+""" Functions for pitch detection via Harmonic Product Spectrum (HPS).
+    log_spectrum, hps and tunedhps also take a stack of sample arrays (one per row), detecting every pitch in a single
+    batch. """
 
 import numpy as _np
-import scipy.signal as _sig
 
 import mtheory as _mt
+import pda as _pda
 
 
-def hps(x, fs=44100, lf=255, harmonics=3, precision=2, window=lambda l:_np.kaiser(l, 7.14285)):
-    """ Estimates the pitch (fundamental frequency) of the given sample array by a standard HPS implementation. """
-    x -= _np.mean(x)
-    N = x.size
-    w = x*window(N)
+_decimators = {}
+def _decimate(X, q):
+    """ Same as scipy.signal.decimate(X, q) (zero phase Chebyshev type I filter, then downsampling, along the last
+        axis), but the filter and its initial conditions are designed once per factor instead of on every call, which
+        dominated the cost. """
+    # Imported on first use, as scipy.signal takes over a second to import.
+    import scipy.signal as sig
 
-    # Append zeros to the end of the window so that each bin has at least the desired precision.
+    if q not in _decimators:
+        sos = sig.cheby1(8, 0.05, 0.8/q, output="sos")
+        ntaps = 2*len(sos) + 1 - min((sos[:,2] == 0).sum(), (sos[:,5] == 0).sum())
+        _decimators[q] = (sos, sig.sosfilt_zi(sos), 3*ntaps)
+
+    sos, zi, edge = _decimators[q]
+    zi = zi.reshape(zi.shape[:1] + (1,)*(X.ndim - 1) + zi.shape[1:])
+
+    # Forward and backward filtering, padding both ends with their odd extension.
+    ext = _np.concatenate((2*X[...,:1] - X[...,edge:0:-1], X, 2*X[...,-1:] - X[...,-2:-edge - 2:-1]), axis=-1)
+    y, _ = sig.sosfilt(sos, ext, zi=zi*ext[...,:1])
+    y, _ = sig.sosfilt(sos, y[...,::-1], zi=zi*y[...,-1:])
+    return y[...,::-1][...,edge:-edge:q]
+
+
+def minimum_rate(highest, harmonics=3, bandwidth=0.9):
+    """ Returns the lowest sample rate at which hps can detect pitches up to 'highest', i.e. at which the highest
+        harmonic it sums ('harmonics + 1' times the pitch) is within 'bandwidth' times the Nyquist frequency. """
+    return 2*(harmonics + 1)*highest/bandwidth
+
+
+def log_spectrum(x, fs=44100, precision=2, window=_pda.kaiser):
+    """ Returns the log of the absolute RFFT of the given sample array (without its mean, and windowed) and the FFT size.
+        The FFT is zero padded so that each bin has at least the desired precision, up to a size that's fast to
+        compute (some sizes, e.g. multiples of large primes, take several times longer than slightly larger ones). """
+    N = x.shape[-1]
+    w = (x - _np.mean(x, axis=-1, keepdims=True))*window(N)
+
+    # Pad the window with zeros so that each bin has at least the desired precision.
     if fs/N > precision:
-        delta = int(fs/precision) - N
-        w = _np.append(w, _np.zeros(delta))
-        N = w.size
+        from scipy.fft import next_fast_len
+        N = next_fast_len(int(fs/precision))
+
+    return _np.log(_np.abs(_np.fft.rfft(w, N))), N
+
 
-    X = _np.log(_np.abs(_np.fft.rfft(w)))
+def hps(x, fs=44100, lf=255, harmonics=3, precision=2, window=_pda.kaiser, spectrum=None, confidence=False):
+    """ Estimates the pitch (fundamental frequency) of the given sample array by a standard HPS implementation.
+        'spectrum' is the output of log_spectrum for 'x', if it was already computed (see pda.frame).
+        If 'confidence' is set, returns the pitch and the prominence of its peak, i.e. how much the peak stands out
+        from the median of the searched product spectrum (in natural log units, so 1 is a factor of e). """
+    X, N = spectrum if spectrum is not None else log_spectrum(x, fs, precision, window)
 
     # Sequentially decimate 'X' 'harmonics' times and add it to itself.
     # 'precision < fs/N' must hold, lest the decimation loses all the precision we'd gain.
     hps = _np.copy(X)
     for h in range(2, 2 + harmonics):
-        dec = _sig.decimate(X, h)
-        hps[:dec.size] += dec*(0.8**h)
+        dec = _decimate(X, h)
+        hps[...,:dec.shape[-1]] += dec*(0.8**h)
 
     # Find the bin corresponding to the lowest detectable frequency.
-    lb = lf*N/fs
+    lb = int(lf*N/fs)
 
     # And then the bin with the highest spectral content.
-    arg_peak = lb + _np.argmax(hps[lb:dec.size])
+    searched = hps[...,lb:dec.shape[-1]]
+    arg_peak = lb + _np.argmax(searched, axis=-1)
 
     # TODO: Return the full array? A ranked list of identified notes?
+    if confidence:
+        peak = _np.take_along_axis(hps, _np.expand_dims(arg_peak, -1), -1)[...,0]
+        return fs*arg_peak/N, peak - _np.median(searched, axis=-1)
+
     return fs*arg_peak/N
 
 
-def tunedhps(x, fs=44100, lf=255, harmonics=3, precision=1, window=lambda x:_np.kaiser(x, 7.14285)):
+def tunedhps(x, fs=44100, lf=255, harmonics=3, precision=1, window=_pda.kaiser, tuning=None, spectrum=None):
     """ Estimates the pitch (fundamental frequency) of the given sample array by an HPS implementation that evaluates
-        the spectrum only in tuned note frequencies (e.g. frequencies of notes in an assumed tuning). """
-    x -= _np.mean(x)
-    N = x.size
-    w = x*window(N)
+        the spectrum only in tuned note frequencies (e.g. frequencies of notes in an assumed tuning).
+        'tuning' is an mtheory.NoteTable, defaulting to A440 equal temperament.
+        'spectrum' is the output of log_spectrum for 'x', if it was already computed (see pda.frame). """
+    if tuning is None:
+        tuning = _mt.tuning()
 
-    if fs/N > precision:
-        delta = int(fs/precision) - N
-        w = _np.append(w, _np.zeros(delta))
-        N = w.size
+    X, N = spectrum if spectrum is not None else log_spectrum(x, fs, precision, window)
 
-    frequencies = [f for f in _mt.notes if f >= lf and f < fs/(2*harmonics)]
+    frequencies = tuning.frequency[(tuning.frequency >= lf) & (tuning.frequency < fs/(2*harmonics))]
 
-    X = _np.log(_np.abs(_np.fft.rfft(w)))
-    Y = _np.ones(len(frequencies))
-    for i in range(0, len(frequencies)):
-        for h in range(1, harmonics+1):
-            f_idx = int(round(frequencies[i]*h/2)*2*N/fs)
-            Y[i] += X[f_idx]*(0.9**(h-1))
+    Y = _np.ones(X.shape[:-1] + frequencies.shape)
+    for h in range(1, harmonics+1):
+        f_idx = (_np.round(frequencies*h/2)*2*N/fs).astype(_np.intp)
+        Y += X[...,f_idx]*(0.9**(h-1))
 
-    arg_peak = _np.argmax(Y)
+    arg_peak = _np.argmax(Y, axis=-1)
     return frequencies[arg_peak]
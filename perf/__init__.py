@@ -0,0 +1,177 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Module containing low overhead latency instrumentation for real time processing loops. """
+
+__all__ = ['tracing']
+
+
+import json as _json
+import math as _math
+import time as _time
+
+
+class LatencyHistogram(object):
+    """ Histogram of latencies (in seconds), with logarithmically spaced bins: 'bins_per_decade' bins per decade from
+        'lowest' to 'highest' seconds (latencies out of that range are counted in the first or last bin).
+        Recording a latency costs a logarithm and a few integer operations, so it can be done on every tick. """
+
+    def __init__(self, lowest=1e-6, highest=10.0, bins_per_decade=20):
+        self.lowest = lowest
+        self.bins_per_decade = bins_per_decade
+        self._log_lowest = _math.log10(lowest)
+        self.counts = [0]*int(round(_math.log10(highest/lowest)*bins_per_decade))
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        return
+
+    def record(self, latency):
+        """ Counts a latency. """
+        i = int((_math.log10(latency) - self._log_lowest)*self.bins_per_decade) if latency > self.lowest else 0
+        self.counts[min(i, len(self.counts) - 1)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.max:
+            self.max = latency
+        return
+
+    def edge(self, i):
+        """ Lower edge (in seconds) of the i-th bin. """
+        return self.lowest*10**(i/self.bins_per_decade)
+
+    def percentile(self, p):
+        """ Latency under which 'p' percent of the latencies were, as the upper edge of the bin holding it (so it's
+            overestimated by up to a bin width, about 12% with the default bins). Returns None if nothing was counted. """
+        if not self.count:
+            return None
+
+        rank = p*self.count/100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.edge(i + 1), self.max)
+
+        return self.max
+
+    def summary(self):
+        """ Dictionary with the count, mean, p50, p95, p99 and max latencies, and the non-empty bins (as lower edge and
+            count pairs). """
+        return {"count":    self.count,
+                "mean":     self.total/self.count if self.count else None,
+                "p50":      self.percentile(50),
+                "p95":      self.percentile(95),
+                "p99":      self.percentile(99),
+                "max":      self.max,
+                "bins":     [(self.edge(i), count) for i, count in enumerate(self.counts) if count]}
+
+
+class StageTimer(object):
+    """ Times the stages of a processing loop that must keep up with a real time 'budget' (seconds per tick).
+        Each tick is timed by calling start(), then lap(stage) as each stage ends (a stage's latency is the time since
+        the previous lap), then stop(). Stages skipped in a tick aren't counted. Ticks longer than the budget are
+        counted as overruns.
+        If 'path' is given, a snapshot (see snapshot()) is appended to it as a JSON line every 'interval' seconds.
+        If a perf.tracing.Tracer is given, stages and ticks are also recorded as spans. """
+
+    def __init__(self, stages, budget=None, path=None, interval=10.0, tracer=None):
+        self.stages = stages
+        self.budget = budget
+        self.path = path
+        self.interval = interval
+        self.tracer = tracer
+
+        self.histograms = dict((stage, LatencyHistogram()) for stage in stages)
+        self.tick = LatencyHistogram()
+        self.ticks = 0
+        self.overruns = 0
+
+        self._tick_start = None
+        self._lap_start = None
+        self._last_export = _time.time()
+        return
+
+    def start(self):
+        """ Starts timing a tick. """
+        self._tick_start = self._lap_start = _time.perf_counter()
+        return
+
+    def lap(self, stage):
+        """ Ends a stage of the current tick. """
+        now = _time.perf_counter()
+        self.histograms[stage].record(now - self._lap_start)
+        if self.tracer is not None:
+            self.tracer.complete(stage, self._lap_start, now)
+        self._lap_start = now
+        return
+
+    def resume(self):
+        """ Restarts the current stage without recording the time since the previous lap (e.g. spent on other ticks,
+            see multistream). """
+        self._lap_start = _time.perf_counter()
+        return
+
+    def stop(self):
+        """ Ends the current tick. """
+        now = _time.perf_counter()
+        latency = now - self._tick_start
+        self.tick.record(latency)
+        if self.tracer is not None:
+            self.tracer.complete("tick", self._tick_start, now, "tick", {"overrun": latency > self.budget}
+                                 if self.budget is not None else None)
+        self.ticks += 1
+        if self.budget is not None and latency > self.budget:
+            self.overruns += 1
+
+        if self.path is not None and _time.time() - self._last_export >= self.interval:
+            self.export()
+
+        return
+
+    def snapshot(self):
+        """ Dictionary with the tick count, budget and overruns, and the summary of the latencies of whole ticks and of
+            each stage (see LatencyHistogram.summary()). """
+        return {"time":     _time.time(),
+                "ticks":    self.ticks,
+                "budget":   self.budget,
+                "overruns": self.overruns,
+                "tick":     self.tick.summary(),
+                "stages":   dict((stage, self.histograms[stage].summary()) for stage in self.stages)}
+
+    def export(self):
+        """ Appends a snapshot to 'path' as a JSON line. """
+        with open(self.path, "a") as f:
+            f.write(_json.dumps(self.snapshot()) + "\n")
+
+        self._last_export = _time.time()
+        return
+
+    def report(self):
+        """ Returns a human readable table of the latency percentiles (in milliseconds) of each stage. """
+        lines = ["%-14s %8s %8s %8s %8s %8s" % ("stage", "count", "p50", "p95", "p99", "max")]
+        for stage, histogram in [(stage, self.histograms[stage]) for stage in self.stages] + [("tick", self.tick)]:
+            if histogram.count:
+                lines.append("%-14s %8d %8.3f %8.3f %8.3f %8.3f" % (stage, histogram.count,
+                                                                    1e3*histogram.percentile(50),
+                                                                    1e3*histogram.percentile(95),
+                                                                    1e3*histogram.percentile(99),
+                                                                    1e3*histogram.max))
+
+        if self.budget is not None:
+            lines.append("overruns: %d of %d ticks (budget %.3fms)" % (self.overruns, self.ticks, 1e3*self.budget))
+
+        return "\n".join(lines)
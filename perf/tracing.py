@@ -0,0 +1,108 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Span tracing into an in-memory ring, exported as Chrome trace event JSON (viewable in chrome://tracing or
+    Perfetto). Instrumented code holds a tracer reference that is None when tracing is disabled, so disabled tracing
+    costs a comparison per span. """
+
+import collections as _collections
+import gc as _gc
+import json as _json
+import os as _os
+import threading as _threading
+import time as _time
+
+
+class Tracer(object):
+    """ Records spans (named intervals of time.perf_counter() times) into a ring holding the latest 'capacity' spans.
+        Every span is tagged with a copy of 'tags' at the time it's recorded (e.g. the tick being processed), besides
+        its own arguments. If 'gc' is set, garbage collections are recorded as spans too. """
+
+    def __init__(self, capacity=65536, gc=False):
+        self.events = _collections.deque(maxlen=capacity)
+        self.tags = {}
+
+        # Trace timestamps are relative to the creation of the tracer.
+        self._origin = _time.perf_counter()
+        self._pid = _os.getpid()
+
+        self._gc_start = None
+        self._gc = gc
+        if gc:
+            _gc.callbacks.append(self._gc_callback)
+
+        return
+
+    def close(self):
+        """ Stops recording garbage collections. """
+        if self._gc:
+            _gc.callbacks.remove(self._gc_callback)
+            self._gc = False
+        return
+
+    def complete(self, name, start, end, category="stage", args=None):
+        """ Records a span that started and ended at the given time.perf_counter() times. """
+        tags = dict(self.tags)
+        if args:
+            tags.update(args)
+
+        self.events.append((name, category, start, end - start, _threading.get_ident(), tags))
+        return
+
+    def span(self, name, category="stage", args=None):
+        """ Context manager recording a span around its block. """
+        return _Span(self, name, category, args)
+
+    def trace_events(self):
+        """ Returns the recorded spans as a list of Chrome trace events (complete events, in microseconds). """
+        return [{"name":    name,
+                 "cat":     category,
+                 "ph":      "X",
+                 "ts":      1e6*(start - self._origin),
+                 "dur":     1e6*duration,
+                 "pid":     self._pid,
+                 "tid":     tid,
+                 "args":    args}
+                for name, category, start, duration, tid, args in list(self.events)]
+
+    def dump(self, path):
+        """ Writes the recorded spans to 'path' in the Chrome trace event JSON format. """
+        with open(path, "w") as f:
+            _json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms"}, f)
+        return
+
+    def _gc_callback(self, phase, info):
+        if phase == "start":
+            self._gc_start = _time.perf_counter()
+        elif self._gc_start is not None:
+            self.complete("gc", self._gc_start, _time.perf_counter(), "gc",
+                          {"generation": info["generation"], "collected": info["collected"]})
+            self._gc_start = None
+        return
+
+
+class _Span(object):
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = _time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.complete(self.name, self.start, _time.perf_counter(), self.category, self.args)
@@ -15,7 +15,6 @@
 
 """ Function for plots related to clustering algorithms. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 
 import clustering.kde as _kde
@@ -24,6 +23,8 @@ import clustering.kde as _kde
 # Sample data (Ode to Joy): x = _np.log2([20, 23, 21, 23, 23, 22, 24, 22, 22, 20, 22, 22, 34, 10, 44, 21, 21, 21, 23, 23, 22, 25, 22, 50, 22, 22, 33, 10, 50, 21, 21, 20, 25, 22, 10, 11, 25, 25, 22, 10, 10, 24, 22, 25, 22, 26, 44, 23, 20, 22, 22, 21, 20, 11, 10, 50, 22, 24, 33, 11, 53])
 def plot_histogram(x, bounds=(1, 12)):
     """Plots a histogram for a given array."""
+    import matplotlib.pyplot as _pl
+
     plot_width = bounds[1] - bounds[0]
     hist_points = _np.linspace(bounds[0], bounds[1], 10*plot_width)
     _pl.hist(x, bins=hist_points, range=bounds, fc='gray', histtype='stepfilled', alpha=0.5, normed=False)
@@ -36,6 +37,8 @@ def plot_histogram(x, bounds=(1, 12)):
 
 def plot_kde(x, bw=0.15, bounds=(1, 12)):
     """Plots a histogram and the KDE for a given array."""
+    import matplotlib.pyplot as _pl
+
     plot_width = bounds[1] - bounds[0]
 
     hist_points = _np.linspace(bounds[0], bounds[1], 10*plot_width)
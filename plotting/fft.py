@@ -15,7 +15,6 @@
 
 """ Contains functions to plot FFTs. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 
 import soundfiles as _sf
@@ -23,6 +22,8 @@ import soundfiles as _sf
 
 def plotfft(audiopath, audiopath2="", audiopath3="", binsize=44100, plotpath=None):
     """ Plot the FFT for up to 3 given audio file paths. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     # Merge multiple channels
@@ -39,8 +40,8 @@ def plotfft(audiopath, audiopath2="", audiopath3="", binsize=44100, plotpath=Non
     # remove mirror
     dBX = dBX[0:dBX.size/2]
 
-    pl.figure(figsize=(15, 7.5))
-    pl.plot(dBX, 'b')
+    _pl.figure(figsize=(15, 7.5))
+    _pl.plot(dBX, 'b')
 
     if audiopath2 != "":
         # Yes, I'm lazy and just copy pasted
@@ -60,7 +61,7 @@ def plotfft(audiopath, audiopath2="", audiopath3="", binsize=44100, plotpath=Non
         # remove mirror
         dBX2 = dBX2[0:dBX2.size/2]
 
-        pl.plot(dBX2, 'g')
+        _pl.plot(dBX2, 'g')
 
     if audiopath3 != "":
         # Yes, I'm lazy and just copy pasted
@@ -80,22 +81,22 @@ def plotfft(audiopath, audiopath2="", audiopath3="", binsize=44100, plotpath=Non
         # remove mirror
         dBX3 = dBX3[0:dBX3.size/2]
 
-        pl.plot(dBX3, 'r')
+        _pl.plot(dBX3, 'r')
 
-    pl.xlabel("Frequency (Hz)")
-    pl.ylabel("Amplitude (dB)")
-    pl.xlim([0, binsize])
-    pl.ylim([0, _np.max(dBX)])
+    _pl.xlabel("Frequency (Hz)")
+    _pl.ylabel("Amplitude (dB)")
+    _pl.xlim([0, binsize])
+    _pl.ylim([0, _np.max(dBX)])
 
     # Use the highest index as the reference.
     # We assume the highest index corresponds to the fundamental.
     reference = _np.argmax(dBX if audiopath2 == "" else dBX2)
     xlocs = _np.float32([n * reference for n in range(0, 50)])
-    pl.xticks(xlocs, ["%.0f" % l for l in xlocs])
+    _pl.xticks(xlocs, ["%.0f" % l for l in xlocs])
 
     if plotpath:
-        pl.savefig(plotpath, bbox_inches="tight")
+        _pl.savefig(plotpath, bbox_inches="tight")
     else:
-        pl.show()
+        _pl.show()
 
-    pl.clf()
+    _pl.clf()
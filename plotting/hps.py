@@ -15,7 +15,6 @@
 
 """ Contains functions to plot graphs related to the Harmonic Product Spectrum. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 import scipy.signal as _sig
 
@@ -27,6 +26,8 @@ import soundfiles as _sf
 
 def plothps(audiopath, title="Harmonic Product Spectrum", horizontal_harmonics=7, plotpath=None):
     """ Plots a visual representation of the HPS with 3 harmonics. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     X = _np.fft.fft(samples, samplerate)
@@ -74,6 +75,8 @@ def plothps(audiopath, title="Harmonic Product Spectrum", horizontal_harmonics=7
 
 def plot_tracking(audiopath, title="", binsize=1470, tune=False, plotpath=None, repetitions=10):
     """ Plots the HPS tracking of an audio file. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     detections = samples.size//binsize
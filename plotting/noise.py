@@ -15,7 +15,6 @@
 
 """ Contains functions to plot noise graphs. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 
 import soundfiles as _sf
@@ -23,6 +22,8 @@ import soundfiles as _sf
 
 def plot_noise(audiopath, windowsize=735, title="", plotpath=None):
     """ Too hard to explain, just call it and see what happens, or read the code. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     if samples.size < 3.5*samplerate:
@@ -9,7 +9,6 @@
 """ Utilities for plotting spectograms. """
 
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 import numpy.lib.stride_tricks as _st
 
@@ -70,6 +69,8 @@ def logscale_spec(spec, sr=44100, factor=20.):
 
 def plotgrayimage(ims, colormap='jet', plotpath=None):
     """ Plot gray image. """
+    import matplotlib.pyplot as _pl
+
     _pl.figure(figsize=(15, 7.5))
     _pl.imshow(_np.abs(ims), origin="lower", aspect="auto", cmap=colormap, interpolation="none")
     _pl.colorbar()
@@ -82,6 +83,8 @@ def plotgrayimage(ims, colormap='jet', plotpath=None):
 
 def plotstft(audiopath="wave.npz", binsize=1470, guidelines=False, plotpath=None, colormap="jet"):
     """ Plots the spectrogram of a given file. """
+    import matplotlib.pyplot as _pl
+
     import soundfiles as sf
     samplerate, samples = sf.readfile(audiopath)
 
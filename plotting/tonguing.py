@@ -15,7 +15,6 @@
 
 """ Contains functions to plot graphs related to tonguing detection. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 
 import soundfiles as _sf
@@ -24,6 +23,8 @@ import tonguing as _tong
 
 def plot_tonguing(audiopath, title="", duration=3, plotpath=None):
     """ Plots a visual representation of the tonguing detection algorithm. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     if samples.size/samplerate < 3:
@@ -31,7 +32,9 @@ def plot_tonguing(audiopath, title="", duration=3, plotpath=None):
 
     samples = samples[0:samplerate*duration]
     envelope = _tong._envelope(samples)
-    smooth = _tong._exponential_smoothing(envelope, x_s0=_np.mean(samples[0:50]))
+    # Smoothed as the detector does it, at the rate of the file.
+    detector = _tong.TonguingDetector(fs=samplerate)
+    smooth = _tong._exponential_smoothing(envelope, x_s0=_np.mean(samples[0:50]), alpha=detector.alpha)
 
     f, (ax0, ax1, ax2, ax3) = _pl.subplots(4, sharex=True)
 
@@ -64,6 +67,8 @@ def plot_tonguing(audiopath, title="", duration=3, plotpath=None):
 
 def plot_amplitude(audiopath, title="", duration=3, plotpath=None):
     """ Plots the amplitude of an audio signal over time. """
+    import matplotlib.pyplot as _pl
+
     samplerate, samples = _sf.readfile(audiopath)
 
     if samples.size/samplerate < 3:
@@ -15,12 +15,13 @@
 
 """ Contains functions to plot graphs related to the signal windowing. """
 
-import matplotlib.pyplot as _pl
 import numpy as _np
 
 
 def plot_kaiser_series(windowsize, beta=7.14285, n=4, title="", plotpath=None):
     """ Plots a series of 'n' Kaiser windows. """
+    import matplotlib.pyplot as _pl
+
     window_center = windowsize//2
 
     s = _kaiser_series(windowsize, beta, n)
@@ -48,6 +49,8 @@ def plot_kaiser_series(windowsize, beta=7.14285, n=4, title="", plotpath=None):
 
 def plot_double_kaiser_series(windowsize, beta=7.14285, n=4, title="", plotpath=None):
     """ Plots a series of 'n' Kaiser windows with 0.5 superposition. """
+    import matplotlib.pyplot as _pl
+
     window_center = windowsize//2
 
     s = _kaiser_series(windowsize, beta, n)
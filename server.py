@@ -0,0 +1,474 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Transcription service: 'python server.py [--host HOST] [--port PORT] [--max-streams N]'.
+    Every connection to /transcribe is transcribed by its own transcriber (see streaming.TranscriptionStream), from
+    mono PCM at 44100Hz ('format' query parameter: "f32" for float32, the default, or "s16" for int16, both little
+    endian) sent as:
+        WebSocket:      binary messages on GET /transcribe, ended by a close frame;
+        HTTP:           the body (chunked or not) of POST /transcribe.
+    Events are sent back as they happen, as JSON text messages (WebSocket) or as lines of a chunked response (HTTP):
+        {"type": "start", "rate": ..., "blocks_per_sec": ...}:   the stream started;
+        {"type": "tick", "tick": ..., "pitch": ..., "note": ...}:   pitch of every tick (unless the 'ticks' query
+                                                                    parameter is 0), null if it was gated;
+        {"type": "note", "name": ..., "start": ..., "end": ..., ...}:   a note was confirmed (positions in ticks);
+        {"type": "end", "counters": ...}:   the stream ended (the counters are its noise.GatingCascade counters).
+    Samples are only read once the previous ones were analyzed and their events were sent, so clients sending faster
+    than the transcription (or reading events slower) are slowed down by TCP flow control. Connections beyond the
+    stream limit are answered with "503 Service Unavailable". GET /metrics returns the service metrics in the
+    Prometheus text format.
+    Load test it with 'python -m benchmarks.loadtest'. """
+
+import argparse as _argparse
+import asyncio as _asyncio
+import base64 as _base64
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import struct as _struct
+import time as _time
+import urllib.parse as _urlparse
+
+import numpy as _np
+
+import perf as _perf
+import streaming as _streaming
+
+
+_WEBSOCKET_GUID = b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# WebSocket opcodes.
+CONTINUATION, TEXT, BINARY, CLOSE, PING, PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+# WebSocket close codes.
+NORMAL_CLOSURE, PROTOCOL_ERROR, UNSUPPORTED_DATA, MESSAGE_TOO_BIG = 1000, 1002, 1003, 1009
+
+_REASONS = {101: "Switching Protocols", 200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            413: "Payload Too Large", 503: "Service Unavailable"}
+
+# Sample formats, by the name given in the 'format' query parameter: dtype and scale to float32.
+FORMATS = {"f32": (_np.dtype("<f4"), 1.0), "s16": (_np.dtype("<i2"), 1/32768)}
+
+
+class ProtocolError(Exception):
+    """ Raised when a peer breaks the HTTP or WebSocket protocol, or the service limits. 'status' is the HTTP status
+        or WebSocket close code to answer with. """
+
+    def __init__(self, message, status=400):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+def websocket_accept(key):
+    """ Returns the Sec-WebSocket-Accept value answering a Sec-WebSocket-Key. """
+    return _base64.b64encode(_hashlib.sha1(key.encode("ascii") + _WEBSOCKET_GUID).digest()).decode("ascii")
+
+
+def _mask(payload, key):
+    """ Masks (or unmasks) a WebSocket payload with a 4 byte key. """
+    data = _np.frombuffer(payload, _np.uint8)
+    return (data ^ _np.resize(_np.frombuffer(key, _np.uint8), data.size)).tobytes()
+
+
+def websocket_frame(opcode, payload=b"", mask=False):
+    """ Returns a final WebSocket frame. Clients must mask their frames, servers must not. """
+    if mask:
+        key = _os.urandom(4)
+        payload = key + _mask(payload, key)
+
+    size = len(payload) - (4 if mask else 0)
+    masked = 0x80 if mask else 0
+    if size < 126:
+        header = _struct.pack("!BB", 0x80 | opcode, masked | size)
+    elif size < 1 << 16:
+        header = _struct.pack("!BBH", 0x80 | opcode, masked | 126, size)
+    else:
+        header = _struct.pack("!BBQ", 0x80 | opcode, masked | 127, size)
+
+    return header + payload
+
+
+async def read_websocket_message(reader, writer, max_size, mask=False):
+    """ Reads a WebSocket message, joining its fragments and answering pings (with frames masked if 'mask' is set).
+        Returns the opcode (TEXT, BINARY or CLOSE) and the payload. """
+    opcode = None
+    fragments = []
+    size = 0
+    while True:
+        first, second = await reader.readexactly(2)
+        fin, frame_opcode, masked, frame_size = first & 0x80, first & 0x0F, second & 0x80, second & 0x7F
+        if frame_size == 126:
+            frame_size, = _struct.unpack("!H", await reader.readexactly(2))
+        elif frame_size == 127:
+            frame_size, = _struct.unpack("!Q", await reader.readexactly(8))
+
+        if size + frame_size > max_size:
+            raise ProtocolError("Message larger than %d bytes" % max_size, MESSAGE_TOO_BIG)
+
+        key = await reader.readexactly(4) if masked else None
+        payload = await reader.readexactly(frame_size)
+        if key is not None:
+            payload = _mask(payload, key)
+
+        # Control frames may come between the fragments of a message.
+        if frame_opcode == PING:
+            writer.write(websocket_frame(PONG, payload, mask))
+            await writer.drain()
+        elif frame_opcode == CLOSE:
+            return CLOSE, payload
+        elif frame_opcode != PONG:
+            if (frame_opcode == CONTINUATION) != (opcode is not None):
+                raise ProtocolError("Unexpected %s frame" % ("continuation" if opcode is None else "data"),
+                                    PROTOCOL_ERROR)
+
+            opcode = opcode if opcode is not None else frame_opcode
+            fragments.append(payload)
+            size += frame_size
+            if fin:
+                return opcode, b"".join(fragments)
+
+
+async def read_http_head(reader, max_size=16384):
+    """ Reads the head of an HTTP message. Returns its first line and its headers (with lowercase names). """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except _asyncio.LimitOverrunError:
+        raise ProtocolError("Header larger than the limit")
+
+    if len(head) > max_size:
+        raise ProtocolError("Header larger than %d bytes" % max_size)
+
+    lines = head.decode("latin-1").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    return lines[0], headers
+
+
+async def read_http_body(reader, headers, max_chunk):
+    """ Yields the body of an HTTP message as it arrives, either chunked or of the given Content-Length. """
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await reader.readline()
+            try:
+                size = int(line.split(b";")[0], 16)
+            except ValueError:
+                raise ProtocolError("Invalid chunk size")
+            if size > max_chunk:
+                raise ProtocolError("Chunk larger than %d bytes" % max_chunk, 413)
+
+            if size == 0:
+                # Skip the trailers.
+                while await reader.readline() not in (b"\r\n", b""):
+                    pass
+                return
+
+            chunk = await reader.readexactly(size)
+            await reader.readexactly(2)
+            yield chunk
+    else:
+        remaining = int(headers.get("content-length", 0))
+        while remaining:
+            chunk = await reader.read(min(remaining, max_chunk))
+            if not chunk:
+                raise _asyncio.IncompleteReadError(chunk, remaining)
+            remaining -= len(chunk)
+            yield chunk
+
+    return
+
+
+class PCMDecoder(object):
+    """ Converts PCM bytes into float32 samples. Bytes of a sample split between two chunks are kept until the next
+        chunk. """
+
+    def __init__(self, format="f32"):
+        self.dtype, self.scale = FORMATS[format]
+        self._partial = b""
+        return
+
+    def decode(self, data):
+        data = self._partial + data
+        end = len(data) - len(data) % self.dtype.itemsize
+        self._partial = data[end:]
+
+        samples = _np.frombuffer(data, self.dtype, end//self.dtype.itemsize)
+        if self.dtype == _np.float32:
+            return samples
+        return samples.astype(_np.float32)*self.scale
+
+
+def _jsonable(event):
+    """ Event dict with plain Python values (e.g. instead of numpy scalars). """
+    return dict((key, value.item() if isinstance(value, _np.generic) else value) for key, value in event.items())
+
+
+class TranscriptionServer(object):
+    """ Transcription service (see the module documentation) listening on 'host' and 'port' (0 picks a free port,
+        see 'port' after start()). Up to 'max_streams' streams are transcribed at once. Messages (or chunks) larger
+        than 'max_message' bytes and connections idle for 'idle_timeout' seconds are dropped.
+        Streams are analyzed in 'executor' (see streaming.TranscriptionStream), and other keyword arguments are given
+        to their transcriber.Transcriber, whose debugging outputs and output files are off unless given. """
+
+    def __init__(self, host="127.0.0.1", port=8765, max_streams=32, max_message=1 << 20, idle_timeout=30.0,
+                 blocks_per_sec=60.0, samples_per_block=1470, executor=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.max_streams = max_streams
+        self.max_message = max_message
+        self.idle_timeout = idle_timeout
+        self.blocks_per_sec = blocks_per_sec
+        self.samples_per_block = samples_per_block
+        self.executor = executor
+        self.kwargs = kwargs
+
+        self.streams = 0
+        self.counters = dict.fromkeys(("connections", "streams", "rejected", "errors", "bytes", "ticks", "notes",
+                                       "overruns"), 0)
+
+        # Time taken to analyze each received chunk (and send its events).
+        self.chunk_latency = _perf.LatencyHistogram()
+
+        self._server = None
+        return
+
+    async def start(self):
+        """ Starts listening. """
+        self._server = await _asyncio.start_server(self._handle, self.host, self.port, limit=self.max_message)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        """ Listens until cancelled. """
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def close(self):
+        """ Stops listening. """
+        self._server.close()
+        await self._server.wait_closed()
+        return
+
+    # Help text of each counter in 'counters'.
+    _COUNTER_HELP = {"connections":  "Connections accepted.",
+                     "streams":      "Streams transcribed.",
+                     "rejected":     "Streams rejected for exceeding the stream limit.",
+                     "errors":       "Connections ended by an error.",
+                     "bytes":        "Audio bytes received.",
+                     "ticks":        "Ticks analyzed.",
+                     "notes":        "Notes detected.",
+                     "overruns":     "Ticks that took longer than a tick to analyze."}
+
+    def metrics(self):
+        """ Returns the service metrics in the Prometheus text format. """
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append("# HELP pytranscribe_%s %s" % (name, help))
+            lines.append("# TYPE pytranscribe_%s %s" % (name, kind))
+            lines.extend("pytranscribe_%s%s %s" % (name, suffix, value) for suffix, value in samples)
+
+        metric("streams_active", "gauge", "Streams being transcribed.", [("", self.streams)])
+        metric("streams_max", "gauge", "Streams transcribed at once at most.", [("", self.max_streams)])
+        for name, value in sorted(self.counters.items()):
+            metric("%s_total" % name, "counter", self._COUNTER_HELP[name], [("", value)])
+
+        histogram = self.chunk_latency
+        samples = [('{quantile="%g"}' % quantile,
+                    "%.6f" % histogram.percentile(100*quantile) if histogram.count else "NaN")
+                   for quantile in (0.5, 0.95, 0.99)]
+        samples += [("_sum", "%.6f" % histogram.total), ("_count", histogram.count)]
+        metric("chunk_seconds", "summary", "Time taken to analyze a received chunk and send its events.", samples)
+        return "\n".join(lines) + "\n"
+
+    async def _handle(self, reader, writer):
+        """ Serves a connection. """
+        self.counters["connections"] += 1
+        try:
+            try:
+                request, headers = await _asyncio.wait_for(read_http_head(reader), self.idle_timeout)
+                method, target, _ = request.split(" ", 2)
+                url = _urlparse.urlsplit(target)
+                query = dict(_urlparse.parse_qsl(url.query))
+
+                if url.path == "/metrics" and method == "GET":
+                    await self._respond(writer, 200, self.metrics(), "text/plain; version=0.0.4")
+                elif url.path != "/transcribe":
+                    await self._respond(writer, 404, "Not found\n")
+                elif self.streams >= self.max_streams:
+                    self.counters["rejected"] += 1
+                    await self._respond(writer, 503, "Too many streams\n", headers={"Retry-After": "1"})
+                elif method == "GET" and headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, headers, self._options(query))
+                elif method == "POST":
+                    await self._http(reader, writer, headers, self._options(query))
+                else:
+                    await self._respond(writer, 405, "Use a WebSocket (GET) or POST\n")
+            except ProtocolError as e:
+                self.counters["errors"] += 1
+                await self._respond(writer, e.status, "%s\n" % e)
+        except (_asyncio.IncompleteReadError, _asyncio.TimeoutError, ConnectionError, ValueError):
+            self.counters["errors"] += 1
+        finally:
+            writer.close()
+
+        return
+
+    def _options(self, query):
+        """ Stream options from the query parameters. """
+        if query.get("format", "f32") not in FORMATS:
+            raise ProtocolError("Unknown format: %s" % query["format"])
+        return {"format": query.get("format", "f32"), "ticks": query.get("ticks", "1") != "0"}
+
+    async def _respond(self, writer, status, body, content_type="text/plain", headers=None):
+        """ Sends a whole HTTP response. """
+        body = body.encode("utf-8")
+        head = ["HTTP/1.1 %d %s" % (status, _REASONS[status]), "Content-Type: %s" % content_type,
+                "Content-Length: %d" % len(body), "Connection: close"]
+        head += ["%s: %s" % item for item in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+        return
+
+    async def _websocket(self, reader, writer, headers, options):
+        """ Transcribes the binary messages of a WebSocket connection. """
+        if "sec-websocket-key" not in headers:
+            raise ProtocolError("Missing Sec-WebSocket-Key")
+
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      "Sec-WebSocket-Accept: %s\r\n\r\n" % websocket_accept(headers["sec-websocket-key"])).encode())
+
+        async def chunks():
+            while True:
+                opcode, payload = await _asyncio.wait_for(read_websocket_message(reader, writer, self.max_message),
+                                                          self.idle_timeout)
+                if opcode == CLOSE:
+                    return
+                if opcode != BINARY:
+                    raise ProtocolError("Samples must be sent as binary messages", UNSUPPORTED_DATA)
+                yield payload
+
+        async def send(event):
+            writer.write(websocket_frame(TEXT, _json.dumps(event).encode("utf-8")))
+            await writer.drain()
+
+        code = NORMAL_CLOSURE
+        try:
+            await self._transcribe(chunks(), send, options)
+        except ProtocolError as e:
+            self.counters["errors"] += 1
+            code = e.status
+
+        writer.write(websocket_frame(CLOSE, _struct.pack("!H", code)))
+        await writer.drain()
+        return
+
+    async def _http(self, reader, writer, headers, options):
+        """ Transcribes the body of an HTTP request, streaming the events back in a chunked response. """
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n"
+                     b"Connection: close\r\n\r\n")
+
+        async def chunks():
+            body = read_http_body(reader, headers, self.max_message)
+            while True:
+                try:
+                    chunk = await _asyncio.wait_for(body.__anext__(), self.idle_timeout)
+                except StopAsyncIteration:
+                    return
+                yield chunk
+
+        async def send(event):
+            line = _json.dumps(event).encode("utf-8") + b"\n"
+            writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+            await writer.drain()
+
+        try:
+            await self._transcribe(chunks(), send, options)
+        except ProtocolError as e:
+            # The response already started, so the error is reported as an event.
+            self.counters["errors"] += 1
+            await send({"type": "error", "message": str(e)})
+
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return
+
+    async def _transcribe(self, chunks, send, options):
+        """ Transcribes the samples of an async iterable of PCM chunks, sending the events through 'send'. """
+        self.streams += 1
+        self.counters["streams"] += 1
+        stream = _streaming.TranscriptionStream(self.blocks_per_sec, self.samples_per_block, executor=self.executor,
+                                                ticks=options["ticks"], **self.kwargs)
+        decoder = PCMDecoder(options["format"])
+        ticks = 0
+        try:
+            await send({"type": "start", "rate": stream.source.rate, "blocks_per_sec": self.blocks_per_sec})
+            async for chunk in chunks:
+                start = _time.perf_counter()
+                self.counters["bytes"] += len(chunk)
+                await stream.push(decoder.decode(chunk))
+                ticks = await self._send_events(stream, send, ticks)
+                self.chunk_latency.record(_time.perf_counter() - start)
+
+            await stream.close()
+            await self._send_events(stream, send, ticks)
+            await send({"type": "end", "counters": stream.transcriber.gate.counters})
+        finally:
+            self.streams -= 1
+            self.counters["overruns"] += stream.transcriber.perf.overruns
+            await stream.close()
+
+        return
+
+    async def _send_events(self, stream, send, ticks):
+        """ Sends the events of a stream available so far. Returns the amount of ticks it transcribed. """
+        for event in stream.events_nowait():
+            if "tick" in event:
+                await send(dict(_jsonable(event), type="tick"))
+            else:
+                self.counters["notes"] += 1
+                await send(dict(_jsonable(event), type="note"))
+
+        self.counters["ticks"] += stream.transcriber.total_ticks - ticks
+        return stream.transcriber.total_ticks
+
+
+def main(argv=None):
+    parser = _argparse.ArgumentParser(description="Transcribes audio streamed through WebSockets or HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on")
+    parser.add_argument("--max-streams", type=int, default=32, help="streams transcribed at once")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = await TranscriptionServer(args.host, args.port, args.max_streams).start()
+        print("### Listening on %s:%d" % (args.host, server.port))
+        await server.serve_forever()
+
+    try:
+        _asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    main()
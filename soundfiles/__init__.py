@@ -16,36 +16,103 @@
 """ Functions for operating on sound files. """
 
 
-def readfile(audiopath="wave.npz"):
-    """ Returns the sample rate and samples contained in a given audio file. Format support is restricted. """
+def _open(audiopath, samplerate=44100):
+    """ Returns the sample rate and the raw samples contained in a given audio file, memory-mapped whenever the format
+        allows it. 'samplerate' is assumed for formats that do not store it. """
     import numpy as np
     from os.path import splitext
 
     extension = splitext(audiopath)[1].lower()
     if extension == ".wav":
         import scipy.io.wavfile as wav
-        samplerate, samples = wav.read(audiopath)
+        samplerate, samples = wav.read(audiopath, mmap=True)
     elif extension == ".npy":
-        samplerate = 44100
-        samples = np.load(audiopath)
+        samples = np.load(audiopath, mmap_mode="r")
     elif extension == ".npz":
-        samplerate = 44100
+        # Compressed archives can't be mapped.
         samples = np.load(audiopath)["arr_0"]
+    elif extension == ".ptrec":
+        # Recordings are decoded on demand when sliced.
+        from soundfiles.recording import RecordingReader
+        samples = RecordingReader(audiopath)
+        samplerate = samples.rate
     else:
         raise NotImplementedError("Unknown file extension")
 
-    # Use a single channel
-    if hasattr(samples[0], "__len__"):
-        samples = samples[:,0]
+    return samplerate, samples
+
+
+def _close(samples):
+    """ Closes the file behind samples returned by _open, if it's kept open (i.e. recordings). """
+    if hasattr(samples, "close"):
+        samples.close()
+    return
+
+
+def _convert(samples, channel=0, dtype=None):
+    """ Selects a channel ('None' mixes all channels down) and converts the samples to floats in memory.
+        Integer samples are scaled to [-1, 1]. """
+    import numpy as np
+
+    if samples.ndim > 1 and channel is not None:
+        samples = samples[:,channel]
 
     if np.issubdtype(samples.dtype, np.integer):
         max = np.iinfo(samples.dtype).max
-        samples = np.divide(samples, max)
+        converted = samples.astype(dtype or np.float64)
+        converted /= max
+    else:
+        converted = np.array(samples, dtype=dtype)
 
-    return samplerate, samples
+    if converted.ndim > 1:
+        converted = np.mean(converted, 1, dtype=converted.dtype)
+
+    return converted
+
+
+def readfile(audiopath="wave.ptrec", samplerate=44100):
+    """ Returns the sample rate and samples contained in a given audio file. Format support is restricted.
+        'samplerate' is assumed for formats that do not store it. """
+    samplerate, samples = _open(audiopath, samplerate)
+    try:
+        # Use a single channel
+        return samplerate, _convert(samples[:])
+    finally:
+        _close(samples)
 
 
-def writewav(audiopath="wave.npz", outpath="out.wav"):
+def readblocks(audiopath, blocksize, hop=None, channel=0, samplerate=44100, pad=False):
+    """ Returns the sample rate and a generator of float32 blocks with 'blocksize' samples of a given audio file.
+        A new block starts every 'hop' samples (defaults to 'blocksize'; smaller values make blocks overlap).
+        The file is memory-mapped when possible and converted one block at a time, so memory use is constant.
+        The last incomplete block is zero padded if 'pad' is set, and dropped otherwise. """
+    import numpy as np
+
+    # The file is only opened here for its sample rate. The generator opens it again once started, and closes it once
+    # exhausted (or closed, or garbage collected), so a generator that's never started doesn't keep it open.
+    rate, samples = _open(audiopath, samplerate)
+    _close(samples)
+    if not hop:
+        hop = blocksize
+
+    def blocks():
+        _, samples = _open(audiopath, samplerate)
+        try:
+            for start in range(0, len(samples), hop):
+                block = _convert(samples[start:start + blocksize], channel, np.float32)
+                if block.size < blocksize:
+                    if not pad:
+                        return
+                    block = np.append(block, np.zeros(blocksize - block.size, np.float32))
+
+                yield block
+        finally:
+            _close(samples)
+
+    return rate, blocks()
+
+
+def writewav(audiopath="wave.ptrec", outpath="out.wav"):
     """ Write a wav file given an input sample array file that can be read with readfile. """
     import scipy.io.wavfile as wav
 
@@ -66,11 +133,6 @@ def write_m21stream_to_midi(s, filePath='audio.midi'):
 
 
 def write_m21stream_to_xml(s, filePath='audio.xml'):
-    """ Writes a Music21 sream to an xml file. """
-    import music21 as music
-
-    mf = music.musicxml.m21ToString(s)
-    mf.open(filePath, 'wb')
-    mf.write()
-    mf.close()
+    """ Writes a Music21 stream to a MusicXML file. """
+    s.write('musicxml', fp=filePath)
     return
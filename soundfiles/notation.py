@@ -0,0 +1,272 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Writers of Standard MIDI Files and MusicXML scores, fed one note at a time, so memory use doesn't depend on the
+    length of the score. A note is given by its name (e.g. 'C#5', or anything else for a rest), its length in
+    quarters and whether it's slurred ("start", "continue", "stop" or False, as in transcriber.Transcriber.notes).
+    A key is given as its position in the circle of fifths (negative for flats) and its mode ("major" or "minor"). """
+
+import struct as _struct
+import xml.sax.saxutils as _saxutils
+
+import mtheory as _mt
+
+
+def _midi_number(name):
+    """ Returns the MIDI note number of a note name, or None if it's not a note (i.e. it's a rest). """
+    table = _mt.tuning()
+    try:
+        return int(table.midi[table.index(name)])
+    except KeyError:
+        return None
+
+
+class _Slurs(object):
+    """ Tracks the slur state of consecutive notes, tolerating inconsistent markings (e.g. "continue" without a
+        "start"). Returns whether each note starts and/or stops a slur. """
+
+    def __init__(self):
+        self.open = False
+        return
+
+    def mark(self, slur):
+        start = slur in ("start", "continue") and not self.open
+        stop = slur == "stop" and self.open
+        self.open = (self.open or start) and not stop
+        return start, stop
+
+
+class MidiWriter(object):
+    """ Writes a format 0 Standard MIDI File with 'division' ticks per quarter. The track length is only known at the
+        end, so it's patched in by close() (the file must be seekable). """
+
+    def __init__(self, path, tempo=120, time_signature=(4, 4), key=None, division=480, velocity=80, channel=0):
+        self.division = division
+        self.velocity = velocity
+        self.channel = channel
+
+        # Position (in quarters) of the end of the latest event written, and of the end of the latest note.
+        self._written = 0
+        self._position = 0
+
+        self._file = open(path, "wb")
+        self._file.write(b"MThd" + _struct.pack(">IHHH", 6, 0, 1, division))
+        self._file.write(b"MTrk" + _struct.pack(">I", 0))
+        self._track_start = self._file.tell()
+
+        beats, beat_type = time_signature
+        self._meta(0x51, _struct.pack(">I", int(round(60e6/tempo)))[1:])
+        self._meta(0x58, _struct.pack(">BBBB", beats, beat_type.bit_length() - 1, 24, 8))
+        if key is not None:
+            self._meta(0x59, _struct.pack(">bB", key[0], key[1] == "minor"))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def note(self, name, quarters, slur=False):
+        """ Appends a note (or a rest). """
+        number = _midi_number(name)
+        if number is not None:
+            self._event(self._position, bytes((0x90 | self.channel, number, self.velocity)))
+            self._event(self._position + quarters, bytes((0x80 | self.channel, number, 0)))
+
+        self._position += quarters
+        return
+
+    def close(self):
+        """ Ends the track and closes the file. """
+        if self._file.closed:
+            return
+
+        self._meta(0x2F, b"", self._position)
+        end = self._file.tell()
+        self._file.seek(self._track_start - 4)
+        self._file.write(_struct.pack(">I", end - self._track_start))
+        self._file.close()
+        return
+
+    def _meta(self, kind, data, position=None):
+        self._event(self._written if position is None else position,
+                    bytes((0xFF, kind)) + self._varlen(len(data)) + data)
+        return
+
+    def _event(self, position, data):
+        """ Writes an event at a position in quarters (not before the latest event). """
+        delta = int(round(position*self.division)) - int(round(self._written*self.division))
+        self._file.write(self._varlen(max(delta, 0)) + data)
+        self._written = max(position, self._written)
+        return
+
+    @staticmethod
+    def _varlen(value):
+        """ Encodes a MIDI variable length quantity. """
+        encoded = bytearray((value & 0x7F,))
+        value >>= 7
+        while value:
+            encoded.insert(0, 0x80 | (value & 0x7F))
+            value >>= 7
+        return bytes(encoded)
+
+
+class MusicXMLWriter(object):
+    """ Writes a single part MusicXML (partwise) score. Lengths are rounded to 'divisions' per quarter (i.e. to 32nd
+        notes by default); notes are split at barlines and into lengths that can be notated, tied together. Each note
+        is written once the next one arrives, as close() ends the slur left open on the last note. """
+
+    # Notated lengths in 32nd notes (plain and dotted), longest first, and their types.
+    _LENGTHS = ((32, "whole", False), (24, "half", True), (16, "half", False), (12, "quarter", True),
+                (8, "quarter", False), (6, "eighth", True), (4, "eighth", False), (3, "16th", True),
+                (2, "16th", False), (1, "32nd", False))
+
+    def __init__(self, path, tempo=120, time_signature=(4, 4), key=None, title=None, divisions=8):
+        self.divisions = divisions
+        self.measure_length = time_signature[0]*4*divisions//time_signature[1]
+
+        # Measure being written and how much of it is filled (in divisions).
+        self._measure = 1
+        self._filled = 0
+
+        # Accidentals are spelled as flats in keys with flats.
+        self._flats = key is not None and key[0] < 0
+
+        # Note waiting to be written (name, length in divisions and whether it starts and/or stops a slur).
+        self._pending = None
+        self._slurs = _Slurs()
+
+        beats, beat_type = time_signature
+        self._file = open(path, "w", encoding="utf-8")
+        self._file.write('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+                         '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 3.1 Partwise//EN" '
+                         '"http://www.musicxml.org/dtds/partwise.dtd">\n'
+                         '<score-partwise version="3.1">\n')
+        if title is not None:
+            self._file.write("  <work><work-title>%s</work-title></work>\n" % _saxutils.escape(title))
+        self._file.write('  <part-list><score-part id="P1"><part-name>Music</part-name></score-part></part-list>\n'
+                         '  <part id="P1">\n'
+                         '    <measure number="1">\n'
+                         '      <attributes><divisions>%d</divisions>' % divisions)
+        if key is not None:
+            self._file.write("<key><fifths>%d</fifths><mode>%s</mode></key>" % key)
+        self._file.write("<time><beats>%d</beats><beat-type>%d</beat-type></time>"
+                         "<clef><sign>G</sign><line>2</line></clef></attributes>\n" % (beats, beat_type))
+        self._file.write('      <direction placement="above"><direction-type><metronome><beat-unit>quarter</beat-unit>'
+                         '<per-minute>%g</per-minute></metronome></direction-type><sound tempo="%g"/></direction>\n' %
+                         (tempo, tempo))
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def note(self, name, quarters, slur=False):
+        """ Appends a note (or a rest). """
+        if self._pending is not None:
+            self._write(*self._pending)
+
+        start, stop = self._slurs.mark(slur)
+        self._pending = [name, max(1, int(round(quarters*self.divisions))), start, stop]
+        return
+
+    def close(self):
+        """ Writes the pending note, fills the last measure with rests and closes the file. """
+        if self._file.closed:
+            return
+
+        if self._pending is not None:
+            if self._slurs.open:
+                # Ends the slur left open, unless it would only span this note.
+                self._pending[2:] = [False, False] if self._pending[2] else [False, True]
+            self._write(*self._pending)
+        if self._filled:
+            self._write(None, self.measure_length - self._filled, False, False)
+
+        self._file.write("    </measure>\n  </part>\n</score-partwise>\n")
+        self._file.close()
+        return
+
+    def _write(self, name, length, start, stop):
+        """ Writes a note of a given length (in divisions), split in tied notes at barlines and notated lengths. """
+        number = _midi_number(name) if name is not None else None
+        pieces = []
+        while length:
+            if self._filled == self.measure_length:
+                self._measure += 1
+                self._filled = 0
+                self._file.write('    </measure>\n    <measure number="%d">\n' % self._measure)
+
+            piece = min(length, self.measure_length - self._filled)
+            for notated, kind, dotted in self._LENGTHS:
+                notated = notated*self.divisions//8
+                if 0 < notated <= piece:
+                    break
+            else:
+                notated, kind, dotted = piece, "32nd", False
+
+            # Rests are never tied.
+            tied = (bool(pieces), notated < length) if number is not None else (False, False)
+            pieces.append(notated)
+            self._file.write(self._note_xml(number, self._flats, notated, kind, dotted, tied,
+                                            start and len(pieces) == 1, stop and notated == length))
+            self._filled += notated
+            length -= notated
+
+        return
+
+    @staticmethod
+    def _note_xml(number, flats, length, kind, dotted, tied, slur_start, slur_stop):
+        """ Returns a <note> element. 'tied' tells whether the note is tied to the previous and to the next one. """
+        if number is None:
+            pitch = "<rest/>"
+        else:
+            alter = 0
+            if len(_mt.pitch_classes[number % 12]) > 1:
+                alter = -1 if flats else 1
+            pitch = "<pitch><step>%s</step>%s<octave>%d</octave></pitch>" % (
+                _mt.pitch_classes[(number - alter) % 12], "<alter>%d</alter>" % alter if alter else "",
+                (number - alter)//12 - 1)
+
+        ties = "".join('<tie type="%s"/>' % kind for kind, is_tied in zip(("stop", "start"), tied) if is_tied)
+        notations = "".join('<tied type="%s"/>' % kind for kind, is_tied in zip(("stop", "start"), tied)
+                            if is_tied)
+        if slur_start:
+            notations += '<slur type="start" number="1"/>'
+        if slur_stop:
+            notations += '<slur type="stop" number="1"/>'
+
+        return "      <note>%s<duration>%d</duration>%s<voice>1</voice><type>%s</type>%s%s</note>\n" % (
+            pitch, length, ties, kind, "<dot/>" if dotted else "",
+            "<notations>%s</notations>" % notations if notations else "")
+
+
+def write_midi(notes, path, tempo=120, time_signature=(4, 4), key=None):
+    """ Writes notes (dicts with their "name", length in "quarters" and "slur") to a Standard MIDI File. """
+    with MidiWriter(path, tempo, time_signature, key) as writer:
+        for note in notes:
+            writer.note(note["name"], note["quarters"], note["slur"])
+    return
+
+
+def write_musicxml(notes, path, tempo=120, time_signature=(4, 4), key=None, title=None):
+    """ Writes notes (dicts with their "name", length in "quarters" and "slur") to a MusicXML score. """
+    with MusicXMLWriter(path, tempo, time_signature, key, title) as writer:
+        for note in notes:
+            writer.note(note["name"], note["quarters"], note["slur"])
+    return
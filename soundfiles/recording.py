@@ -0,0 +1,318 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Self-describing format for recorded sessions (.ptrec).
+    Layout (little endian):
+        header: b"PTRC", version (uint16), size (uint32) and a JSON object with the rate, channels, sample dtype,
+                start time (seconds since the epoch), tick size and block size (both in frames) and block compression;
+        blocks: first frame (uint64), frames (uint32), payload size (uint32) and the payload, i.e. the interleaved
+                samples, compressed with zlib if so stated in the header;
+        index:  b"PTRI", count (uint32) and the first frame (uint64), frames (uint32) and file offset (uint64) of
+                each block;
+        footer: the index offset (uint64) and b"PTRE".
+    The index allows seeking to any time range without decoding the preceding blocks. Recordings that were not closed
+    properly have no index, in which case it is rebuilt by walking through the block headers. """
+
+import json as _json
+import queue as _queue
+import struct as _struct
+import threading as _threading
+import time as _time
+import zlib as _zlib
+
+import numpy as _np
+
+
+_MAGIC = b"PTRC"
+_INDEX_MAGIC = b"PTRI"
+_FOOTER_MAGIC = b"PTRE"
+_VERSION = 1
+
+_header = _struct.Struct("<4sHI")
+_block_header = _struct.Struct("<QII")
+_index_header = _struct.Struct("<4sI")
+_index_entry = _struct.Struct("<QIQ")
+_footer = _struct.Struct("<Q4s")
+
+# Writes that may be waiting for the background thread before write() blocks.
+_QUEUE_SIZE = 64
+
+
+class RecordingWriter(object):
+    """ Writes samples to a .ptrec file. Samples are buffered until a whole block is available, so memory use is
+        bounded by the block size regardless of the recording length.
+        If 'background' is set, compression and disk writes happen on a separate thread, and write() only copies the
+        samples into a bounded queue, blocking if the thread falls behind. Errors raised by the thread are raised again
+        by the next write() or close(). """
+
+    def __init__(self, path, rate=44100, channels=1, dtype=_np.float32, tick_size=None, block_size=None,
+                 compression="zlib", start_time=None, background=False):
+        if compression not in (None, "zlib"):
+            raise ValueError("Unknown compression: %s" % compression)
+
+        self.rate = rate
+        self.channels = channels
+        self.dtype = _np.dtype(dtype).newbyteorder("<")
+        self.tick_size = tick_size
+        self.block_size = block_size or rate
+        self.compression = compression
+        self.start_time = start_time if start_time is not None else _time.time()
+
+        # Frames already written to blocks.
+        self._flushed = 0
+
+        # Block being filled, and how many frames it holds.
+        self._block = _np.zeros(self.block_size*channels, self.dtype)
+        self._buffered = 0
+
+        # First frame, frame count and file offset of each block written.
+        self._index = []
+
+        self._file = open(path, "wb")
+        header = _json.dumps({"rate":           rate,
+                              "channels":       channels,
+                              "dtype":          self.dtype.str,
+                              "start_time":     self.start_time,
+                              "tick_size":      tick_size,
+                              "block_size":     self.block_size,
+                              "compression":    compression}).encode("utf-8")
+        self._file.write(_header.pack(_MAGIC, _VERSION, len(header)))
+        self._file.write(header)
+
+        self._queue = None
+        self._error = None
+        if background:
+            self._queue = _queue.Queue(maxsize=_QUEUE_SIZE)
+            self._thread = _threading.Thread(target=self._drain, name="RecordingWriter")
+            self._thread.daemon = True
+            self._thread.start()
+
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, samples):
+        """ Appends samples (interleaved if there are multiple channels) to the recording. """
+        if self._queue is not None:
+            self._raise_error()
+            # The caller may reuse its buffer, so queue a copy.
+            self._queue.put(_np.array(samples, self.dtype).ravel())
+        else:
+            self._write(samples)
+        return
+
+    def _write(self, samples):
+        """ Buffers samples into blocks, writing every block that gets full. """
+        samples = _np.ravel(samples)
+        written = 0
+        while written < samples.size:
+            start = self._buffered*self.channels
+            count = min(samples.size - written, self._block.size - start)
+            self._block[start:start + count] = samples[written:written + count]
+            written += count
+            self._buffered += count//self.channels
+
+            if self._buffered == self.block_size:
+                self._flush()
+
+        return
+
+    @property
+    def frames(self):
+        """ Frames written so far, including the ones still buffered. """
+        return self._flushed + self._buffered
+
+    def close(self):
+        """ Writes any buffered samples and the seek index, then closes the file. """
+        if self._file.closed:
+            return
+
+        if self._queue is not None:
+            self._queue.put(None)
+            self._thread.join()
+            if self._error is not None:
+                self._file.close()
+                self._raise_error()
+
+        self._flush()
+
+        index_offset = self._file.tell()
+        self._file.write(_index_header.pack(_INDEX_MAGIC, len(self._index)))
+        for entry in self._index:
+            self._file.write(_index_entry.pack(*entry))
+        self._file.write(_footer.pack(index_offset, _FOOTER_MAGIC))
+        self._file.close()
+        return
+
+    def _drain(self):
+        """ Background thread loop: writes queued samples until a 'None' is queued. After an error, the remaining
+            samples are discarded so that write() never blocks on a full queue. """
+        while True:
+            samples = self._queue.get()
+            if samples is None:
+                return
+            if self._error is None:
+                try:
+                    self._write(samples)
+                except Exception as e:
+                    self._error = e
+
+    def _raise_error(self):
+        """ Raises the error the background thread stopped at, if any. """
+        if self._error is not None:
+            raise self._error
+
+    def _flush(self):
+        """ Writes the buffered frames as a block. """
+        if not self._buffered:
+            return
+
+        payload = self._block[:self._buffered*self.channels].tobytes()
+        if self.compression == "zlib":
+            payload = _zlib.compress(payload)
+
+        self._index.append((self._flushed, self._buffered, self._file.tell()))
+        self._file.write(_block_header.pack(self._flushed, self._buffered, len(payload)))
+        self._file.write(payload)
+        self._flushed += self._buffered
+        self._buffered = 0
+        return
+
+
+class RecordingReader(object):
+    """ Reads a .ptrec file. Slicing a reader (by frame) decodes only the blocks that overlap the slice, returning an
+        array shaped (frames,) for mono recordings and (frames, channels) otherwise. """
+
+    def __init__(self, path):
+        self._file = open(path, "rb")
+
+        magic, version, size = _header.unpack(self._file.read(_header.size))
+        if magic != _MAGIC:
+            raise ValueError("Not a recording file: %s" % path)
+        if version > _VERSION:
+            raise ValueError("Unsupported recording version: %d" % version)
+
+        header = _json.loads(self._file.read(size).decode("utf-8"))
+        self.rate = header["rate"]
+        self.channels = header["channels"]
+        self.dtype = _np.dtype(header["dtype"])
+        self.start_time = header["start_time"]
+        self.tick_size = header["tick_size"]
+        self.block_size = header["block_size"]
+        self.compression = header["compression"]
+        self._data_offset = self._file.tell()
+
+        self._first_frames, self._block_frames, self._offsets = self._read_index()
+        self.frames = int(self._first_frames[-1] + self._block_frames[-1]) if self._offsets.size else 0
+
+        # Last decoded block, as sequential reads usually hit the same block repeatedly.
+        self._cached = (-1, None)
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return self.frames
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError("Recordings can only be read through contiguous slices")
+
+        start, stop, _ = key.indices(self.frames)
+        stop = max(start, stop)
+
+        out = _np.empty((stop - start)*self.channels, self.dtype)
+        block = max(0, _np.searchsorted(self._first_frames, start, side="right") - 1)
+        frame = start
+        while frame < stop:
+            samples = self._decode(block)
+            first = frame - self._first_frames[block]
+            count = min(stop - frame, self._block_frames[block] - first)
+            offset = (frame - start)*self.channels
+            out[offset:offset + count*self.channels] = samples[first*self.channels:(first + count)*self.channels]
+            frame += count
+            block += 1
+
+        return out if self.channels == 1 else out.reshape(-1, self.channels)
+
+    @property
+    def duration(self):
+        """ Length of the recording in seconds. """
+        return self.frames/self.rate
+
+    def read(self, start=0, stop=None):
+        """ Returns the samples between 'start' and 'stop' (in seconds from the beginning of the recording). """
+        return self[int(round(start*self.rate)):(int(round(stop*self.rate)) if stop is not None else None)]
+
+    def blocks(self):
+        """ Yields the recording one stored block at a time. """
+        for block in range(self._offsets.size):
+            samples = self._decode(block)
+            yield samples if self.channels == 1 else samples.reshape(-1, self.channels)
+
+    def close(self):
+        """ Closes the file. """
+        self._file.close()
+        return
+
+    def _decode(self, block):
+        """ Returns the interleaved samples of a given block. """
+        if self._cached[0] == block:
+            return self._cached[1]
+
+        self._file.seek(self._offsets[block])
+        _, frames, size = _block_header.unpack(self._file.read(_block_header.size))
+        payload = self._file.read(size)
+        if self.compression == "zlib":
+            payload = _zlib.decompress(payload)
+
+        samples = _np.frombuffer(payload, self.dtype)
+        self._cached = (block, samples)
+        return samples
+
+    def _read_index(self):
+        """ Returns the first frame, frame count and file offset of every block. """
+        self._file.seek(0, 2)
+        end = self._file.tell()
+
+        entries = []
+        if end - self._data_offset >= _footer.size:
+            self._file.seek(end - _footer.size)
+            index_offset, magic = _footer.unpack(self._file.read(_footer.size))
+            if magic == _FOOTER_MAGIC:
+                self._file.seek(index_offset)
+                _, count = _index_header.unpack(self._file.read(_index_header.size))
+                entries = [_index_entry.unpack(self._file.read(_index_entry.size)) for _ in range(count)]
+            else:
+                # No index (e.g. the recording wasn't closed), so walk through the blocks.
+                offset = self._data_offset
+                while offset + _block_header.size <= end:
+                    self._file.seek(offset)
+                    first, frames, size = _block_header.unpack(self._file.read(_block_header.size))
+                    if offset + _block_header.size + size > end:
+                        break
+                    entries.append((first, frames, offset))
+                    offset += _block_header.size + size
+
+        entries = _np.array(entries, _np.int64).reshape(-1, 3)
+        return entries[:,0], entries[:,1], entries[:,2]
@@ -0,0 +1,221 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Asyncio front end of the transcriber: audio is pushed into (or pulled by) a TranscriptionStream, and the detected
+    notes come out of it through an async iterator as soon as the transcriber confirms them.
+    The analysis runs in an executor (by default the event loop's thread pool), so a single event loop serves many
+    streams without a thread per stream. Each stream analyzes its reads in order, one at a time.
+    Usage:
+        async with TranscriptionStream() as stream:
+            await stream.push(samples)
+            ...
+        async for note in stream:
+            print(note)
+    or, with an async iterable of audio chunks:
+        async for note in transcribe(chunks):
+            print(note) """
+
+import asyncio as _asyncio
+import sys as _sys
+
+import numpy as _np
+
+import mic.sources as _sources
+import transcriber as _transcriber
+
+
+# Reads each stream source holds.
+_BUFFER_READS = 16
+
+
+class TranscriptionStream(object):
+    """ Transcribes audio pushed in chunks of any size (see push()), or pulled from an async iterable (see feed()).
+        Iterating the stream asynchronously yields the detected notes (dicts like transcriber.Transcriber.notes, with
+        positions in ticks, i.e. in 1/blocks_per_sec seconds), and ends once the stream is closed and its last note
+        was yielded. Notes are only yielded once they end, as that's when the transcriber confirms them.
+        If 'ticks' is set, a dict with the tick number, its pitch and the nearest note ("tick", "pitch" and "note",
+        the last two None if the tick was gated) is also yielded for every tick, before the notes it ended.
+        The pushed samples are mono, at 'rate' Hz. Other keyword arguments are given to transcriber.Transcriber. Its
+        debugging outputs and output files are off by default (see transcriber.QUIET), as every stream would print over
+        the others and write to the same files. """
+
+    def __init__(self, blocks_per_sec=60.0, samples_per_block=1470, executor=None, ticks=False, rate=44100, **kwargs):
+        # The transcriber captures one read per tick.
+        self.source = _sources.PushSource(int(rate/blocks_per_sec), rate=rate, buffer_reads=_BUFFER_READS)
+        self.transcriber = _transcriber.Transcriber(blocks_per_sec, samples_per_block, source=self.source,
+                                                    **dict(_transcriber.QUIET, **kwargs))
+        self.executor = executor
+        self.ticks = ticks
+        self.closed = False
+
+        # Pushed samples are analyzed by one executor job at a time.
+        self._lock = _asyncio.Lock()
+
+        # Events not yielded yet (None once the stream ended), and how many of the transcriber notes were queued.
+        self._events = _asyncio.Queue()
+        self._queued = 0
+
+        # Tick events of the reads being analyzed, queued with the notes once the analysis is done.
+        self._ticks = []
+        return
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._events.get()
+        if event is None:
+            # Keep the end mark for any other reader.
+            self._events.put_nowait(None)
+            raise StopAsyncIteration
+        return event
+
+    def events_nowait(self):
+        """ Returns the events that can be yielded without waiting, i.e. the ones detected so far. """
+        events = []
+        while not self._events.empty():
+            event = self._events.get_nowait()
+            if event is None:
+                self._events.put_nowait(None)
+                break
+            events.append(event)
+
+        return events
+
+    async def push(self, samples):
+        """ Transcribes samples (see mic.sources.PushSource.push), analyzing every whole read available. Returns once
+            they are analyzed, so a producer awaiting it is paced by the analysis. """
+        if self.closed:
+            raise ValueError("Can't push samples into a closed stream")
+
+        if isinstance(samples, (bytes, bytearray, memoryview)):
+            samples = _np.frombuffer(samples, _np.float32)
+        samples = _np.ravel(samples)
+
+        # Large chunks are pushed in slices the source can hold.
+        step = (_BUFFER_READS - 1)*self.source.samples_per_read
+        loop = _asyncio.get_running_loop()
+        async with self._lock:
+            for i in range(0, samples.size, step):
+                self.source.push(samples[i:i + step])
+                if self.source.reads_available:
+                    await loop.run_in_executor(self.executor, self._analyze)
+                    self._queue_events()
+
+        return
+
+    async def feed(self, chunks):
+        """ Pushes every chunk of an async iterable, then closes the stream. """
+        try:
+            async for chunk in chunks:
+                await self.push(chunk)
+        finally:
+            await self.close()
+
+        return
+
+    async def close(self):
+        """ Ends the stream: the note being played (if any) is yielded and no more samples can be pushed. Samples that
+            don't fill a read are discarded. """
+        if self.closed:
+            return
+
+        self.closed = True
+        async with self._lock:
+            await _asyncio.get_running_loop().run_in_executor(self.executor, self.transcriber.finish)
+
+        self._queue_events()
+        self._events.put_nowait(None)
+        return
+
+    def _analyze(self):
+        """ Runs on the executor: updates the transcriber with every whole read available. """
+        trs = self.transcriber
+        while self.source.reads_available:
+            frame = trs.begin_tick()
+            f = trs.detect_pitch(frame)
+            trs.end_tick(frame, f)
+
+            if self.ticks:
+                self._ticks.append({"tick":    trs.total_ticks,
+                                    "pitch":   f,
+                                    "note":    trs.tuning.names[trs.tuning.nearest(f)] if f is not None else None})
+
+        return
+
+    def _queue_events(self):
+        """ Queues the tick events of the latest analysis, and the notes the transcriber appended since the last
+            call. """
+        for tick in self._ticks:
+            self._events.put_nowait(tick)
+        self._ticks = []
+
+        for note in self.transcriber.notes[self._queued:]:
+            self._events.put_nowait(note)
+        self._queued = len(self.transcriber.notes)
+        return
+
+
+async def read_chunks(source, executor=None):
+    """ Yields the reads of a blocking mic.sources.AudioSource (e.g. an input device) until it ends, reading in an
+        executor so the event loop isn't blocked while waiting for samples. """
+    loop = _asyncio.get_running_loop()
+    while True:
+        try:
+            samples = await loop.run_in_executor(executor, source.read)
+        except EOFError:
+            return
+        yield samples
+
+
+async def transcribe(chunks, **kwargs):
+    """ Yields the notes detected in the audio chunks of an async iterable (keyword arguments are given to
+        TranscriptionStream). """
+    stream = TranscriptionStream(**kwargs)
+    feeding = _asyncio.ensure_future(stream.feed(chunks))
+    try:
+        async for note in stream:
+            yield note
+    finally:
+        if not feeding.done():
+            feeding.cancel()
+        try:
+            await feeding
+        except _asyncio.CancelledError:
+            pass
+
+    return
+
+
+async def _print_notes(audiopath):
+    source = _sources.FileSource(audiopath, 1024, realtime=False)
+    try:
+        async for note in transcribe(read_chunks(source)):
+            print(note)
+    finally:
+        source.close()
+
+    return
+
+
+if __name__ == "__main__":
+    # Transcribes an audio file, read in chunks unrelated to the transcriber reads.
+    _asyncio.run(_print_notes(_sys.argv[1]))
@@ -0,0 +1,67 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the HPS pitch detection, on single blocks and on stacks of blocks. """
+
+import numpy as np
+import pytest
+import scipy.signal
+
+import mtheory as mt
+import pda.hps
+from benchmarks import signals
+
+
+RATE = 44100
+NAMES = ["C4", "G4", "A4", "E5", "C#6", "B6", "F7"]
+
+
+def blocks(names, size=1470, seed=0):
+    """ Stack of blocks of harmonic tones, one per note, with breath noise. """
+    table = mt.tuning()
+    return np.array([signals.harmonic_tone(table.frequency[table.index(name)], size/RATE, RATE) +
+                     signals.breath_noise(size, RATE, 0.002, seed=seed + i) for i, name in enumerate(names)])
+
+
+def test_decimate_matches_scipy():
+    x = np.random.RandomState(0).normal(size=(3, 2000))
+    for q in (2, 3, 4):
+        assert np.allclose(pda.hps._decimate(x, q), scipy.signal.decimate(x, q, zero_phase=True))
+
+
+def test_hps_detects_the_pitch():
+    table = mt.tuning()
+    for name, x in zip(NAMES, blocks(NAMES)):
+        f = pda.hps.hps(x, RATE)
+        assert abs(1200*np.log2(f/table.frequency[table.index(name)])) < 50
+
+
+def test_tunedhps_detects_the_note():
+    table = mt.tuning()
+    for name, x in zip(NAMES, blocks(NAMES)):
+        assert pda.hps.tunedhps(x, RATE) == table.frequency[table.index(name)]
+
+
+@pytest.mark.parametrize("size", [1470, 2048])
+def test_stacks_match_single_blocks(size):
+    """ Detecting a stack of blocks at once gives exactly the results of detecting each block on its own. """
+    X = blocks(NAMES, size)
+
+    pitches, prominences = pda.hps.hps(X, RATE, confidence=True)
+    single = [pda.hps.hps(x, RATE, confidence=True) for x in X]
+    assert np.array_equal(pitches, [f for f, _ in single])
+    assert np.array_equal(prominences, [prominence for _, prominence in single])
+
+    assert np.array_equal(pda.hps.tunedhps(X, RATE), [pda.hps.tunedhps(x, RATE) for x in X])
@@ -0,0 +1,93 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the key estimation. """
+
+import numpy as np
+import pytest
+
+import mtheory as mt
+import mtheory.keys as keys
+
+
+# Scale degrees (in semitones from the tonic) and durations of a melody, with the tonic and dominant held longer.
+MAJOR_MELODY = [(0, 2), (2, 1), (4, 1), (5, 1), (7, 2), (9, 1), (11, 1), (12, 2), (7, 1), (4, 1), (0, 2)]
+MINOR_MELODY = [(0, 2), (2, 1), (3, 1), (5, 1), (7, 2), (8, 1), (11, 1), (12, 2), (7, 1), (3, 1), (0, 2)]
+
+
+def estimate(melody, tonic, octave=4):
+    estimator = keys.KeyEstimator()
+    for degree, duration in melody:
+        pitch = tonic + degree
+        estimator.add("%s%d" % (mt.pitch_classes[pitch % 12], octave + pitch//12), duration)
+    return estimator.estimate()
+
+
+@pytest.mark.parametrize("tonic", range(12))
+def test_major_keys(tonic):
+    key = estimate(MAJOR_MELODY, tonic)
+    assert (key["tonic"], key["mode"]) == (mt.pitch_classes[tonic], "major")
+    assert key["fifths"] == keys.fifths(tonic, "major")
+    assert 0.5 < key["correlation"] <= 1
+
+
+@pytest.mark.parametrize("tonic", range(12))
+def test_minor_keys(tonic):
+    key = estimate(MINOR_MELODY, tonic)
+    assert (key["tonic"], key["mode"]) == (mt.pitch_classes[tonic], "minor")
+    assert key["fifths"] == keys.fifths(tonic, "minor")
+
+
+def test_fifths():
+    assert [keys.fifths(tonic, "major") for tonic in range(12)] == [0, -5, 2, -3, 4, -1, 6, 1, -4, 3, -2, 5]
+    # Relative keys share their signature.
+    assert all(keys.fifths(tonic, "minor") == keys.fifths((tonic + 3) % 12, "major") for tonic in range(12))
+
+
+def test_octaves_do_not_matter():
+    assert estimate(MAJOR_MELODY, 7, octave=4) == estimate(MAJOR_MELODY, 7, octave=6)
+
+
+def test_correlations():
+    """ The correlations are the Pearson correlations of the histogram with every rotated profile. """
+    estimator = keys.KeyEstimator()
+    for name, duration in (("C4", 3), ("E4", 1), ("G4", 2), ("A#5", 0.5), ("D#6", 0.25)):
+        estimator.add(name, duration)
+
+    correlations = estimator.correlations()
+    assert correlations.shape == (2, 12)
+    for mode, profile in enumerate((keys.major_profile, keys.minor_profile)):
+        for tonic in range(12):
+            expected = np.corrcoef(estimator.histogram, np.roll(profile, tonic))[0, 1]
+            assert correlations[mode, tonic] == pytest.approx(expected)
+
+    # A histogram shaped like a profile correlates perfectly with it.
+    estimator.histogram[:] = np.roll(keys.minor_profile, 4)
+    assert estimator.estimate() == {"tonic": "E", "mode": "minor", "fifths": 1, "correlation": pytest.approx(1)}
+
+
+def test_nothing_to_estimate_from():
+    estimator = keys.KeyEstimator()
+    assert estimator.correlations() is None and estimator.estimate() is None
+
+    # Every pitch class played for as long.
+    for name in mt.pitch_classes:
+        estimator.add(name + "5")
+    assert estimator.estimate() is None
+
+    estimator.add("C5")
+    assert estimator.estimate() is not None
+    estimator.reset()
+    assert estimator.estimate() is None
@@ -0,0 +1,80 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the adaptive noise floor. """
+
+import numpy as np
+import pytest
+
+import noise
+
+
+READS_PER_SEC = 60
+
+
+def feed(tracker, rms, seconds, voiced=False):
+    for _ in range(int(seconds*READS_PER_SEC)):
+        threshold = tracker.update(rms, voiced)
+    return threshold
+
+
+def test_starts_at_the_assumed_floor():
+    tracker = noise.NoiseFloorTracker(READS_PER_SEC, floor=2e-3)
+    assert tracker.threshold == pytest.approx(3e-3)
+
+    # Music played from the first read isn't taken for noise.
+    assert feed(tracker, 0.2, 1.0) == pytest.approx(3e-3)
+
+
+def test_matches_the_calibration():
+    """ Once enough noise was heard, the threshold is the one of the blocking calibration over the same reads. """
+    rms = np.abs(np.random.RandomState(0).normal(0.01, 0.002, 3*READS_PER_SEC))
+    tracker = noise.NoiseFloorTracker(READS_PER_SEC)
+    for _ in range(2):
+        for value in rms:
+            threshold = tracker.update(value)
+
+    calibration = 1.5*np.sort(rms)[int(0.98*rms.size)]
+    assert threshold == pytest.approx(calibration, rel=0.05)
+
+
+def test_follows_the_noise_up_and_down():
+    tracker = noise.NoiseFloorTracker(READS_PER_SEC)
+    assert feed(tracker, 0.01, 3.0) == pytest.approx(0.015)
+
+    # Louder noise replaces the floor once the window is over.
+    assert feed(tracker, 0.05, 3.0) == pytest.approx(0.075)
+
+    # Quieter noise is followed right away.
+    assert tracker.update(0.001) == pytest.approx(1.5*4*0.001)
+    assert feed(tracker, 0.001, 3.0) == pytest.approx(0.0015)
+
+
+def test_voiced_reads_are_left_out():
+    tracker = noise.NoiseFloorTracker(READS_PER_SEC)
+    feed(tracker, 0.01, 3.0)
+
+    # A note sustained for longer than the window.
+    assert feed(tracker, 0.3, 10.0, voiced=True) == pytest.approx(0.015)
+    assert tracker.floor == pytest.approx(0.01)
+
+
+def test_seed():
+    tracker = noise.NoiseFloorTracker(READS_PER_SEC)
+    feed(tracker, 0.01, 3.0)
+
+    tracker.seed(0.003)
+    assert tracker.threshold == pytest.approx(0.003)
+    assert tracker.floor == pytest.approx(0.002)
@@ -0,0 +1,198 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the MIDI and MusicXML writers, reading back what they write. """
+
+import struct
+import xml.etree.ElementTree as ET
+
+import soundfiles.notation as notation
+
+
+def read_midi(path):
+    """ Returns the division and the events of a format 0 MIDI file, as (tick, status, data) triples. """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert data[:4] == b"MThd"
+    size, format, tracks, division = struct.unpack(">IHHH", data[4:14])
+    assert (size, format, tracks) == (6, 0, 1)
+    assert data[14:18] == b"MTrk"
+    length, = struct.unpack(">I", data[18:22])
+    track = data[22:]
+    assert len(track) == length
+
+    def varlen(i):
+        value = 0
+        while True:
+            value = (value << 7) | (track[i] & 0x7F)
+            i += 1
+            if not track[i - 1] & 0x80:
+                return value, i
+
+    events = []
+    tick = 0
+    i = 0
+    while i < len(track):
+        delta, i = varlen(i)
+        tick += delta
+        status = track[i]
+        if status == 0xFF:
+            kind = track[i + 1]
+            size, i = varlen(i + 2)
+            events.append((tick, (0xFF, kind), track[i:i + size]))
+            i += size
+        else:
+            events.append((tick, status, track[i + 1:i + 3]))
+            i += 3
+
+    assert events[-1][1:] == ((0xFF, 0x2F), b"")
+    return division, events
+
+
+def read_musicxml(path):
+    """ Returns the attributes, and the notes of each measure as (pitch or None, duration, type, dotted, ties, slurs)
+        tuples, where pitch is (step, alter, octave). """
+    root = ET.parse(str(path)).getroot()
+    measures = root.findall("part/measure")
+    assert [int(measure.get("number")) for measure in measures] == list(range(1, len(measures) + 1))
+
+    notes = []
+    for measure in measures:
+        notes.append([])
+        for note in measure.findall("note"):
+            pitch = note.find("pitch")
+            if pitch is not None:
+                pitch = (pitch.findtext("step"), int(pitch.findtext("alter", "0")), int(pitch.findtext("octave")))
+            ties = tuple(tie.get("type") for tie in note.findall("tie"))
+            assert ties == tuple(tied.get("type") for tied in note.findall("notations/tied"))
+            slurs = tuple(slur.get("type") for slur in note.findall("notations/slur"))
+            notes[-1].append((pitch, int(note.findtext("duration")), note.findtext("type"),
+                              note.find("dot") is not None, ties, slurs))
+
+    return root.find("part/measure/attributes"), root, notes
+
+
+def test_midi(tmp_path):
+    path = str(tmp_path / "a.mid")
+    with notation.MidiWriter(path, tempo=100, time_signature=(3, 4), key=(-3, "minor")) as writer:
+        writer.note("C4", 1)
+        writer.note("r", 0.5)
+        writer.note("D#4", 1.5, "start")
+        writer.note("A5", 0.25, "stop")
+
+    division, events = read_midi(path)
+    assert division == 480
+    assert events == [(0, (0xFF, 0x51), struct.pack(">I", 600000)[1:]),
+                      (0, (0xFF, 0x58), bytes((3, 2, 24, 8))),
+                      (0, (0xFF, 0x59), struct.pack(">bB", -3, 1)),
+                      (0, 0x90, bytes((60, 80))),
+                      (480, 0x80, bytes((60, 0))),
+                      (720, 0x90, bytes((63, 80))),
+                      (1440, 0x80, bytes((63, 0))),
+                      (1440, 0x90, bytes((81, 80))),
+                      (1560, 0x80, bytes((81, 0))),
+                      (1560, (0xFF, 0x2F), b"")]
+
+
+def test_midi_long_notes(tmp_path):
+    """ Deltas that need several bytes, and a score without a key. """
+    path = str(tmp_path / "a.mid")
+    notation.write_midi([{"name": "G6", "quarters": 300, "slur": False}], path)
+
+    division, events = read_midi(path)
+    assert [kind for _, kind, _ in events[:2]] == [(0xFF, 0x51), (0xFF, 0x58)]
+    assert [(tick, status) for tick, status, _ in events[2:]] == [(0, 0x90), (300*480, 0x80), (300*480, (0xFF, 0x2F))]
+
+
+def test_musicxml(tmp_path):
+    path = str(tmp_path / "a.xml")
+    with notation.MusicXMLWriter(path, tempo=90, key=(-2, "major"), title="Flute & friends") as writer:
+        writer.note("C4", 1)
+        writer.note("D#5", 0.5)
+        writer.note("r", 0.5)
+        # Crosses the barline.
+        writer.note("F#4", 3)
+
+    attributes, root, measures = read_musicxml(path)
+    assert root.findtext("work/work-title") == "Flute & friends"
+    assert attributes.findtext("divisions") == "8"
+    assert (attributes.findtext("key/fifths"), attributes.findtext("key/mode")) == ("-2", "major")
+    assert (attributes.findtext("time/beats"), attributes.findtext("time/beat-type")) == ("4", "4")
+    assert root.find("part/measure/direction/sound").get("tempo") == "90"
+
+    # Accidentals are spelled as flats in a key with flats.
+    assert measures == [[(("C", 0, 4), 8, "quarter", False, (), ()),
+                         (("E", -1, 5), 4, "eighth", False, (), ()),
+                         (None, 4, "eighth", False, (), ()),
+                         (("G", -1, 4), 16, "half", False, ("start",), ())],
+                        [(("G", -1, 4), 8, "quarter", False, ("stop",), ()),
+                         (None, 24, "half", True, (), ())]]
+
+
+def test_musicxml_lengths(tmp_path):
+    """ Lengths are rounded to 32nds and split into notated lengths (and at barlines), tied together. """
+    path = str(tmp_path / "a.xml")
+    notation.write_musicxml([{"name": "A4", "quarters": 1.5, "slur": False},
+                             {"name": "A4", "quarters": 1.25, "slur": False},
+                             {"name": "A4", "quarters": 0.01, "slur": False},
+                             {"name": "A4", "quarters": 1.2, "slur": False}], path, key=(2, "major"))
+
+    _, _, measures = read_musicxml(path)
+    A4 = ("A", 0, 4)
+    assert measures[0] == [(A4, 12, "quarter", True, (), ()),
+                           (A4, 8, "quarter", False, ("start",), ()),
+                           (A4, 2, "16th", False, ("stop",), ()),
+                           (A4, 1, "32nd", False, (), ()),
+                           (A4, 8, "quarter", False, ("start",), ()),
+                           (A4, 1, "32nd", False, ("stop", "start"), ())]
+    assert measures[1][0] == (A4, 1, "32nd", False, ("stop",), ())
+
+
+def test_musicxml_slurs(tmp_path):
+    path = str(tmp_path / "a.xml")
+    notes = [("C5", "start"), ("D5", "continue"), ("E5", "stop"), ("F5", False),
+             # Inconsistent markings: "continue" without a "start", and a slur left open at the end.
+             ("G5", "continue"), ("A5", "continue")]
+    with notation.MusicXMLWriter(path) as writer:
+        for name, slur in notes:
+            writer.note(name, 0.5, slur)
+
+    _, _, measures = read_musicxml(path)
+    assert [slurs for _, _, _, _, _, slurs in measures[0]] == [("start",), (), ("stop",), (), ("start",), ("stop",),
+                                                               ()]
+
+
+def test_musicxml_lone_slurred_note(tmp_path):
+    """ A slur that would only span the last note is dropped. """
+    path = str(tmp_path / "a.xml")
+    with notation.MusicXMLWriter(path, time_signature=(3, 8)) as writer:
+        writer.note("C5", 0.5)
+        writer.note("D5", 0.5, "start")
+
+    attributes, _, measures = read_musicxml(path)
+    assert (attributes.findtext("time/beats"), attributes.findtext("time/beat-type")) == ("3", "8")
+    assert [slurs for _, _, _, _, _, slurs in measures[0]] == [(), (), ()]
+    assert [duration for _, duration, _, _, _, _ in measures[0]] == [4, 4, 4]
+
+
+def test_empty_scores(tmp_path):
+    notation.write_midi([], str(tmp_path / "a.mid"))
+    _, events = read_midi(str(tmp_path / "a.mid"))
+    assert events[-1][0] == 0
+
+    notation.write_musicxml([], str(tmp_path / "a.xml"))
+    _, _, measures = read_musicxml(str(tmp_path / "a.xml"))
+    assert measures == [[]]
@@ -0,0 +1,174 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the .ptrec recording format. """
+
+import numpy as np
+import pytest
+
+import mic
+import mic.sources
+import soundfiles.recording as rec
+
+
+def samples(size, channels=1, dtype=np.float32):
+    x = np.random.RandomState(0).uniform(-1, 1, size*channels)
+    if np.dtype(dtype).kind == "i":
+        x *= 32767
+    return x.astype(dtype)
+
+
+def write(path, x, read_size=735, **kwargs):
+    with rec.RecordingWriter(str(path), **kwargs) as writer:
+        for start in range(0, x.size, read_size):
+            writer.write(x[start:start + read_size])
+    return writer
+
+
+@pytest.mark.parametrize("compression", ["zlib", None])
+@pytest.mark.parametrize("dtype", [np.float32, np.int16])
+def test_round_trip(tmp_path, compression, dtype):
+    x = samples(10000, dtype=dtype)
+    writer = write(tmp_path / "a.ptrec", x, rate=8000, dtype=dtype, tick_size=735, block_size=1000,
+                   compression=compression, start_time=12.5)
+    assert writer.frames == x.size
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert (reader.rate, reader.channels, reader.dtype) == (8000, 1, np.dtype(dtype))
+        assert (reader.start_time, reader.tick_size, reader.block_size) == (12.5, 735, 1000)
+        assert reader.compression == compression
+        assert len(reader) == x.size
+        assert reader.duration == x.size/8000
+        assert np.array_equal(reader[:], x)
+        assert np.array_equal(np.concatenate(list(reader.blocks())), x)
+
+
+def test_slices_across_blocks(tmp_path):
+    x = samples(10000)
+    write(tmp_path / "a.ptrec", x, block_size=1000)
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        for start, stop in ((0, 1), (999, 1001), (2500, 7500), (9999, 10000), (-10, None), (5000, 20000)):
+            assert np.array_equal(reader[start:stop], x[start:stop])
+        assert reader[700:100].size == 0
+
+        with pytest.raises(TypeError):
+            reader[5]
+        with pytest.raises(TypeError):
+            reader[::2]
+
+
+def test_read_in_seconds(tmp_path):
+    x = samples(44100)
+    write(tmp_path / "a.ptrec", x, block_size=4096)
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert np.array_equal(reader.read(0.25, 0.5), x[11025:22050])
+        assert np.array_equal(reader.read(0.75), x[33075:])
+
+
+def test_multiple_channels(tmp_path):
+    x = samples(3000, channels=2)
+    write(tmp_path / "a.ptrec", x, read_size=2*300, channels=2, block_size=1024)
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert reader.frames == 3000
+        assert np.array_equal(reader[1000:2500], x.reshape(-1, 2)[1000:2500])
+        assert all(block.shape[1] == 2 for block in reader.blocks())
+
+
+def test_empty_recording(tmp_path):
+    write(tmp_path / "a.ptrec", np.zeros(0, np.float32))
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert reader.frames == 0
+        assert reader[:].size == 0
+        assert list(reader.blocks()) == []
+
+
+def test_unclosed_recording(tmp_path):
+    """ Without the index, the blocks are found by walking through their headers. """
+    x = samples(5500)
+    writer = rec.RecordingWriter(str(tmp_path / "a.ptrec"), block_size=1000)
+    writer.write(x)
+    writer._file.flush()
+
+    # The last 500 frames are still buffered.
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert reader.frames == 5000
+        assert np.array_equal(reader[:], x[:5000])
+    writer.close()
+
+
+def test_not_a_recording(tmp_path):
+    (tmp_path / "a.wav").write_bytes(b"RIFF" + bytes(100))
+    with pytest.raises(ValueError):
+        rec.RecordingReader(str(tmp_path / "a.wav"))
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError):
+        rec.RecordingWriter(str(tmp_path / "a.ptrec"), compression="lzma")
+
+
+def test_background_writer(tmp_path):
+    x = samples(100000)
+    writer = rec.RecordingWriter(str(tmp_path / "a.ptrec"), block_size=1000, background=True)
+    buffer = np.empty(512, np.float32)
+    for start in range(0, x.size, buffer.size):
+        # The writer must copy the samples, as the buffer is reused right away.
+        chunk = x[start:start + buffer.size]
+        buffer[:chunk.size] = chunk
+        writer.write(buffer[:chunk.size])
+        buffer[:] = np.nan
+    writer.close()
+
+    with rec.RecordingReader(str(tmp_path / "a.ptrec")) as reader:
+        assert np.array_equal(reader[:], x)
+
+
+def test_background_writer_errors(tmp_path):
+    writer = rec.RecordingWriter(str(tmp_path / "a.ptrec"), block_size=100, background=True)
+
+    def fail():
+        raise OSError("No space left on device")
+    writer._flush = fail
+
+    # The error is raised by a later write, and the queue doesn't fill up and block the writes in between.
+    with pytest.raises(OSError):
+        for _ in range(100*rec._QUEUE_SIZE):
+            writer.write(np.zeros(100, np.float32))
+
+    with pytest.raises(OSError):
+        writer.close()
+    assert writer._file.closed
+
+
+def test_mic_listener_debug_recording(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    signal = lambda t: 0.5*np.sin(2*np.pi*440*t)
+    source = mic.sources.SyntheticSource(735, signal=signal, duration=1, realtime=False)
+    listener = mic.MicListener(735, debug_wave=True, source=source)
+    reads = []
+    try:
+        while True:
+            reads.append(listener.listen())
+    except EOFError:
+        pass
+    listener.close()
+
+    with rec.RecordingReader(listener.wave_filename) as reader:
+        assert reader.tick_size == 735
+        assert np.array_equal(reader[:], np.concatenate(reads))
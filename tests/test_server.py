@@ -0,0 +1,177 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the transcription service: WebSocket framing, HTTP parsing and whole sessions on a local port. """
+
+import asyncio
+import struct
+
+import numpy as np
+import pytest
+
+import server
+from benchmarks import loadtest, signals
+
+
+class Writer(object):
+    """ Collects what's written to a stream. """
+
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+
+def read_message(data, max_size=1 << 20, mask=False):
+    """ Reads a WebSocket message from bytes. Returns the opcode, the payload and what was written back. """
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = Writer()
+        opcode, payload = await server.read_websocket_message(reader, writer, max_size, mask)
+        return opcode, payload, writer.data
+
+    return asyncio.run(read())
+
+
+def test_websocket_accept():
+    # Example of RFC 6455, section 1.3.
+    assert server.websocket_accept("dGhlIHNhbXBsZSBub25jZQ==") == "s3pPLMBiTxaQ9kYGzzhZRbK+xOo="
+
+
+def test_frames():
+    # Examples of RFC 6455, section 5.7.
+    assert server.websocket_frame(server.TEXT, b"Hello") == bytes.fromhex("810548656c6c6f")
+    assert read_message(bytes.fromhex("818537fa213d7f9f4d5158")) == (server.TEXT, b"Hello", b"")
+
+    masked = server.websocket_frame(server.BINARY, b"Hello", mask=True)
+    assert masked[:2] == bytes.fromhex("8285") and masked[6:] != b"Hello"
+    assert read_message(masked)[:2] == (server.BINARY, b"Hello")
+
+
+@pytest.mark.parametrize("size, header", [(0, 2), (125, 2), (126, 4), (65535, 4), (65536, 10)])
+def test_frame_sizes(size, header):
+    payload = bytes(range(256))*(size//256) + bytes(range(size % 256))
+    for mask in (False, True):
+        frame = server.websocket_frame(server.BINARY, payload, mask)
+        assert len(frame) == header + 4*mask + size
+        assert read_message(frame) == (server.BINARY, payload, b"")
+
+
+def test_fragments_and_control_frames():
+    """ Fragments are joined, and pings between them are answered. """
+    data = (struct.pack("!BB", server.BINARY, 3) + b"abc" +
+            server.websocket_frame(server.PING, b"ping", mask=True) +
+            struct.pack("!BB", server.CONTINUATION, 2) + b"de" +
+            server.websocket_frame(server.PONG, mask=True) +
+            server.websocket_frame(server.CONTINUATION, b"f", mask=True))
+    assert read_message(data) == (server.BINARY, b"abcdef", server.websocket_frame(server.PONG, b"ping"))
+
+    # Clients mask their pongs.
+    opcode, payload, written = read_message(server.websocket_frame(server.PING, b"x") +
+                                            server.websocket_frame(server.CLOSE), mask=True)
+    assert (opcode, payload) == (server.CLOSE, b"")
+    assert written[:2] == bytes.fromhex("8a81") and len(written) == 7
+
+
+def test_protocol_errors():
+    with pytest.raises(server.ProtocolError) as error:
+        read_message(server.websocket_frame(server.BINARY, bytes(101)), max_size=100)
+    assert error.value.status == server.MESSAGE_TOO_BIG
+
+    # Fragments count towards the limit together.
+    with pytest.raises(server.ProtocolError):
+        read_message(struct.pack("!BB", server.BINARY, 60) + bytes(60) + server.websocket_frame(server.CONTINUATION,
+                                                                                               bytes(60)), 100)
+
+    for data in (server.websocket_frame(server.CONTINUATION, b"a"),
+                 struct.pack("!BB", server.BINARY, 1) + b"a" + server.websocket_frame(server.TEXT, b"b")):
+        with pytest.raises(server.ProtocolError) as error:
+            read_message(data)
+        assert error.value.status == server.PROTOCOL_ERROR
+
+    with pytest.raises(asyncio.IncompleteReadError):
+        read_message(server.websocket_frame(server.BINARY, b"abc")[:-1])
+
+
+def test_http_body():
+    async def read(data, headers):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return [chunk async for chunk in server.read_http_body(reader, headers, 100)]
+
+    chunked = {"transfer-encoding": "chunked"}
+    assert asyncio.run(read(b"3\r\nabc\r\n2;x=y\r\nde\r\n0\r\nTrailer: 1\r\n\r\n", chunked)) == [b"abc", b"de"]
+    assert b"".join(asyncio.run(read(b"abcdef", {"content-length": "6"}))) == b"abcdef"
+    with pytest.raises(server.ProtocolError):
+        asyncio.run(read(b"65\r\n" + bytes(101) + b"\r\n0\r\n\r\n", chunked))
+    with pytest.raises(asyncio.IncompleteReadError):
+        asyncio.run(read(b"abc", {"content-length": "6"}))
+
+
+def test_pcm_decoder():
+    x = np.linspace(-1, 1, 100).astype(np.float32)
+    decoder = server.PCMDecoder("f32")
+    data = x.tobytes()
+    # Chunks splitting samples.
+    decoded = [decoder.decode(data[i:i + 7]) for i in range(0, len(data), 7)]
+    assert np.array_equal(np.concatenate(decoded), x)
+
+    decoder = server.PCMDecoder("s16")
+    samples = decoder.decode(np.array([-32768, 0, 16384], "<i2").tobytes())
+    assert samples.dtype == np.float32 and samples.tolist() == [-1, 0, 0.5]
+
+
+@pytest.mark.parametrize("client", [loadtest.websocket_client, loadtest.http_client])
+def test_session(client):
+    """ Streams a passage and receives its notes. """
+    notes = signals.melody(4, seed=1)
+    x, reference = signals.passage(notes, loadtest.RATE, seed=1)
+
+    async def session():
+        service = await server.TranscriptionServer("127.0.0.1", 0).start()
+        try:
+            result, _ = await client("127.0.0.1", service.port, x, 4096, False)
+        finally:
+            await service.close()
+        return result, service
+
+    result, service = asyncio.run(session())
+    assert result.status == (101 if client is loadtest.websocket_client else 200)
+    assert result.events[0]["type"] == "start" and result.events[-1]["type"] == "end"
+    assert [note["name"] for note in result.notes] == [name for name, _ in notes]
+    assert service.counters["streams"] == 1 and service.counters["bytes"] == x.nbytes
+    assert service.streams == 0
+
+
+def test_rejects_streams_beyond_the_limit():
+    async def session():
+        service = await server.TranscriptionServer("127.0.0.1", 0, max_streams=0).start()
+        try:
+            result, _ = await loadtest.websocket_client("127.0.0.1", service.port, np.zeros(0, np.float32), 1, False)
+            metrics = await loadtest.fetch_metrics("127.0.0.1", service.port)
+        finally:
+            await service.close()
+        return result, metrics
+
+    result, metrics = asyncio.run(session())
+    assert result.status == 503
+    assert "pytranscribe_rejected_total 1" in metrics.splitlines()
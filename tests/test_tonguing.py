@@ -0,0 +1,128 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the tonguing detector's run-length state machine. """
+
+import numpy as np
+import pytest
+
+import tonguing as tong
+
+
+def raw_detector(min_samples):
+    """ Returns a detector whose envelope is its input, unsmoothed, so its states follow the input exactly. """
+    detector = tong.TonguingDetector(min_duration=min_samples/44100, threshold=0.5, smoothing=0)
+    detector.envelope = lambda x: x
+    return detector
+
+
+def reference(x, min_samples):
+    """ Sample by sample state machine, as the detector used to run. Returns the onset and release offsets. """
+    tentative, count, detected = False, 0, False
+    onsets, releases = [], []
+    for t, s in enumerate(x > 0.5):
+        if s == tentative:
+            count += 1
+        else:
+            tentative, count = s, 1
+
+        if count > min_samples and tentative != detected:
+            detected = tentative
+            (onsets if detected else releases).append(t - count + 1)
+
+    return onsets, releases
+
+
+def tone(amplitude, seconds, f=440, fs=44100):
+    return amplitude*np.sin(2*np.pi*f*np.arange(int(seconds*fs))/fs)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_the_sample_by_sample_state_machine(seed):
+    # Runs of random lengths, many shorter than 'min_samples'.
+    random = np.random.RandomState(seed)
+    x = np.repeat(np.arange(200) % 2, random.randint(1, 40, 200)).astype(float)
+
+    onsets, releases = raw_detector(20).detect(x)
+    expected_onsets, expected_releases = reference(x, 20)
+    assert onsets.tolist() == expected_onsets
+    assert releases.tolist() == expected_releases
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 64, 1000])
+def test_chunked_feeding_matches_a_single_feed(chunk):
+    random = np.random.RandomState(0)
+    x = np.repeat(np.arange(100) % 2, random.randint(1, 40, 100)).astype(float)
+    onsets, releases = raw_detector(20).detect(x)
+
+    detector = raw_detector(20)
+    chunked_onsets, chunked_releases = [], []
+    for start in range(0, x.size, chunk):
+        chunk_onsets, chunk_releases = detector.detect(x[start:start + chunk])
+        chunked_onsets.extend(chunk_onsets + start)
+        chunked_releases.extend(chunk_releases + start)
+
+    assert chunked_onsets == onsets.tolist()
+    assert chunked_releases == releases.tolist()
+
+
+def test_short_runs_are_ignored():
+    x = np.concatenate((np.zeros(100), np.ones(10), np.zeros(100)))
+    onsets, releases = raw_detector(20).detect(x)
+    assert onsets.size == 0 and releases.size == 0
+
+
+def test_tongued_notes():
+    fs = 44100
+    x = np.concatenate((np.zeros(fs//10), tone(0.5, 0.2), np.zeros(fs//10), tone(0.5, 0.2), np.zeros(fs//10)))
+    for envelope in ("hilbert", "follower"):
+        onsets, releases = tong.TonguingDetector(envelope=envelope).detect(x)
+
+        # Within a few milliseconds of the edges, delayed by the smoothing.
+        assert np.allclose(onsets, [fs//10, 4*fs//10], atol=0.005*fs)
+        assert np.allclose(releases, [3*fs//10, 6*fs//10], atol=0.005*fs)
+
+
+def test_feed_reports_releases():
+    fs = 44100
+    detector = tong.TonguingDetector()
+    assert not detector.feed(tone(0.5, 0.1))
+    assert detector.feed(np.zeros(fs//10))
+    assert not detector.feed(np.zeros(fs//10))
+
+
+def test_empty_input():
+    detector = raw_detector(20)
+    detector.detect(np.ones(50))
+    onsets, releases = detector.detect(np.zeros(0))
+    assert onsets.size == 0 and releases.size == 0
+
+    # The state is left untouched.
+    onsets, releases = detector.detect(np.zeros(50))
+    assert onsets.tolist() == [] and releases.tolist() == [0]
+
+
+def test_exponential_smoothing_continues_between_calls():
+    x = np.random.RandomState(0).rand(100)
+    whole = tong._exponential_smoothing(x, 0.3, alpha=0.2)
+    first = tong._exponential_smoothing(x[:40], 0.3, alpha=0.2)
+    second = tong._exponential_smoothing(x[40:], first[-1], alpha=0.2)
+    assert np.allclose(np.concatenate((first, second)), whole)
+    assert tong._exponential_smoothing(x, 0.3, alpha=1) is x
+
+
+def test_unknown_envelope():
+    with pytest.raises(ValueError):
+        tong.TonguingDetector(envelope="rms")
@@ -0,0 +1,81 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Tests of the synthetic passages of the accuracy benchmarks, and of transcribing them. """
+
+import numpy as np
+import pytest
+
+import mic.sources
+import transcriber
+from benchmarks import signals
+
+
+RATE = 44100
+BLOCKS_PER_SEC = 60.0
+
+
+@pytest.mark.parametrize("articulation", ["tongued", "slurred"])
+@pytest.mark.parametrize("seed", range(8))
+def test_passage(articulation, seed):
+    notes = signals.melody(20, seed=seed)
+    x, reference = signals.passage(notes, RATE, articulation, seed=seed)
+
+    assert [name for name, _, _ in reference] == [name for name, _ in notes]
+    assert x.dtype == np.float32 and np.all(np.isfinite(x))
+    assert x.size >= reference[-1][2]*RATE
+    for (_, duration), (_, start, end) in zip(notes, reference):
+        assert end - start == pytest.approx(duration, abs=1/RATE)
+
+    # Only breath noise before the first note.
+    assert np.sqrt(np.mean(x[:int(reference[0][1]*RATE)]**2)) == pytest.approx(0.002, rel=0.2)
+
+
+def test_melody():
+    notes = signals.melody(200, low="C4", high="C6", seed=0)
+    names = [name for name, _ in notes]
+    assert all(a != b for a, b in zip(names, names[1:]))
+    assert {name[-1] for name in names} <= {"4", "5", "6"}
+    assert {duration for _, duration in notes} <= {0.15, 0.2, 0.3, 0.45}
+
+
+def test_breath_noise():
+    noise = signals.breath_noise(RATE, RATE, level=0.01)
+    assert noise.size == RATE
+    assert np.sqrt(np.mean(noise**2)) == pytest.approx(0.01)
+
+
+@pytest.mark.parametrize("articulation", ["tongued", "slurred"])
+def test_transcribes_a_passage(articulation):
+    x, reference = signals.passage(signals.melody(8, seed=2), RATE, articulation, seed=2)
+    read = int(RATE/BLOCKS_PER_SEC)
+    padded = np.concatenate((x, np.zeros(read, np.float32)))
+    source = mic.sources.SyntheticSource(read, RATE, signal=lambda t: padded[np.round(t*RATE).astype(int)],
+                                         duration=x.size/RATE, realtime=False)
+
+    trs = transcriber.Transcriber(BLOCKS_PER_SEC, 2*read, source=source, **transcriber.QUIET)
+    try:
+        while True:
+            trs.update()
+    except EOFError:
+        pass
+    trs.finish()
+
+    # Every note is transcribed at its pitch, starting on time.
+    detected = [(n["name"], n["start"]/BLOCKS_PER_SEC, n["end"]/BLOCKS_PER_SEC) for n in trs.notes]
+    for name, start, end in reference:
+        middle = (start + end)/2
+        assert any(d_name == name and d_start <= middle < d_end for d_name, d_start, d_end in detected)
+        assert min(abs(d_start - start) for d_name, d_start, _ in detected if d_name == name) < 0.05
@@ -17,37 +17,76 @@
 
 import numpy as _np
 
-from scipy.signal import hilbert as _hilbert
+# scipy.signal is imported by the functions that use it, as it takes over a second to import.
 
 
 def _envelope(x):
     """Calculates the signal's _envelope through its analytic representation's absolute value."""
-    return _np.abs(_hilbert(x))
+    from scipy.signal import hilbert
+    return _np.abs(hilbert(x))
 
 
-def _exponential_smoothing(x, x_s0=0, alpha=0.1):
-    """Performs exponential smoothing of a given series."""
-    x_s = _np.multiply(x, alpha)
-    x_s[0] += (1 - alpha)*x_s0
-    # Slow. Bad. Ugly.
-    for t in range(1, x_s.size):
-        x_s[t] += (1 - alpha)*x_s[t-1]
+class _EnvelopeFollower(object):
+    """Streaming envelope through full wave rectification and a low-pass filter that carries its state between calls.
+    Unlike _envelope, it costs a few operations per sample and has no artifacts at the borders of each input."""
+
+    def __init__(self, fs=44100, cutoff=100, order=2):
+        from scipy.signal import butter
+        self.b, self.a = butter(order, 2*cutoff/fs)
+
+        # The mean of a rectified sinusoid is 2/pi of its amplitude, which is what the Hilbert envelope yields.
+        # (For gaussian noise both envelopes also average to sqrt(pi/2) of its RMS, so thresholds remain comparable.)
+        self.b *= _np.pi/2
+
+        # Filter state kept between calls.
+        self.zi = _np.zeros(max(self.a.size, self.b.size) - 1)
+
+    def __call__(self, x):
+        from scipy.signal import lfilter
+        e, self.zi = lfilter(self.b, self.a, _np.abs(x), zi=self.zi)
+        return e
+
 
+def _exponential_smoothing(x, x_s0=0, alpha=0.1):
+    """Performs exponential smoothing of a given series, continuing from the previous smoothed value 'x_s0'.
+    Computed as the first order IIR filter 'x_s[t] = alpha*x[t] + (1 - alpha)*x_s[t-1]'."""
+    if alpha == 1:
+        # No smoothing at all.
+        return x
+
+    from scipy.signal import lfilter
+    x_s, _ = lfilter([alpha], [1, alpha - 1], x, zi=[(1 - alpha)*x_s0])
     return x_s
 
 
+def _runs(s):
+    """Splits a boolean array into runs of equal values. Returns the value, start index and length of each run."""
+    starts = _np.concatenate(([0], _np.flatnonzero(s[1:] != s[:-1]) + 1))
+    lengths = _np.diff(_np.append(starts, s.size))
+    return s[starts], starts, lengths
+
+
 class TonguingDetector(object):
-    def __init__(self, min_duration=0.01, threshold=0.107, fs=44100, step=5):
-        # Slice the input arrays by this step.
-        # I know, I know... Last minute optimizations...
-        self.step = step
+    def __init__(self, min_duration=0.01, threshold=0.107, fs=44100, smoothing=0.0011, envelope="hilbert"):
+        # Envelope extraction method:
+        #   "hilbert" computes the analytic signal of each input independently (one FFT pair per feed);
+        #   "follower" rectifies and low-passes the input, carrying the filter state between feeds.
+        if envelope == "hilbert":
+            self.envelope = _envelope
+        elif envelope == "follower":
+            self.envelope = _EnvelopeFollower(fs)
+        else:
+            raise ValueError("Unknown envelope method: %s" % envelope)
 
         # Minimum amount of consecutive samples to consider a state (noisy or silent) detected.
-        self.min_samples = min_duration*fs/step
+        self.min_samples = min_duration*fs
 
         # Minimum amplitude level to consider a sample noisy.
         self.threshold = threshold
 
+        # Exponential smoothing factor of the envelope, so that it has a time constant of 'smoothing' seconds.
+        self.alpha = 1 - _np.exp(-1/(smoothing*fs)) if smoothing > 0 else 1.0
+
         # State implied by the last analyzed sample alone.
         self.current_tentative_state = False
         # Number of samples that consecutively implied this state.
@@ -60,29 +99,42 @@ class TonguingDetector(object):
         self.x_s0 = 0
 
     def feed(self, x):
-        """Feeds x into the detector."""
-        # Reduce input array.
-        x = x[::self.step]
-
-        # We return True if we detected a tonguing during 'x'
-        # i.e. a transition True -> False on 'self.last_detected_state'
-        e = _envelope(x)
-        e_s = _exponential_smoothing(e, self.x_s0)
+        """Feeds x into the detector. Returns True if a tonguing (i.e. a transition from noisy to silent) was detected."""
+        onsets, releases = self.detect(x)
+        return releases.size > 0
+
+    def detect(self, x, frame=None):
+        """Feeds x into the detector and returns the sample offsets (relative to the beginning of 'x') where the detected
+        state changed to noisy (onsets) and to silent (releases). A state is only detected after it lasts 'min_samples',
+        so offsets are negative when the change began during a previous feed.
+        'frame' is the pda.frame.AnalysisFrame of x, if there is one, so its Hilbert envelope can be reused."""
+        if x.size == 0:
+            return _np.zeros(0, _np.intp), _np.zeros(0, _np.intp)
+
+        if frame is not None and self.envelope is _envelope:
+            e = frame.envelope
+        else:
+            e = self.envelope(x)
+        e_s = _exponential_smoothing(e, self.x_s0, self.alpha)
         self.x_s0 = e_s[-1]
 
-        tongued = False
-        for s in e_s:
-            s_state = s > self.threshold
-            if s_state == self.current_tentative_state:
-                self.current_tentative_samples += 1
-            else:
-                self.current_tentative_state = s_state
-                self.current_tentative_samples = 1
+        # Instead of following the state sample by sample, split the input into runs of samples implying the same state.
+        states, starts, lengths = _runs(e_s > self.threshold)
+
+        # The first run continues the tentative state of the previous feed.
+        if states[0] == self.current_tentative_state:
+            lengths[0] += self.current_tentative_samples
+            starts[0] -= self.current_tentative_samples
 
-            if self.current_tentative_samples > self.min_samples:
-                if self.last_detected_state and not self.current_tentative_state:
-                    tongued = True
+        # Runs longer than 'min_samples' are detected states, every other run is just noise.
+        detected = lengths > self.min_samples
+        states = _np.concatenate(([self.last_detected_state], states[detected]))
+        changed = states[1:] != states[:-1]
+        offsets = starts[detected][changed]
+        changed_to = states[1:][changed]
 
-                self.last_detected_state = self.current_tentative_state
+        self.last_detected_state = bool(states[-1])
+        self.current_tentative_state = bool(e_s[-1] > self.threshold)
+        self.current_tentative_samples = int(lengths[-1])
 
-        return tongued
+        return offsets[changed_to], offsets[~changed_to]
@@ -19,7 +19,6 @@
     Submodules used by the transcriber (PDAs, clustering algorithms, etc) are isolated and ready to be reused. """
 
 # Debugging parameters
-DEBUG_PERF  = False
 DEBUG_NOISE = False
 DEBUG_NOTE = True
 DEBUG_TICK = False
@@ -29,33 +28,53 @@ DEBUG_WAVE = True
 # Output parameters
 OUT_FILENAME = 'out.txt'
 MIDI_FILENAME = 'out.midi'
+XML_FILENAME = 'out.xml'
 WRITE_OUT = True
 WRITE_MIDI = True
 WRITE_XML = True
+# Export through music21 instead of soundfiles.notation (much slower on long sessions, and music21 must be installed).
+EXPORT_MUSIC21 = False
 
-print("### Importing")
+# Latency snapshots (JSON lines, see perf.StageTimer) are appended to this file every PERF_INTERVAL seconds.
+PERF_FILENAME = 'perf.jsonl'
+PERF_INTERVAL = 10.0
+WRITE_PERF = False
 
-# Windows dependent - used *only* to finalize on keyboard interaction.
-# If you want to use this on another platform you're smart enough to figure out what to do.
-from msvcrt import kbhit
-from msvcrt import getch
+# Spans of every stage of the latest ticks (see perf.tracing) are written to this file in the Chrome trace event format.
+TRACE_FILENAME = 'trace.json'
+WRITE_TRACE = False
+
+# Transcriber options turning every debugging output and output file off (e.g. for transcribers embedded in a service,
+# which would print over each other and write to the same files). The options left out default to the flags above.
+QUIET = {"debug_note": False, "debug_tick": False, "debug_tong": False, "debug_wave": False,
+         "write_out": False, "write_perf": False, "write_trace": False}
+
+# Only the command line tool reports its progress (library users, e.g. the service, import it silently).
+if __name__ == "__main__":
+    print("### Importing")
 
 # Python
-import math
 import os
-import time
+import sys
+import threading
 
 # External
-import music21
+# Heavy dependencies only used by some stages (e.g. music21 to export the transcription) are imported by those stages,
+# so the transcription starts as soon as possible.
 import numpy as np
-import scipy.stats
 
 # Internal
+# Likewise, internal modules only used by some stages (decimation, key estimation, the notation writers) are imported
+# by those stages.
 import clustering as clst
 import mathhelper as mh
 import mic
 import mtheory as mt
+import noise
+import pda.frame
 import pda.hps
+import perf
+import perf.tracing
 import soundfiles as sf
 import tonguing as tong
 
@@ -63,147 +82,309 @@ class Transcriber(object):
     """ Class to retrieve samples from the default microphone.
     Includes utilities such as noise level detection. """
 
-    def __init__(self, blocks_per_sec, samples_per_block, noise_detection_duration):
+    def __init__(self, blocks_per_sec, samples_per_block, noise_detection_duration=3.0, a4=440.0, temperament="equal",
+                 source=None, note_range=None, harmonics=3, multiresolution=False, tracer=None, debug_wave=None,
+                 debug_note=None, debug_tick=None, debug_tong=None, write_out=None, write_perf=None, write_trace=None):
         """ Initializes a microphone listener object.
             NOTE: guidelines for defining the initializer parameters:
-                'samples_per_block == int(44100/blocks_per_sec)' -> no sample overlapping between blocks, every sample received is used.
-                'samples_per_block > int(44100/blocks_per_sec)'  -> sample overlapping between blocks, every sample received is used, some are used multiple times.
-                'samples_per_block < int(44100/blocks_per_sec)'  -> no sample overlapping, some samples are discarded (will raise).
-            We generally want 'samples_per_block' to be an integer multiple of '44100/samples_per_read', so that every sample is used the same amount of times. """
-
-        if samples_per_block < int(44100/blocks_per_sec):
-            raise ValueError("samples_per_block must be >= int(44100/blocks_per_sec)")
+                'samples_per_block == int(rate/blocks_per_sec)' -> no sample overlapping between blocks, every sample received is used.
+                'samples_per_block > int(rate/blocks_per_sec)'  -> sample overlapping between blocks, every sample received is used, some are used multiple times.
+                'samples_per_block < int(rate/blocks_per_sec)'  -> no sample overlapping, some samples are discarded (will raise).
+            We generally want 'samples_per_block' to be an integer multiple of 'rate/samples_per_read', so that every sample is used the same amount of times.
+            'rate' is the input rate, i.e. the rate of the source (44100 Hz for the default input device).
+            'a4' and 'temperament' select the tuning detected pitches are snapped to (see mtheory.tuning).
+            'source' is the mic.sources.AudioSource to transcribe, defaulting to the default input device. It must read
+            'int(rate/blocks_per_sec)' samples at a time.
+            'note_range' is the (lowest, highest) pitch expected in Hz, e.g. (mt.lowest_flute_note, mt.highest_flute_note).
+            If given, samples are decimated right after being captured, down to the lowest rate that still holds the
+            'harmonics' the PDA uses for the highest pitch (see pda.hps.minimum_rate), so every later stage (block
+            buffer, tonguing detector, PDA) processes fewer samples. 'samples_per_block' is given at the input rate.
+            If 'multiresolution' is set, pitches are first detected on a quarter of the block, and longer windows are
+            only analyzed for pitches a short window can't resolve (i.e. low or unclear ones).
+            'tracer' is a perf.tracing.Tracer recording the stages of every tick, tagged with the tick and the detected
+            note. If it's None and 'write_trace' is set, one is created (also recording garbage collections).
+            'debug_wave' sets whether the captured samples are recorded (see mic.MicListener). It and the other
+            debugging and output options ('debug_note', 'debug_tick', 'debug_tong', 'write_out', 'write_perf' and
+            'write_trace') default to the module flags of the same name (see QUIET to turn them all off). """
+        self.debug_note = DEBUG_NOTE if debug_note is None else debug_note
+        self.debug_tick = DEBUG_TICK if debug_tick is None else debug_tick
+        self.debug_tong = DEBUG_TONG if debug_tong is None else debug_tong
+        self.write_out = WRITE_OUT if write_out is None else write_out
+        self.write_perf = WRITE_PERF if write_perf is None else write_perf
+        self.write_trace = WRITE_TRACE if write_trace is None else write_trace
 
         # Channels read by the mic.
         self.channels = 1
 
-        # Input rate.
-        self.rate = 44100
+        # Input rate, i.e. the rate samples are captured at.
+        self.input_rate = 44100 if source is None else source.rate
+
+        if samples_per_block < int(self.input_rate/blocks_per_sec):
+            raise ValueError("samples_per_block must be >= int(rate/blocks_per_sec)")
+
+        # Harmonics summed by the PDA, and the lowest frequency it detects.
+        self.harmonics = harmonics
+        self.lowest_f = 255 if note_range is None else note_range[0]/mt.semitone
+
+        # Factor the input is decimated by, and the resulting rate every stage after capturing works at.
+        self.decimation = 1
+        if note_range is not None:
+            import mic.decimation as decimation
+            self.decimation = decimation.decimation_factor(self.input_rate,
+                                                          pda.hps.minimum_rate(note_range[1], harmonics))
+        self.rate = self.input_rate if self.decimation == 1 else self.input_rate/self.decimation
 
         # Blocks processed per second. A block is a set of samples that will be processed by PDAs.
         self.blocks_per_sec = blocks_per_sec
 
         # Amount of samples in each block.
-        self.samples_per_block = samples_per_block
+        self.samples_per_block = int(samples_per_block/self.decimation)
 
         # A buffer read is the retrieval of set of samples from the mic.
         # Keep in mind the amount of samples per read is not necessarily the same as the amount of samples in an
         # input block processed by the PDA, since there might be sample overlapping on the PDA but never on the mic.
         # The amount of overlapping is determined implicitly by the variables given in this initializer.
-        self.samples_per_read = int(self.rate/blocks_per_sec)
+        # If the read size isn't a multiple of the decimation factor, reads decimate to this amount of samples or one
+        # less (the decimator carries the remainder over).
+        self.input_samples_per_read = int(self.input_rate/blocks_per_sec)
+        self.samples_per_read = -(-self.input_samples_per_read//self.decimation)
+        if source is not None and source.samples_per_read != self.input_samples_per_read:
+            raise ValueError("The source must read %d samples at a time (%g ticks per second at %g Hz), not %d" %
+                             (self.input_samples_per_read, blocks_per_sec, self.input_rate, source.samples_per_read))
+
+        # Span tracer, or None if not tracing.
+        if tracer is None and self.write_trace:
+            tracer = perf.tracing.Tracer(gc=True)
+        self.tracer = tracer
 
         # Mic Listener.
-        self.mic = mic.MicListener(self.samples_per_read, self.channels, self.rate, debug_wave=DEBUG_WAVE, print=True)
-
-        # Reads necessary to detect noise levels.
-        self.noise_detection_reads = noise_detection_duration*self.rate/self.samples_per_read
-
-        self.block = np.zeros(samples_per_block)
-        self.tong = None
+        self.mic = mic.MicListener(self.input_samples_per_read, self.channels, self.input_rate,
+                                   debug_wave=DEBUG_WAVE if debug_wave is None else debug_wave, print=True,
+                                   source=source, tracer=tracer)
+
+        # Decimates the captured samples (if decimating), and the buffer they are captured into.
+        # The decimation delays the samples by 'delay' ticks.
+        self.decimator = None
+        self.delay = 0
+        if self.decimation > 1:
+            import mic.decimation as decimation
+            self.decimator = decimation.Decimator(self.decimation)
+            self.input = np.zeros(self.input_samples_per_read, np.float32)
+            self.delay = self.decimator.delay/self.input_samples_per_read
+
+        # Reads necessary to detect noise levels with a blocking calibration (see detect_noise()).
+        self.noise_detection_reads = noise_detection_duration*self.input_rate/self.input_samples_per_read
+
+        # Online noise level estimate. It's updated on every tick, so no calibration is needed before transcribing.
+        self.noise = noise.NoiseFloorTracker(blocks_per_sec)
+
+        # Window sizes analyzed by the multi-resolution PDA, if enabled.
+        self.window_sizes = None
+        if multiresolution:
+            self.window_sizes = (self.samples_per_block//4, self.samples_per_block//2, self.samples_per_block)
+
+        # Drops silent and unpitched ticks, as early (i.e. as cheaply) as possible.
+        self.gate = noise.GatingCascade(lf=self.lowest_f, harmonics=harmonics, precision=2, sizes=self.window_sizes)
+
+        # Note table used to tune detected pitches.
+        self.tuning = mt.tuning(a4, temperament)
+
+        # Samples are captured straight into this preallocated buffer, which holds the latest block plus room for
+        # 'buffered_reads' more reads. The block is a view of the 'samples_per_block' samples preceding the write
+        # position, so assembling it copies nothing; only when the buffer is full the latest block is moved back to
+        # its beginning (once every 'buffered_reads' ticks).
+        buffered_reads = 64
+        self.buffer = np.zeros(self.samples_per_block + buffered_reads*self.samples_per_read, np.float32)
+        self.buffer_position = self.samples_per_block
+        self.block = self.buffer[0:self.samples_per_block]
+        self.tong = tong.TonguingDetector(fs=self.rate, envelope="follower")
         self.noise_threshold = None
 
+        # Whether the previous tick was pitched, in which case its RMS isn't noise.
+        self.voiced = False
+
         self.total_ticks = 0
 
         self.notes = []
+        # Key of the notes detected so far, estimated at any moment by self.key.estimate().
+        import mtheory.keys as keys
+        self.key = keys.KeyEstimator()
         self.current_note = "NOVALUE"
         self.previous_note = "NOVALUE"
         self.current_ticks = 0
         self.currently_slurring = False
 
-        if DEBUG_PERF:
-            self.hps_time = -1
-            self.read_time = -1
+        # Position (in ticks, possibly fractional) where the current note started, if known.
+        # Tick 'n' spans the positions [n - 1, n), so a position is 'ticks before + samples into the tick/samples_per_read'.
+        self.current_start = None
 
-        if WRITE_OUT:
-            self.out = ""
+        # Latency of each stage of update(), which must take less than a tick on average to keep up with the input.
+        self.perf = perf.StageTimer(("read", "block", "rms", "tonguing", "pda", "tuning", "segmentation"),
+                                    budget=1/blocks_per_sec, path=PERF_FILENAME if self.write_perf else None,
+                                    interval=PERF_INTERVAL, tracer=tracer)
+
+        # Lines of the processed output file.
+        if self.write_out:
+            self.out = []
 
         return
 
     def close(self):
         """ Closes resources used by this instance. """
         self.mic.close()
+        if self.tracer is not None:
+            self.tracer.close()
+        return
+
+    def _append_note(self, slur, end=None):
+        """ Appends the current note to the detected notes, ending at the tick position 'end'.
+            Unknown boundaries are estimated from the amount of ticks counted for the note. """
+        start = self.current_start
+        if start is None or (end is not None and end - start <= 0):
+            start = (end if end is not None else self.total_ticks - self.delay) - self.current_ticks
+        if end is None:
+            end = start + self.current_ticks
+
+        ticks = end - start
+        self.notes.append({"name":      self.current_note,
+                           "duration":  np.log2(ticks),
+                           "ticks":     ticks,
+                           "start":     start,
+                           "end":       end,
+                           "slur":      slur})
+        self.key.add(self.current_note, ticks)
+
+        if self.debug_note:
+            print("%s\t %.2f\t %.3fs"%(self.current_note, ticks, ticks/self.blocks_per_sec))
         return
 
     def detect_noise(self):
-        """ Detects safe noise levels, then initializes instance resources that require knowledge of that. """
+        """ Detects safe noise levels by listening for 'noise_detection_duration' seconds, then seeds the online
+            noise estimate with them. Optional, as the estimate adapts by itself. """
         self.noise_threshold = self.mic.detect_noise(self.noise_detection_reads)
-        self.tong = tong.TonguingDetector(threshold=1.25*self.noise_threshold)
+        self.noise.seed(self.noise_threshold)
+        self.tong.threshold = 1.25*self.noise_threshold
         return self.noise_threshold
 
     def update(self):
         """ Performs a transcription iteration update, i.e. wait for microphone data to be available,
             then update the transcriber state (detect pitch, note duration, etc). """
-        if not self.tong:
-            raise AssertionError("Please initialize the tonguing detector first. (missing a call to detect_noise()?)")
+        frame = self.begin_tick()
+        self.end_tick(frame, self.detect_pitch(frame))
+        return
 
+    def begin_tick(self):
+        """ First part of update(): waits for microphone data, then tracks the noise level and the tonguing.
+            Returns the pda.frame.AnalysisFrame of the new block. """
+        self.perf.start()
         self.total_ticks += 1
-        new_samples = self.mic.listen()
-
-        if DEBUG_PERF:
-            rms_start_time = time.time()
-
-        rms = np.sqrt(np.mean(np.square(new_samples)))
-
-        if DEBUG_PERF:
-            self.rms_time = time.time() - rms_start_time
-            tong_start_time = time.time()
+        if self.tracer is not None:
+            self.tracer.tags = {"tick": self.total_ticks}
+
+        if self.buffer_position + self.samples_per_read > self.buffer.size:
+            # Keep the latest block (minus the samples about to be read, when reads all have the same size).
+            kept = self.samples_per_block - (self.samples_per_read if self.decimator is None else 0)
+            self.buffer[0:kept] = self.buffer[self.buffer_position - kept:self.buffer_position]
+            self.buffer_position = kept
+
+        if self.decimator is None:
+            new_samples = self.buffer[self.buffer_position:self.buffer_position + self.samples_per_read]
+            self.mic.listen_into(new_samples)
+        else:
+            self.mic.listen_into(self.input)
+            new_samples = self.buffer[self.buffer_position:
+                                      self.buffer_position + self.decimator.output_size(self.input.size)]
+            self.decimator(self.input, new_samples)
+        self.buffer_position += new_samples.size
+        self.perf.lap("read")
+
+        # The new samples are already in the buffer, so the block is the chronologically ordered view ending on them.
+        self.block = self.buffer[self.buffer_position - self.samples_per_block:self.buffer_position]
+
+        # Every stage reads the features it needs from the frame, so each of them is computed only once.
+        frame = pda.frame.AnalysisFrame(new_samples, self.block, self.rate)
+        self.perf.lap("block")
+
+        rms = frame.rms
+
+        # Keep track of the noise level, which also defines the level the tonguing detector considers silent.
+        # Sounds usually last longer than a tick, so pitched ticks are told apart by whether the previous one was.
+        self.noise_threshold = self.noise.update(rms, self.voiced)
+        self.tong.threshold = 1.25*self.noise_threshold
+        self.perf.lap("rms")
 
         # Feed the new samples to the Tonguing Detector.
         # Beware we shouldn't send repeated samples, so we send the new_samples and not the entire block.
-        tongued = self.tong.feed(new_samples)
+        onsets, releases = self.tong.detect(new_samples, frame)
 
-        if DEBUG_PERF:
-            self.tong_time = time.time() - tong_start_time
+        # Position of the beginning of this tick; the detector offsets are relative to it.
+        tick_start = self.total_ticks - 1 - self.delay
 
-        if tongued:
+        if releases.size:
             if self.current_ticks > 2:
-                # We detected tonguing, so split the current note.
+                # We detected tonguing, so split the current note where its sound stopped.
                 # TODO: if 'previous_note' is considered noisy, account for it in the duration.
-                # TODO: Consider whether we should increment the current tick partially (proportionally to the audible portion?).
-                self.notes.append({"name":      self.current_note, 
-                                   "duration":  np.log2(self.current_ticks),
-                                   "ticks":     self.current_ticks,
-                                   "slur":      "stop" if self.currently_slurring else False})
+                self._append_note("stop" if self.currently_slurring else False,
+                                  end=tick_start + releases[0]/new_samples.size)
 
                 self.currently_slurring = False
-                if DEBUG_NOTE:
-                    print("%s\t %d\t %.3fs"%(self.current_note, self.current_ticks, self.current_ticks/self.blocks_per_sec))
-                if DEBUG_TONG:
+                if self.debug_tong:
                     print("TONG")
-                if WRITE_OUT:
-                    self.out += "%d\t: TONG\n" % self.total_ticks
+                if self.write_out:
+                    self.out.append("%d\t: TONG\n" % self.total_ticks)
 
             self.current_ticks = 0
+            self.current_start = None
 
-        # Add the new_samples at the beginning of the block, so they replace the oldest values.
-        self.block[0:self.samples_per_read] = new_samples
-
-        # Now roll the block back so that it is in chronological order.
-        # Not strictly necessary as we're discarding phase, but it makes replacing old values easier and also ensures
-        # usual windowing will smooth discontinuities at the borders.
-        self.block = np.roll(self.block, -self.samples_per_read)
+        if onsets.size and (not releases.size or onsets[-1] > releases[-1]):
+            # A new sound started, so the next note starts there.
+            self.current_start = tick_start + onsets[-1]/new_samples.size
 
-        # No need to proceed if we're to discard the pitch due to insufficient RMS power in the block.
-        if not DEBUG_NOISE and rms < self.noise_threshold:
-            self.out += "%d\t: 'rms < self.noise_threshold'\n" % self.total_ticks
-            return;
+        self.perf.lap("tonguing")
+        return frame
 
+    def detect_pitch(self, frame):
+        """ Second part of update(): returns the pitch of the frame, or None if it's silent or unpitched. """
         # We want pitch, so pass the block to the PDA
-        if DEBUG_PERF:
-            hps_start_time = time.time()
-
-        perceived_f = pda.hps.hps(self.block, fs=self.rate, harmonics=3, precision=2)
-
-        if DEBUG_PERF:
-            self.hps_time = time.time() - hps_start_time
-
-        # and tune the pitch down to a known note.
-        tuned_f = mh.find_nearest_value(mt.notes, perceived_f)
-        note = mt.note_name[tuned_f]
+        # No need to proceed if the gating cascade considers the tick silent or unpitched.
+        if DEBUG_NOISE and self.window_sizes is not None:
+            perceived_f = frame.multiresolution_hps(self.lowest_f, self.harmonics, 2, self.window_sizes)[0]
+        elif DEBUG_NOISE:
+            perceived_f = frame.hps(self.lowest_f, self.harmonics, precision=2)
+        else:
+            perceived_f = self.gate.pitch(frame, self.noise_threshold)
+
+        self.perf.lap("pda")
+        return perceived_f
+
+    def end_tick(self, frame, perceived_f):
+        """ Last part of update(): tunes the pitch detected for the frame (None if it was gated) and updates the note
+            segmentation. """
+        if not DEBUG_NOISE:
+            self.voiced = perceived_f is not None
+
+        if perceived_f is None:
+            if self.tracer is not None:
+                self.tracer.tags["gated"] = self.gate.dropped_by
+            if self.write_out:
+                self.out.append("%d\t: gated (%s)\n" % (self.total_ticks, self.gate.dropped_by))
+            self.perf.stop()
+            return
+
+        # Position of the beginning of this tick.
+        tick_start = self.total_ticks - 1 - self.delay
+
+        # Tune the pitch down to a known note.
+        note_idx = self.tuning.nearest(perceived_f)
+        tuned_f = self.tuning.frequency[note_idx]
+        note = self.tuning.names[note_idx]
 
         # TODO: rough error percentage estimate
         error = perceived_f - tuned_f
         percentage = np.sign(error) * 2 * error/(tuned_f*(1 + mt.semitone) if error > 0 else tuned_f*(1 - mt.semitone))
+        self.perf.lap("tuning")
+        if self.tracer is not None:
+            self.tracer.tags["note"] = note
 
         if note == self.current_note:
             if self.current_note == self.previous_note:
@@ -213,18 +394,19 @@ class Transcriber(object):
                 # Our 'previous_note' measurement was probably noisy.
                 # Pretend it was a measurement of 'current_note', and account ticks for both.
                 self.current_ticks += 2
+
+            if self.current_start is None:
+                self.current_start = tick_start + 1 - self.current_ticks
         elif note == self.previous_note:
             # Keep in mind that all notes are 'tentative' until their tick count is > n, so:
             #   - C5 C5 C5 D5 D5 means we successfully identified a C5 and the beginning of a D5, assuming n is 1.
             if self.current_ticks > 2:
-                self.notes.append({"name":      self.current_note,
-                                   "duration":  np.log2(self.current_ticks),
-                                   "ticks":     self.current_ticks,
-                                   "slur":      "continue" if self.currently_slurring else "start"})
-
+                self._append_note("continue" if self.currently_slurring else "start", end=tick_start - 1)
                 self.currently_slurring = True
-                if DEBUG_NOTE:
-                    print("%s\t %d\t %.3fs"%(self.current_note, self.current_ticks, self.current_ticks/self.blocks_per_sec))
+
+            # The new note started on the previous tick, unless a sound onset was detected after its beginning.
+            if self.current_start is None or self.current_start < tick_start - 1:
+                self.current_start = tick_start - 1
 
             self.current_note = note
             self.current_ticks = 2
@@ -233,150 +415,181 @@ class Transcriber(object):
             # we can assume the old note has ended.
             #   - C5 C5 C5 D5 E5 means we identified a C5 end, but we don't know the next note yet.
             if self.current_ticks > 2:
-                self.notes.append({"name":      self.current_note,
-                                   "duration":  np.log2(self.current_ticks),
-                                   "ticks":     self.current_ticks,
-                                   "slur":      "continue" if self.currently_slurring else False})
-
-                if DEBUG_NOTE:
-                    print("%s\t %d\t %.3fs"%(self.current_note, self.current_ticks, self.current_ticks/self.blocks_per_sec))
+                self._append_note("continue" if self.currently_slurring else False, end=tick_start - 1)
 
             # We currently have no idea of the note being played, so assign an error string to it.
             # When we have k identical detections in a row (with k defined in the elifs above) we will successfully
             # assign the current note.
             self.current_note = "NOISE_ERR"
             self.current_ticks = 0
+            self.current_start = None
 
         self.previous_note = note
 
-        if DEBUG_TICK:
-            print("%s\t (%.3f)\t@ %.2f" % (note, percentage, rms))
-        if WRITE_OUT:
-            self.out += "%d\t: %s\t (%.3f)\t@ %.2f\r\n" % (self.total_ticks, note, percentage, rms)
+        if self.debug_tick:
+            print("%s\t (%.3f)\t@ %.2f" % (note, percentage, frame.rms))
+        if self.write_out:
+            self.out.append("%d\t: %s\t (%.3f)\t@ %.2f\r\n" % (self.total_ticks, note, percentage, frame.rms))
+
+        self.perf.lap("segmentation")
+        self.perf.stop()
         return
 
-    def finalize(self):
-        """ Finalizes the transcriber. Will close resources, perform calculations and normalizations based on the whole
-            transcription (e.g.: normalize note duration) then writes the transcription to the desired outputs. """
+    def finish(self):
+        """ Closes resources and appends the note being played (if any) to the detected notes, which are final then. """
         self.close()
 
         # Extract the last note.
         if self.current_ticks > 2:
-            self.notes.append({"name":      self.current_note,
-                               "duration":  np.log2(self.current_ticks),
-                               "ticks":     self.current_ticks,
-                               "slur":      "stop" if self.currently_slurring else False})
+            self._append_note("stop" if self.currently_slurring else False)
+            self.current_ticks = 0
 
-            if DEBUG_NOTE:
-                print("%s\t %d\t %.3fs"%(self.current_note, self.current_ticks, self.current_ticks/self.blocks_per_sec))
+        return
+
+    def finalize(self):
+        """ Finalizes the transcriber. Will close resources, perform calculations and normalizations based on the whole
+            transcription (e.g.: normalize note duration) then writes the transcription to the desired outputs. """
+        self.finish()
+
+        print("\n\n###### Latency (ms):")
+        print(self.perf.report())
+        if self.write_perf:
+            self.perf.export()
+        if self.write_trace and self.tracer is not None:
+            print("### Writing %s" % TRACE_FILENAME)
+            self.tracer.dump(TRACE_FILENAME)
+
+        print("\n\n###### Gated ticks:")
+        print(self.gate.counters)
+        if self.window_sizes is not None:
+            print(self.gate.window_counters)
 
         print("\n\n###### Detected notes:")
         for note in self.notes:
             print(note)
 
-        durations = np.array([n["duration"] for n in self.notes])
-        clusters = clst.equidistant_clusterize(durations)
-        corrected_notes = [{"name":     n["name"],
-                            "duration": 2**mh.find_nearest_value(clusters, n["duration"]),
-                            "slur":     n["slur"]} 
-                           for n in self.notes]
+        # Without notes (i.e. if it was stopped before any note was played), the outputs are written empty.
+        corrected_notes = []
+        tempo = 120
+        if self.notes:
+            durations = np.array([n["duration"] for n in self.notes])
+            clusters = clst.equidistant_clusterize(durations)
+            corrected_notes = [{"name":     n["name"],
+                                "duration": 2**mh.find_nearest_value(clusters, n["duration"]),
+                                "slur":     n["slur"]}
+                               for n in self.notes]
+
+            # Most common duration (the smallest one, if there are several).
+            durations, counts = np.unique([n["duration"] for n in corrected_notes], return_counts=True)
+            most_common = durations[np.argmax(counts)]
+            tempo = int(round(60*self.blocks_per_sec/most_common, 0))
+
+            while tempo < 80:
+                tempo *= 2
+                most_common /= 2
+
+            while tempo > 220:
+                tempo /= 2
+                most_common *= 2
+
+            for note in corrected_notes:
+                note["quarters"] = note["duration"]/most_common
 
         print("\n\n###### Corrected notes:")
         for note in corrected_notes:
             print(note)
 
-        most_common = scipy.stats.mode([n["duration"] for n in corrected_notes])[0][0]
-        tempo = int(round(60*self.blocks_per_sec/most_common, 0))
+        key = self.key.estimate()
+        print("\n\n###### Key:")
+        print(key)
 
-        while tempo < 80:
-            tempo *= 2
-            most_common /= 2
+        if EXPORT_MUSIC21 and (WRITE_MIDI or WRITE_XML):
+            self._export_music21(corrected_notes, tempo, key)
+        else:
+            import soundfiles.notation as notation
+            signature = None if key is None else (key["fifths"], key["mode"])
+            if WRITE_MIDI:
+                print("### Writing %s" % MIDI_FILENAME)
+                notation.write_midi(corrected_notes, MIDI_FILENAME, tempo, key=signature)
+            if WRITE_XML:
+                print("### Writing %s" % XML_FILENAME)
+                notation.write_musicxml(corrected_notes, XML_FILENAME, tempo, key=signature)
 
-        while tempo > 220:
-            tempo /= 2
-            most_common *= 2
+        if self.write_out:
+            print("### Writing processed output file")
+            f = open(OUT_FILENAME, 'w')
+            f.writelines(self.out)
+            f.flush()
+            os.fsync(f)
 
-        if WRITE_MIDI or WRITE_XML:
-            s = music21.stream.Stream()
-            s.append(music21.tempo.MetronomeMark(number=tempo))
-            s.append(music21.meter.TimeSignature('4/4'))
-            for note in corrected_notes:
-                n = music21.note.Note()
-                n.pitch.name = note["name"]
-                n.duration.quarterLength = note["duration"]/most_common
-                s.append(n)
-                note["music21"] = n
-
-            slurring = False
-            slur = music21.spanner.Slur()
-            for note in corrected_notes:
-                if note["slur"] == "start":
-                    slurring = True
-                if slurring:
-                    slur.addSpannedElements([note["music21"]])
-                if note["slur"] == "stop":
-                    slurring = False
-                    s.insert(0, slur)
-                    slur = music21.spanner.Slur()
+        return
 
+    def _export_music21(self, corrected_notes, tempo, key):
+        """ Writes the corrected notes through a music21 stream. """
+        import music21
+
+        s = music21.stream.Stream()
+        s.append(music21.tempo.MetronomeMark(number=tempo))
+        s.append(music21.meter.TimeSignature('4/4'))
+        for note in corrected_notes:
+            n = music21.note.Note()
+            n.pitch.name = note["name"]
+            n.duration.quarterLength = note["quarters"]
+            s.append(n)
+            note["music21"] = n
+
+        slurring = False
+        slur = music21.spanner.Slur()
+        for note in corrected_notes:
+            if note["slur"] == "start":
+                slurring = True
             if slurring:
+                slur.addSpannedElements([note["music21"]])
+            if note["slur"] == "stop":
+                slurring = False
                 s.insert(0, slur)
+                slur = music21.spanner.Slur()
 
-            s.insert(0, s.analyze('key'))
+        if slurring:
+            s.insert(0, slur)
 
-            if WRITE_MIDI:
-                sf.write_m21stream_to_midi(s, MIDI_FILENAME)
-            if WRITE_XML:
-                s.show('musicxml')
+        if key is not None:
+            s.insert(0, music21.key.Key(key["tonic"], key["mode"]))
 
-        if WRITE_OUT:
-            print("### Writing processed output file")
-            f = open(OUT_FILENAME, 'w')
-            f.write(self.out)
-            f.flush()
-            os.fsync(f)
+        if WRITE_MIDI:
+            sf.write_m21stream_to_midi(s, MIDI_FILENAME)
+        if WRITE_XML:
+            sf.write_m21stream_to_xml(s, XML_FILENAME)
 
         return
 
 
+def wait_for_enter(stop):
+    """ Sets the 'stop' event when a line is entered in the console. Runs on its own thread, as reading blocks.
+        Doesn't set it if there's no console input (e.g. it was redirected from an empty file). """
+    if sys.stdin is not None and sys.stdin.readline():
+        stop.set()
+    return
+
+
 if __name__ == "__main__":
     print("### Initializing Transcriber")
     trs = Transcriber(blocks_per_sec = 60.0,
-                      samples_per_block = 1470,
-                      noise_detection_duration = 3.0)
+                      samples_per_block = 1470)
 
-    print("### Detecting noise threshold")
-    noise_threshold = trs.detect_noise()
+    # Transcribe until Enter (or Ctrl+C) is pressed, or the audio source ends.
+    stop = threading.Event()
+    stop_thread = threading.Thread(target=wait_for_enter, args=(stop,), name="wait_for_enter")
+    stop_thread.daemon = True
+    stop_thread.start()
 
-    print("Noise RMS detected at %.4f" % noise_threshold)
+    for i in range(3):
+        print("### TRANSCRIBING (press Enter to stop)")
 
-    if DEBUG_PERF:
-        cycle = 0
-        out_buffer = ""
+    try:
+        while not stop.is_set():
+            trs.update()
+    except (KeyboardInterrupt, EOFError):
+        pass
 
-    for i in range(3):
-        print("### TRANSCRIBING")
-
-    while(True):
-        if DEBUG_PERF:
-            start_time = time.time()
-
-        trs.update()
-
-        if DEBUG_PERF:
-            out_buffer += "Read:  %.4f" % trs.read_time + "\n"
-            out_buffer += "RMS:   %.4f" % trs.rms_time + "\n"
-            out_buffer += "Tong   %.4f" % trs.tong_time + "\n"
-            out_buffer += "HPS:   %.4f" % trs.hps_time + "\n"
-            out_buffer += "Total: %.4f" % (time.time() - start_time) + "\n"
-            out_buffer += "-------------\n"
-
-            cycle += 1
-            if cycle % INPUT_BLOCKS_PER_SEC == 0:
-                print(out_buffer)
-                out_buffer = ""
-
-        if kbhit():
-            trs.finalize()
-            getch()
-            break
+    trs.finalize()
@@ -0,0 +1,362 @@
+# Copyright 2015 Rodrigo Roim Ferreira
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, see <http://www.gnu.org/licenses/>.
+
+""" Multi-process deployment: streams are analyzed by a pool of worker processes, so the stream capacity grows with
+    the amount of cores instead of being bound by a single interpreter.
+    Samples reach the workers through shared memory ring buffers (see SharedRing), written by any process (e.g. a
+    capture process per device, see capture()), so sample arrays are never pickled. Each worker transcribes its
+    streams with a multistream.MultiStreamTranscriber, and sends the detected notes back through an event queue.
+    Usage:
+        pool = WorkerPool()
+        stream, ring = pool.open_stream()
+        multiprocessing.Process(target=capture, args=(ring.name, mic.sources.PyAudioSource, 735)).start()
+        for event in pool.events():
+            ...
+        pool.close() """
+
+import itertools as _itertools
+import multiprocessing as _multiprocessing
+import os as _os
+import queue as _queue
+import time as _time
+from multiprocessing import resource_tracker as _resource_tracker
+from multiprocessing import shared_memory as _shared_memory
+
+import numpy as _np
+
+import mic.sources as _sources
+import multistream as _multistream
+
+
+class SharedRing(object):
+    """ Single producer, single consumer ring buffer of float32 samples in shared memory, so the producer and the
+        consumer can be different processes. Created with a 'capacity' (in samples), or attached to by the 'name' of
+        an existing ring. Processes attaching to a ring should be started by its creator (e.g. through
+        multiprocessing), after its creation.
+        Unlike mic.sources.RingBuffer, samples that don't fit are dropped (and counted as overruns) by the producer,
+        so each counter is only ever written by one side. """
+
+    # Header slots: samples written, samples read, samples dropped, and whether the producer closed the ring.
+    _WRITTEN, _READ, _OVERRUNS, _CLOSED = range(4)
+    _HEADER_SIZE = 4*8
+
+    def __init__(self, capacity=None, name=None):
+        if name is None:
+            self._shm = _shared_memory.SharedMemory(create=True, size=self._HEADER_SIZE + 4*capacity)
+        else:
+            self._shm = self._attach(name)
+
+        self.name = self._shm.name
+        self._header = _np.ndarray(4, _np.int64, self._shm.buf)
+        self._data = _np.ndarray((self._shm.size - self._HEADER_SIZE)//4, _np.float32, self._shm.buf,
+                                 self._HEADER_SIZE)
+        if name is None:
+            self._header[:] = 0
+        return
+
+    @staticmethod
+    def _attach(name):
+        """ Attaches to an existing shared memory block, leaving it owned by its creator. """
+        try:
+            return _shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching also registers the block with the resource tracker, which destroys it when
+            # its processes exit. That's harmless as long as the creator's tracker is shared (see WorkerPool).
+            return _shared_memory.SharedMemory(name=name)
+
+    @property
+    def capacity(self):
+        """ Amount of samples the ring holds. """
+        return self._data.size
+
+    @property
+    def available(self):
+        """ Amount of samples that can be read. """
+        return int(self._header[self._WRITTEN] - self._header[self._READ])
+
+    @property
+    def closed(self):
+        """ Whether the producer won't write anymore. """
+        return bool(self._header[self._CLOSED])
+
+    @property
+    def overruns(self):
+        """ Samples dropped because the consumer fell behind. """
+        return int(self._header[self._OVERRUNS])
+
+    def write(self, samples):
+        """ Writes samples into the ring, dropping the ones there's no room for. """
+        samples = _np.ravel(samples)
+        room = self.capacity - self.available
+        if samples.size > room:
+            self._header[self._OVERRUNS] += samples.size - room
+            samples = samples[:room]
+
+        written = self._header[self._WRITTEN]
+        start = written % self._data.size
+        first = min(samples.size, self._data.size - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:samples.size - first] = samples[first:]
+
+        # Publish the samples only once they're copied.
+        self._header[self._WRITTEN] = written + samples.size
+        return
+
+    def read_into(self, out):
+        """ Fills 'out' with the oldest samples available. Returns False if there aren't enough of them. """
+        if self.available < out.size:
+            return False
+
+        read = self._header[self._READ]
+        start = read % self._data.size
+        first = min(out.size, self._data.size - start)
+        out[:first] = self._data[start:start + first]
+        out[first:] = self._data[:out.size - first]
+        self._header[self._READ] = read + out.size
+        return True
+
+    def close(self):
+        """ Signals that the producer won't write anymore. """
+        self._header[self._CLOSED] = 1
+        return
+
+    def release(self):
+        """ Detaches this process from the ring, which is destroyed by unlink(). """
+        del self._header, self._data
+        self._shm.close()
+        return
+
+    def unlink(self):
+        """ Destroys the ring once every process released it (only the creator should call it). """
+        self._shm.unlink()
+        return
+
+
+class SharedRingSource(_sources.AudioSource):
+    """ Audio source reading from a SharedRing. Reads never wait: they raise IOError if a whole read wasn't written
+        yet (see 'ready'), and EOFError once the ring is closed and the remaining samples don't fill a read. """
+
+    def __init__(self, ring, samples_per_read, channels=1, rate=44100):
+        _sources.AudioSource.__init__(self, samples_per_read, channels, rate)
+        self.ring = ring
+        return
+
+    @property
+    def overruns(self):
+        return self.ring.overruns
+
+    @property
+    def ready(self):
+        """ Whether a read won't fail for lack of samples, i.e. there's a whole read available or the ring ended. """
+        return self.ring.available >= self.samples_per_read*self.channels or self.ring.closed
+
+    def readinto(self, out):
+        if not self.ring.read_into(out):
+            if self.ring.closed:
+                raise EOFError("Audio source ended")
+            raise IOError("Audio samples not available yet")
+        return
+
+    def close(self):
+        self.ring.release()
+        return
+
+
+def capture(name, make_source, *args):
+    """ Capture process loop: writes the reads of the mic.sources.AudioSource created by 'make_source(*args)' (in
+        this process, as sources generally can't be sent to other processes) into the SharedRing called 'name' until
+        the source ends, then closes the ring. Reads that fail (e.g. input overflows) are written as silence, as
+        mic.MicListener does, so the stream keeps its timing. """
+    ring = SharedRing(name=name)
+    source = make_source(*args)
+    out = _np.empty(source.samples_per_read*source.channels, _np.float32)
+    try:
+        while True:
+            try:
+                source.readinto(out)
+            except EOFError:
+                break
+            except IOError as e:
+                print("\tError recording: %s" % e)
+                out[:] = 0
+            ring.write(out)
+    finally:
+        source.close()
+        ring.close()
+        ring.release()
+
+    return
+
+
+def _plain(note):
+    """ Note dict with plain Python values, which are cheaper to send than numpy scalars. """
+    return dict((key, value.item() if isinstance(value, _np.generic) else value) for key, value in note.items())
+
+
+def _work(commands, events, blocks_per_sec, samples_per_block, poll, kwargs):
+    """ Worker process loop: transcribes the streams added by ("add", stream, ring name) commands, until a ("stop",)
+        command. Sends ("note", stream, note) events as notes are detected, and ("end", stream, gate counters) once a
+        stream's ring is closed and drained. """
+    engine = _multistream.MultiStreamTranscriber((), blocks_per_sec, samples_per_block, **kwargs)
+    samples_per_read = int(44100/blocks_per_sec)
+
+    # Stream id of each transcriber, and how many of its notes were sent.
+    streams = {}
+    sent = {}
+
+    while True:
+        ready = [trs for trs in engine.streams if trs.mic.source.ready]
+
+        # Without samples to analyze, waiting for commands is also the polling delay.
+        try:
+            command = commands.get_nowait() if ready else commands.get(timeout=poll)
+        except _queue.Empty:
+            command = None
+
+        if command is not None:
+            if command[0] == "stop":
+                break
+
+            _, stream, name = command
+            trs = engine.add(SharedRingSource(SharedRing(name=name), samples_per_read))
+            streams[trs] = stream
+            sent[trs] = 0
+
+        if not ready:
+            continue
+
+        finished = set(engine.update(ready))
+        for trs in ready:
+            for note in trs.notes[sent[trs]:]:
+                events.put(("note", streams[trs], _plain(note)))
+            sent[trs] = len(trs.notes)
+
+            if trs in finished:
+                events.put(("end", streams[trs], trs.gate.counters))
+                del streams[trs], sent[trs]
+
+    engine.close()
+    return
+
+
+class WorkerPool(object):
+    """ Pool of 'workers' processes (by default, one per core) transcribing streams with the same settings (keyword
+        arguments are given to multistream.MultiStreamTranscriber, e.g. transcriber.Transcriber options).
+        Each stream is analyzed by the worker with the fewest streams, and its samples are written into a SharedRing
+        holding 'ring_reads' reads, which is destroyed once the stream ended (see events()). Idle workers check for
+        new samples every 'poll' seconds. While waiting for events, the workers are checked to be alive every
+        'liveness' seconds. """
+
+    def __init__(self, workers=None, blocks_per_sec=60.0, samples_per_block=1470, ring_reads=64, poll=0.002,
+                 liveness=1.0, **kwargs):
+        self.samples_per_read = int(44100/blocks_per_sec)
+        self.ring_reads = ring_reads
+        self.liveness = liveness
+
+        # Workers attach to rings created later on, so they must share this process' resource tracker: otherwise
+        # they start their own, which destroys the rings they attached to once they exit.
+        if _os.name == "posix":
+            _resource_tracker.ensure_running()
+
+        self._events = _multiprocessing.Queue()
+        self._commands = []
+        self._processes = []
+        for i in range(workers or _os.cpu_count() or 1):
+            commands = _multiprocessing.Queue()
+            process = _multiprocessing.Process(target=_work, name="transcription worker %d" % i,
+                                               args=(commands, self._events, blocks_per_sec, samples_per_block, poll,
+                                                     kwargs))
+            process.daemon = True
+            process.start()
+            self._commands.append(commands)
+            self._processes.append(process)
+
+        # Stream ids, ring and worker of each stream not ended yet, streams per worker and the streams not ended yet.
+        self._ids = _itertools.count()
+        self._rings = {}
+        self._workers = {}
+        self._load = [0]*len(self._processes)
+        self.open = set()
+        return
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open_stream(self):
+        """ Starts transcribing a new stream. Returns its id and its SharedRing, whose producer writes the stream
+            samples (directly, or from another process attached to the ring by its name, see capture()) and closes it
+            once the stream ends. """
+        stream = next(self._ids)
+        ring = SharedRing(self.ring_reads*self.samples_per_read)
+        self._rings[stream] = ring
+
+        worker = self._load.index(min(self._load))
+        self._load[worker] += 1
+        self._workers[stream] = worker
+        self.open.add(stream)
+        self._commands[worker].put(("add", stream, ring.name))
+        return stream, ring
+
+    def events(self, timeout=None):
+        """ Yields the events sent by the workers until every open stream ended, or for up to 'timeout' seconds
+            without events:
+                ("note", stream, note):      a note was detected (a dict like transcriber.Transcriber.notes);
+                ("end", stream, counters):   the stream ended (the counters are its noise.GatingCascade counters).
+            The ring of a stream is destroyed when its end is yielded, so it mustn't be used anymore.
+            Raises RuntimeError if a worker with open streams exited, as their events would never come. """
+        last = _time.monotonic()
+        while self.open:
+            idle = _time.monotonic() - last
+            if timeout is not None and idle >= timeout:
+                return
+
+            try:
+                event = self._events.get(timeout=self.liveness if timeout is None else
+                                         min(self.liveness, timeout - idle))
+            except _queue.Empty:
+                for worker, process in enumerate(self._processes):
+                    if self._load[worker] and not process.is_alive():
+                        raise RuntimeError("%s exited (with code %s) while transcribing %d streams" %
+                                           (process.name, process.exitcode, self._load[worker]))
+                continue
+
+            if event[0] == "end":
+                # The worker released the ring before ending the stream.
+                ring = self._rings.pop(event[1])
+                ring.release()
+                ring.unlink()
+
+                self.open.discard(event[1])
+                self._load[self._workers.pop(event[1])] -= 1
+            yield event
+            last = _time.monotonic()
+
+        return
+
+    def close(self):
+        """ Stops the workers and destroys the rings. """
+        for commands in self._commands:
+            commands.put(("stop",))
+        for process in self._processes:
+            process.join()
+
+        for ring in self._rings.values():
+            ring.release()
+            ring.unlink()
+        self._rings = {}
+        return